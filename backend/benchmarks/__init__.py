@@ -0,0 +1,7 @@
+"""
+Benchmark scripts package
+Standalone performance benchmarks, run from the backend directory with
+`python -m benchmarks.<name>`
+"""
+
+__all__ = []
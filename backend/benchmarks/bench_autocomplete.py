@@ -0,0 +1,54 @@
+"""
+Autocomplete benchmark
+Measures typo-tolerant suggestion latency of the autocomplete index on a
+synthetic catalog, for exact prefixes and misspellings, plus the cost of an
+incremental update.
+
+Usage:
+    python -m benchmarks.bench_autocomplete --products 2000
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.bench_tool_encoding import CATEGORIES, make_product
+from services.autocomplete import AutocompleteIndex
+
+QUERIES = ["so", "sofa", "sofaa", "chiar", "nrod sof", "oslo sofa 1", "bergen tabel"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the autocomplete index")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    products = [make_product(rng, i) for i in range(args.products)]
+    categories = [{"_id": f"category-{c.lower()}", "name": c, "slug": c.lower()} for c in CATEGORIES]
+
+    index = AutocompleteIndex()
+    started = time.perf_counter()
+    index.update(products=products, categories=categories)
+    print(f"{len(index)} names indexed in {(time.perf_counter() - started) * 1000:.1f} ms\n")
+
+    print(f"{'query':<16} {'top suggestion':<24} {'edits':>5} {'µs':>8}")
+    for query in QUERIES:
+        suggestions = index.suggest(query)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            index.suggest(query)
+        elapsed_us = (time.perf_counter() - started) / args.repeat * 1e6
+        top = suggestions[0] if suggestions else None
+        print(f"{query:<16} {(top.name if top else '-'):<24} {(top.distance if top else 0):>5} {elapsed_us:>8.1f}")
+
+    changed = [dict(p, name=f"Renamed {p['name']}") for p in products[:10]]
+    started = time.perf_counter()
+    index.update(products=changed, removed=[p["_id"] for p in products[10:20]])
+    print(f"\nIncremental update (10 changed, 10 removed): {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Database operations benchmark
+Measures per-call latency of session, message and selection operations:
+- inline: SQL text per call, pool acquire per call, dict(row) results (the
+  previous operations.py)
+- registry: statements prepared in the pool init hook, __slots__ records
+- registry + conn: the same on one connection passed by the caller
+
+Needs DATABASE_URL with the schema migrated; it creates one session with
+messages and selections and deletes it afterwards. With --offline only the
+row conversion cost (dict vs __slots__ record) is measured, without a database.
+
+Usage:
+    python -m benchmarks.bench_db_operations --repeat 500
+    python -m benchmarks.bench_db_operations --offline
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict
+
+from database.queries import MessageRecord
+
+LEGACY_SQL: Dict[str, str] = {
+    "session_get": """
+        SELECT session_id, created_at, updated_at, user_agent, current_page, metadata
+        FROM chat_sessions
+        WHERE session_id = $1
+    """,
+    "message_history": """
+        SELECT message_id, session_id, role, content, created_at,
+               token_usage, page_context, metadata
+        FROM chat_messages
+        WHERE session_id = $1
+        ORDER BY created_at ASC
+        LIMIT $2 OFFSET $3
+    """,
+    "message_insert": """
+        INSERT INTO chat_messages
+        (session_id, role, content, token_usage, page_context, metadata,
+         prompt_tokens, completion_tokens, cached_tokens, model_latency_ms, model)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+        RETURNING message_id
+    """,
+    "selection_list": """
+        SELECT selection_id, session_id, selected_text, page_url, created_at, metadata
+        FROM user_text_selections
+        WHERE session_id = $1
+        ORDER BY created_at DESC
+        LIMIT $2
+    """,
+}
+
+
+async def timed(fn: Callable[[], Awaitable], repeat: int) -> float:
+    for _ in range(min(20, repeat)):
+        await fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def offline(repeat: int):
+    """Row conversion only: dict(zip) per row vs a __slots__ record."""
+    names = MessageRecord.__slots__
+    row = (uuid.uuid4(), uuid.uuid4(), "assistant", "x" * 400, datetime.now(timezone.utc), 120, "/products", "{}")
+    rows = [row] * 50
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        [dict(zip(names, r)) for r in rows]
+    dict_us = (time.perf_counter() - started) / repeat * 1e6
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        [MessageRecord(*r) for r in rows]
+    record_us = (time.perf_counter() - started) / repeat * 1e6
+
+    print(f"50-row history conversion: dict {dict_us:.1f} µs, __slots__ record {record_us:.1f} µs")
+
+
+async def online(repeat: int):
+    import asyncpg
+    from database import (
+        close_database_pool,
+        create_chat_session,
+        fetch_chat_history,
+        fetch_chat_session,
+        fetch_session_selections,
+        get_database_pool,
+        insert_chat_message,
+        insert_text_selection,
+    )
+
+    database_url = os.environ["DATABASE_URL"]
+    legacy_pool = await asyncpg.create_pool(database_url, min_size=2, max_size=2)
+    pool = await get_database_pool()
+
+    session_id = await create_chat_session(user_agent="bench", current_page="/bench")
+    session_uuid = uuid.UUID(session_id)
+    for i in range(50):
+        await insert_chat_message(session_id, "user" if i % 2 == 0 else "assistant", f"message {i} " * 20)
+    for i in range(10):
+        await insert_text_selection(session_id, f"selection {i}", "/bench")
+
+    async def legacy(name: str, *args, method: str = "fetch"):
+        async with legacy_pool.acquire() as conn:
+            result = await getattr(conn, method)(LEGACY_SQL[name], *args)
+            if method == "fetch":
+                return [dict(r) for r in result]
+            if method == "fetchrow":
+                return dict(result) if result else None
+            return result
+
+    async def legacy_insert():
+        async with legacy_pool.acquire() as conn:
+            await conn.fetchval(LEGACY_SQL["message_insert"], session_uuid, "user", "hello", 0, None,
+                                json.dumps({}), 0, 0, 0, None, None)
+            await conn.execute("UPDATE chat_sessions SET updated_at = NOW() WHERE session_id = $1", session_uuid)
+
+    try:
+        async with pool.acquire() as shared:
+            cases = [
+                ("session get",
+                 lambda: legacy("session_get", session_uuid, method="fetchrow"),
+                 lambda: fetch_chat_session(session_id),
+                 lambda: fetch_chat_session(session_id, conn=shared)),
+                ("message history (50)",
+                 lambda: legacy("message_history", session_uuid, 50, 0),
+                 lambda: fetch_chat_history(session_id, 50),
+                 lambda: fetch_chat_history(session_id, 50, conn=shared)),
+                ("selection list (10)",
+                 lambda: legacy("selection_list", session_uuid, 10),
+                 lambda: fetch_session_selections(session_id, 10),
+                 lambda: fetch_session_selections(session_id, 10, conn=shared)),
+                ("message insert",
+                 legacy_insert,
+                 lambda: insert_chat_message(session_id, "user", "hello"),
+                 None),
+            ]
+
+            print(f"{'operation':<22} {'inline µs':>10} {'registry µs':>12} {'+conn µs':>9}")
+            for label, old, new, new_conn in cases:
+                old_us = await timed(old, repeat)
+                new_us = await timed(new, repeat)
+                conn_us = f"{await timed(new_conn, repeat):>9.1f}" if new_conn else f"{'-':>9}"
+                print(f"{label:<22} {old_us:>10.1f} {new_us:>12.1f} {conn_us}")
+    finally:
+        async with legacy_pool.acquire() as conn:
+            await conn.execute("DELETE FROM chat_sessions WHERE session_id = $1", session_uuid)
+        await legacy_pool.close()
+        await close_database_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database operation overhead")
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--offline", action="store_true", help="Only measure row conversion, no database")
+    args = parser.parse_args()
+
+    offline(args.repeat * 20)
+    if args.offline:
+        return
+    if not os.getenv("DATABASE_URL"):
+        print("DATABASE_URL is not set; run with --offline or set it to benchmark queries")
+        return
+    asyncio.run(online(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+JSON codec benchmark
+Measures serialization time per request for the JSON paths that used to go
+through the standard library, before and after the codec layer
+(utils/json_codec.py):
+- jsonb bind: json.dumps to a string bound as text, vs the pool's binary
+  jsonb encoder
+- jsonb read: a raw string parsed by the caller, vs the binary decoder
+- MCP /history: tool json.dumps(indent=2), json.loads in the handler and
+  json.dumps again by aiohttp, vs one encode of the dicts
+- /api/session/{id}: stdlib JSONResponse, ORJSONResponse and Pydantic's
+  model_dump_json (what FastAPI uses for response models when it can)
+- /api/chat/stream: one json.dumps per SSE chunk, vs the codec
+
+No database or network is needed.
+
+Usage:
+    python -m benchmarks.bench_json_codec --messages 50 --repeat 2000
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from database.codecs import _decode_jsonb, _encode_jsonb
+from database.queries import encode_message_cursor
+from models.chat_models import ChatHistoryResponse, Message
+from main import ORJSONResponse
+from utils.json_codec import ORJSON_AVAILABLE, dumps
+
+WORDS = (
+    "a deep three seat sofa in olive velvet with solid oak legs would suit "
+    "your living room and there is a matching armchair in stock"
+).split()
+
+
+def make_history(count: int) -> List[Dict[str, Any]]:
+    """Message dicts, as DatabaseMCPServer.get_chat_history returns them."""
+    start = datetime(2026, 1, 5, 12, tzinfo=timezone.utc)
+    messages = []
+    for i in range(count):
+        message_id = uuid.uuid4()
+        created_at = start + timedelta(seconds=7 * i)
+        messages.append({
+            "message_id": str(message_id),
+            "session_id": "5b0e3c52-6f0b-4a5e-9d3c-1f0f6d1b2a7e",
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join(WORDS[j % len(WORDS)] for j in range(i % 7 * 12 + 8)),
+            "created_at": created_at.isoformat(),
+            "token_usage": 40 + i,
+            "page_context": "/products/oslo-sofa",
+            "cursor": encode_message_cursor(created_at, message_id)
+        })
+    return messages
+
+
+METADATA = {
+    "summary": " ".join(WORDS * 4),
+    "summarized_count": 24,
+    "model": "gemini-2.5-flash",
+    "tags": ["sofa", "living-room", "velvet"],
+    "cart": [{"product_id": f"product-{i}", "quantity": i % 3 + 1} for i in range(5)]
+}
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> float:
+    """Mean microseconds per call."""
+    for _ in range(min(repeat, 100)):
+        fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(messages: int, repeat: int, chunks: int):
+    history = make_history(messages)
+    stored = json.dumps(METADATA)
+    binary = _encode_jsonb(METADATA)
+    response = ChatHistoryResponse(
+        session_id="5b0e3c52-6f0b-4a5e-9d3c-1f0f6d1b2a7e",
+        messages=[Message(**m) for m in history],
+        next_cursor=history[-1]["cursor"],
+        prev_cursor=history[0]["cursor"],
+        success=True
+    )
+    pieces = [" ".join(WORDS[i % 5:i % 5 + 4]) + " " for i in range(chunks)]
+
+    def stdlib_tool_round_trip():
+        result = json.dumps(history, indent=2)
+        json.dumps(json.loads(result))
+
+    rows = [
+        ("jsonb bind (metadata)",
+         measure(lambda: json.dumps(METADATA), repeat),
+         measure(lambda: _encode_jsonb(METADATA), repeat)),
+        ("jsonb read (metadata)",
+         measure(lambda: json.loads(stored), repeat),
+         measure(lambda: _decode_jsonb(binary), repeat)),
+        (f"MCP /history ({messages} msgs)",
+         measure(stdlib_tool_round_trip, repeat),
+         measure(lambda: dumps(history), repeat)),
+        (f"session response ({messages} msgs)",
+         measure(lambda: JSONResponse(jsonable_encoder(response)), repeat),
+         measure(lambda: ORJSONResponse(jsonable_encoder(response)), repeat)),
+        (f"SSE stream ({chunks} chunks)",
+         measure(lambda: [json.dumps({"content": p}) for p in pieces], repeat),
+         measure(lambda: [dumps({"content": p}) for p in pieces], repeat)),
+    ]
+    pydantic_us = measure(lambda: response.model_dump_json().encode(), repeat)
+
+    print(f"orjson available: {ORJSON_AVAILABLE}")
+    print(f"{'path':<30} {'stdlib µs':>10} {'codec µs':>9} {'saved µs':>9}")
+    for label, old_us, new_us in rows:
+        print(f"{label:<30} {old_us:>10.1f} {new_us:>9.1f} {old_us - new_us:>9.1f}")
+    print(f"{'session response, Pydantic':<30} {'':>10} {pydantic_us:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON serialization per request")
+    parser.add_argument("--messages", type=int, default=50, help="Messages per history page")
+    parser.add_argument("--chunks", type=int, default=100, help="SSE chunks per streamed answer")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.messages, args.repeat, args.chunks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Sanity client benchmark
+Compares per-query GROQ latency of a new httpx client per query (the previous
+SanityMCPServer._fetch behaviour) against the pooled keep-alive client, and
+against the pooled client behind the GROQ result cache (hot repeated queries).
+
+Runs against a local stand-in Sanity server, so no network or credentials are
+needed. The stand-in speaks plain HTTP, so the measured gap covers client
+construction (including its SSL context) and TCP setup; against
+api.sanity.io the per-query TLS handshake and DNS lookup add to it.
+
+Usage:
+    python -m benchmarks.bench_sanity_client --queries 200 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+from aiohttp import web
+
+from services.sanity_mcp import SanityMCPServer, SANITY_API_VERSION, SANITY_DATASET
+
+QUERY = '*[_type == "product" && featured == true] | order(_createdAt desc) [0...$limit] { _id, name, price }'
+
+
+def make_products(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "_id": f"product-{i}",
+            "name": f"Product {i}",
+            "slug": f"product-{i}",
+            "price": 100 + i,
+            "shortDescription": "A comfortable modern piece crafted from solid oak " * 2,
+            "stockStatus": "in-stock",
+            "featured": i % 3 == 0,
+        }
+        for i in range(count)
+    ]
+
+
+async def start_stand_in(port: int, latency_ms: float, products: int) -> web.AppRunner:
+    """Start a local server answering GROQ queries like the Sanity API."""
+    result = make_products(products)
+
+    async def handle_query(request: web.Request) -> web.Response:
+        await request.json()
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        response = web.json_response({"ms": latency_ms, "query": QUERY, "result": result})
+        response.enable_compression()
+        return response
+
+    app = web.Application()
+    app.router.add_post(f"/v{SANITY_API_VERSION}/data/query/{{dataset}}", handle_query)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def fetch_new_client(base_url: str) -> Any:
+    """The previous _fetch: a fresh client (and connection) for every query."""
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{base_url}/data/query/{SANITY_DATASET}",
+            json={"query": QUERY, "params": {"limit": 6}},
+            timeout=30.0
+        )
+        return response.json().get("result", [])
+
+
+async def run(label: str, fetch, queries: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await fetch()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(queries)))
+    wall = time.perf_counter() - wall
+
+    latencies.sort()
+    stats = {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "qps": queries / wall,
+    }
+    print(
+        f"{label:<22} mean {stats['mean_ms']:7.2f} ms   p50 {stats['p50_ms']:7.2f} ms   "
+        f"p95 {stats['p95_ms']:7.2f} ms   {stats['qps']:8.1f} q/s"
+    )
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark Sanity GROQ client pooling")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated server latency")
+    parser.add_argument("--products", type=int, default=20, help="Products per response")
+    parser.add_argument("--port", type=int, default=8787)
+    args = parser.parse_args()
+
+    runner = await start_stand_in(args.port, args.latency_ms, args.products)
+    base_url = f"http://127.0.0.1:{args.port}/v{SANITY_API_VERSION}"
+    server = SanityMCPServer(base_url=base_url)
+
+    try:
+        print(f"{args.queries} queries, concurrency {args.concurrency}, server latency {args.latency_ms} ms\n")
+
+        # Warm up both paths
+        await fetch_new_client(base_url)
+        await server._query(QUERY, {"limit": 6})
+
+        before = await run("new client per query", lambda: fetch_new_client(base_url),
+                           args.queries, args.concurrency)
+        after = await run("pooled client", lambda: server._query(QUERY, {"limit": 6}),
+                          args.queries, args.concurrency)
+        cached = await run("pooled + result cache", lambda: server._fetch(QUERY, {"limit": 6}),
+                           args.queries, args.concurrency)
+
+        print(f"\nMean per-query latency saved: {before['mean_ms'] - after['mean_ms']:.2f} ms "
+              f"({(1 - after['mean_ms'] / before['mean_ms']) * 100:.0f}%)")
+        print(f"Hot query latency with result cache: {cached['mean_ms']:.3f} ms "
+              f"(cache: {server.cache.stats()})")
+    finally:
+        await server.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
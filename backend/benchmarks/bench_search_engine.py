@@ -0,0 +1,85 @@
+"""
+Faceted search benchmark
+Measures filtered product search on the catalog replica's bitset indexes
+against a linear scan over the same documents, on a synthetic catalog.
+
+Usage:
+    python -m benchmarks.bench_search_engine --products 2000
+"""
+
+import argparse
+import random
+import time
+from typing import Any, Dict, List
+
+from benchmarks.bench_tool_encoding import make_product
+from services.search_engine import FacetedSearchIndex
+
+QUERIES: List[Dict[str, Any]] = [
+    {"category": "Sofas", "max_price": 1000, "materials": ["leather"], "in_stock_only": True},
+    {"min_price": 500, "max_price": 1500, "colors": ["Olive", "Sand"]},
+    {"query": "oslo sofa", "featured_only": True},
+    {"category": "Tables", "materials": ["oak", "walnut"]},
+]
+
+
+def linear_scan(docs: List[Dict[str, Any]], filters: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    """Reference filter: one pass over every document."""
+    results = []
+    terms = (filters.get("query") or "").lower().split()
+    for doc in docs:
+        if "category" in filters and doc["category"]["name"] != filters["category"]:
+            continue
+        if "min_price" in filters and doc["price"] < filters["min_price"]:
+            continue
+        if "max_price" in filters and doc["price"] > filters["max_price"]:
+            continue
+        if "materials" in filters and not set(filters["materials"]) & set(doc["materials"]):
+            continue
+        if "colors" in filters and not set(filters["colors"]) & {c["name"] for c in doc["colors"]}:
+            continue
+        if filters.get("in_stock_only") and doc["stockStatus"] != "in-stock":
+            continue
+        if filters.get("featured_only") and not doc["featured"]:
+            continue
+        if terms and not all(t in doc["name"].lower() for t in terms):
+            continue
+        results.append(doc)
+        if len(results) >= limit:
+            break
+    return results
+
+
+def timed(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the faceted product search engine")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    docs = [make_product(rng, i) for i in range(args.products)]
+
+    started = time.perf_counter()
+    index = FacetedSearchIndex(docs)
+    print(f"{args.products} products, index built in {(time.perf_counter() - started) * 1000:.1f} ms\n")
+
+    print(f"{'filters':<70} {'matches':>7} {'scan µs':>9} {'index µs':>9} {'+facets µs':>11}")
+    for filters in QUERIES:
+        total = index.search(limit=20, facets=False, **filters).total
+        scan_us = timed(lambda: linear_scan(docs, filters, 20), args.repeat)
+        index_us = timed(lambda: index.search(limit=20, facets=False, **filters), args.repeat)
+        facets_us = timed(lambda: index.search(limit=20, **filters), args.repeat)
+        label = ", ".join(f"{k}={v}" for k, v in filters.items())
+        print(f"{label[:70]:<70} {total:>7} {scan_us:>9.1f} {index_us:>9.1f} {facets_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
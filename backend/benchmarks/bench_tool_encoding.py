@@ -0,0 +1,155 @@
+"""
+Tool result encoding benchmark
+Compares the size of agent tool results encoded as indented JSON (the previous
+tool output) against the compact tool encoding, per tool, on a synthetic
+catalog with the same shapes the Sanity queries return.
+
+Token counts are estimated at four characters per token, as FakeLLMProvider
+does. With --gemini (needs google-genai and GEMINI_API_KEY) they are counted
+by the Gemini tokenizer instead.
+
+Usage:
+    python -m benchmarks.bench_tool_encoding --products 10
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from services.search_engine import FacetedSearchIndex
+from services.tool_encoding import encode_tool_result
+
+CATEGORIES = ["Sofas", "Chairs", "Tables", "Beds", "Lighting", "Storage"]
+MATERIALS = ["oak", "walnut", "linen", "velvet", "steel", "marble", "rattan", "leather"]
+COLORS = ["Sand", "Charcoal", "Olive", "Ivory", "Terracotta"]
+WORDS = (
+    "handcrafted solid frame with soft rounded edges deep seat cushions tailored "
+    "upholstery timeless silhouette designed for everyday comfort in modern homes"
+).split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _image(rng: random.Random) -> Dict[str, Any]:
+    asset_id = f"image-{rng.getrandbits(96):024x}-1600x1200-jpg"
+    return {
+        "asset": {"_id": asset_id, "url": f"https://cdn.sanity.io/images/abc123/production/{asset_id}.jpg"},
+        "alt": _text(rng, 4),
+    }
+
+
+def make_product(rng: random.Random, i: int) -> Dict[str, Any]:
+    """Full product document, as returned by get_product_by_id."""
+    category = CATEGORIES[i % len(CATEGORIES)]
+    return {
+        "_id": f"{rng.getrandbits(128):032x}",
+        "_type": "product",
+        "name": f"{rng.choice(['Oslo', 'Bergen', 'Aria', 'Luna', 'Nord'])} {category[:-1]} {i}",
+        "slug": f"product-{i}",
+        "description": [
+            {"_type": "block", "_key": f"b{j}", "style": "normal", "markDefs": [],
+             "children": [{"_type": "span", "_key": f"s{j}", "text": _text(rng, 25), "marks": []}]}
+            for j in range(3)
+        ],
+        "shortDescription": _text(rng, 14),
+        "price": float(rng.randrange(99, 3000)),
+        "compareAtPrice": float(rng.randrange(3000, 4000)) if i % 3 == 0 else None,
+        "category": {"_id": f"category-{category.lower()}", "name": category, "slug": category.lower()},
+        "mainImage": _image(rng),
+        "images": [_image(rng) for _ in range(4)],
+        "dimensions": {"width": rng.randrange(40, 240), "height": rng.randrange(40, 120),
+                       "depth": rng.randrange(40, 110), "unit": "cm"},
+        "materials": rng.sample(MATERIALS, 2),
+        "colors": [{"name": c, "hex": "#c2b280"} for c in rng.sample(COLORS, 2)],
+        "stockStatus": rng.choice(["in-stock", "low-stock", "out-of-stock"]),
+        "sku": f"SI-{i:05d}",
+        "weight": rng.randrange(5, 80),
+        "warranty": "5 years",
+        "careInstructions": _text(rng, 18),
+        "featured": i % 4 == 0,
+    }
+
+
+def summary(product: Dict[str, Any], *extra: str) -> Dict[str, Any]:
+    """Product list shape, as returned by the list queries."""
+    doc = {
+        "_id": product["_id"],
+        "name": product["name"],
+        "slug": product["slug"],
+        "shortDescription": product["shortDescription"],
+        "price": product["price"],
+        "compareAtPrice": product["compareAtPrice"],
+        "category": product["category"]["name"],
+        "imageUrl": product["mainImage"]["asset"]["url"],
+        "stockStatus": product["stockStatus"],
+        "featured": product["featured"],
+    }
+    for field in extra:
+        doc[field] = product[field]
+    return doc
+
+
+def tool_results(products: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "search_products": [summary(p) for p in products],
+        "search_products_filtered": {
+            "products": [summary(p, "materials", "dimensions") for p in products],
+            "total": len(products),
+            "facets": FacetedSearchIndex(products).facet_counts((1 << len(products)) - 1),
+        },
+        "get_featured": [summary(p) for p in products[:6]],
+        "get_categories": [
+            {"_id": f"category-{c.lower()}", "name": c, "slug": c.lower(),
+             "description": f"Our {c.lower()} collection.", "imageUrl": "https://cdn.sanity.io/images/abc123/x.jpg"}
+            for c in CATEGORIES
+        ],
+        "get_product_details": products[0],
+        "check_inventory": {"product_id": products[0]["_id"], "stock_status": "in-stock", "available": True},
+    }
+
+
+async def count_tokens(text: str, use_gemini: bool) -> int:
+    if use_gemini:
+        from services.llm import GeminiProvider
+        return await GeminiProvider().count_tokens([{"role": "user", "content": text}])
+    return max(1, len(text) // 4)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark compact tool result encoding")
+    parser.add_argument("--products", type=int, default=10, help="Products per list result")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--gemini", action="store_true", help="Count tokens with the Gemini tokenizer")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    products = [make_product(rng, i) for i in range(max(1, args.products))]
+    results = tool_results(products)
+
+    print(f"{'tool':<26} {'json tokens':>11} {'compact':>9} {'saved':>7} {'encode µs':>10}")
+    total_before = total_after = 0
+    for tool, data in results.items():
+        before = json.dumps(data, indent=2)
+        started = time.perf_counter()
+        for _ in range(100):
+            after = encode_tool_result(tool, data)
+        encode_us = (time.perf_counter() - started) / 100 * 1e6
+
+        tokens_before = await count_tokens(before, args.gemini)
+        tokens_after = await count_tokens(after, args.gemini)
+        total_before += tokens_before
+        total_after += tokens_after
+        print(f"{tool:<26} {tokens_before:>11} {tokens_after:>9} "
+              f"{(1 - tokens_after / tokens_before) * 100:>6.0f}% {encode_us:>10.1f}")
+
+    print(f"\n{'total':<26} {total_before:>11} {total_after:>9} "
+          f"{(1 - total_after / total_before) * 100:>6.0f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
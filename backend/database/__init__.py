@@ -11,14 +11,30 @@ from .connection import (
     get_database_version,
 )
 
+from .replicas import get_replica_router
+
+from .codecs import (
+    register_codecs,
+    encode_vector,
+    decode_vector,
+)
+
 from .operations import (
     # Chat sessions
     create_chat_session,
     get_chat_session,
+    fetch_chat_session,
     update_chat_session,
     # Chat messages
     insert_chat_message,
     get_chat_history,
+    fetch_chat_history,
+    get_latest_messages,
+    fetch_latest_messages,
+    count_chat_messages,
+    # Usage rollups
+    get_session_usage,
+    get_hourly_usage,
     # Embeddings
     insert_embedding,
     batch_insert_embeddings,
@@ -27,6 +43,16 @@ from .operations import (
     # Text selections
     insert_text_selection,
     get_session_selections,
+    fetch_session_selections,
+)
+
+from .queries import (
+    QUERIES,
+    SessionRecord,
+    MessageRecord,
+    SelectionRecord,
+    encode_message_cursor,
+    decode_message_cursor,
 )
 
 __all__ = [
@@ -37,13 +63,27 @@ __all__ = [
     "enable_pgvector_extension",
     "test_database_connection",
     "get_database_version",
+    # Read replicas
+    "get_replica_router",
+    # Codecs
+    "register_codecs",
+    "encode_vector",
+    "decode_vector",
     # Chat sessions
     "create_chat_session",
     "get_chat_session",
+    "fetch_chat_session",
     "update_chat_session",
     # Chat messages
     "insert_chat_message",
     "get_chat_history",
+    "fetch_chat_history",
+    "get_latest_messages",
+    "fetch_latest_messages",
+    "count_chat_messages",
+    # Usage rollups
+    "get_session_usage",
+    "get_hourly_usage",
     # Embeddings
     "insert_embedding",
     "batch_insert_embeddings",
@@ -52,4 +92,12 @@ __all__ = [
     # Text selections
     "insert_text_selection",
     "get_session_selections",
+    "fetch_session_selections",
+    # Query registry and typed records
+    "QUERIES",
+    "SessionRecord",
+    "MessageRecord",
+    "SelectionRecord",
+    "encode_message_cursor",
+    "decode_message_cursor",
 ]
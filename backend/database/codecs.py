@@ -0,0 +1,124 @@
+"""
+asyncpg type codecs registered on every pool connection
+
+- json/jsonb: Python objects in and out, encoded with orjson when available
+- vector (pgvector): numpy float32 arrays in and out, in pgvector's binary
+  format, built from and into buffers without a Python float per element
+
+All codecs use binary format, so COPY (copy_records_to_table) works with them
+too.
+"""
+
+import sys
+import struct
+import logging
+from array import array
+from typing import Any, Sequence, Union
+
+import asyncpg
+
+from utils.json_codec import dumpb, loads
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Embedding accepted by the vector codec; returned as a float32 ndarray (or a
+# list of floats without numpy)
+Embedding = Union["np.ndarray", Sequence[float]]
+
+# Binary jsonb values start with a format version byte
+_JSONB_VERSION = b"\x01"
+
+# Binary vector: int16 dimensions, int16 unused, then big-endian float32s
+_VECTOR_HEADER = struct.Struct(">HH")
+_VECTOR_DTYPE = ">f4"
+
+
+def _encode_jsonb(value: Any) -> bytes:
+    return _JSONB_VERSION + dumpb(value)
+
+
+def _decode_jsonb(data: bytes) -> Any:
+    return loads(memoryview(data)[1:])
+
+
+def encode_vector(value: Embedding) -> bytes:
+    """Encode an embedding in pgvector's binary format."""
+    if NUMPY_AVAILABLE:
+        # One vectorized byte swap; no per-element Python objects for arrays
+        values = np.asarray(value, dtype=_VECTOR_DTYPE)
+        if values.ndim != 1:
+            raise ValueError(f"vector must be one-dimensional, got shape {values.shape}")
+        return _VECTOR_HEADER.pack(values.shape[0], 0) + values.tobytes()
+
+    values = array("f", value)
+    if sys.byteorder == "little":
+        values.byteswap()
+    return _VECTOR_HEADER.pack(len(values), 0) + values.tobytes()
+
+
+def decode_vector(data: bytes) -> Embedding:
+    """Decode pgvector's binary format into a float32 array."""
+    dimensions, _ = _VECTOR_HEADER.unpack_from(data)
+    if NUMPY_AVAILABLE:
+        # View the buffer in place, then convert to native byte order at once
+        return np.frombuffer(data, dtype=_VECTOR_DTYPE, count=dimensions,
+                             offset=_VECTOR_HEADER.size).astype(np.float32)
+
+    values = array("f")
+    values.frombytes(memoryview(data)[_VECTOR_HEADER.size:])
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values.tolist()
+
+
+async def register_json_codecs(conn: asyncpg.Connection):
+    """
+    Encode and decode json/jsonb as Python objects.
+
+    Parameters are passed as dicts/lists instead of pre-encoded strings, and
+    results come back parsed, without a text round trip on either side.
+    """
+    await conn.set_type_codec(
+        "jsonb", schema="pg_catalog", format="binary",
+        encoder=_encode_jsonb, decoder=_decode_jsonb
+    )
+    await conn.set_type_codec(
+        "json", schema="pg_catalog", format="binary",
+        encoder=dumpb, decoder=loads
+    )
+
+
+async def register_vector_codec(conn: asyncpg.Connection) -> bool:
+    """
+    Encode and decode pgvector's vector type as float32 arrays.
+
+    Returns:
+        False if the vector extension is not installed
+    """
+    schema = await conn.fetchval(
+        """
+        SELECT n.nspname FROM pg_type t
+        JOIN pg_namespace n ON n.oid = t.typnamespace
+        WHERE t.typname = 'vector'
+        """
+    )
+    if schema is None:
+        logger.debug("pgvector is not installed; vector codec not registered")
+        return False
+    await conn.set_type_codec(
+        "vector", schema=schema, format="binary",
+        encoder=encode_vector, decoder=decode_vector
+    )
+    return True
+
+
+async def register_codecs(conn: asyncpg.Connection):
+    """Register every codec; usable as a pool `init` hook."""
+    await register_json_codecs(conn)
+    await register_vector_codec(conn)
@@ -7,12 +7,47 @@ import os
 from typing import Optional
 import logging
 
+from .codecs import register_codecs
+from .queries import RegistryConnection, prepare_statements
+
 logger = logging.getLogger(__name__)
 
 # Global connection pool
 _pool: Optional[asyncpg.Pool] = None
 
 
+async def init_connection(conn: asyncpg.Connection):
+    """Pool `init` hook: register codecs, then prepare registry statements."""
+    await register_codecs(conn)
+    await prepare_statements(conn)
+
+
+async def create_pool(dsn: str, **options) -> asyncpg.Pool:
+    """
+    Create a pool with the codecs and prepared registry statements.
+
+    Used for the primary and for read replicas.
+
+    Args:
+        dsn: Connection string
+        **options: asyncpg.create_pool options overriding the defaults
+    """
+    return await asyncpg.create_pool(
+        dsn,
+        **{
+            "min_size": 2,
+            "max_size": 10,
+            "command_timeout": 60,
+            "timeout": 30,
+            # Codecs are registered and registry statements prepared once
+            # per connection
+            "connection_class": RegistryConnection,
+            "init": init_connection,
+            **options
+        }
+    )
+
+
 async def get_database_pool() -> asyncpg.Pool:
     """
     Get or create database connection pool
@@ -26,13 +61,7 @@ async def get_database_pool() -> asyncpg.Pool:
             raise ValueError("DATABASE_URL environment variable is not set")
 
         try:
-            _pool = await asyncpg.create_pool(
-                database_url,
-                min_size=2,
-                max_size=10,
-                command_timeout=60,
-                timeout=30,
-            )
+            _pool = await create_pool(database_url)
             logger.info("Database connection pool created successfully")
 
         except Exception as e:
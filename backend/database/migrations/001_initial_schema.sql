@@ -131,12 +131,14 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Trigger for chat_sessions updated_at
+DROP TRIGGER IF EXISTS update_chat_sessions_updated_at ON chat_sessions;
 CREATE TRIGGER update_chat_sessions_updated_at
     BEFORE UPDATE ON chat_sessions
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
 -- Trigger for document_embeddings updated_at
+DROP TRIGGER IF EXISTS update_document_embeddings_updated_at ON document_embeddings;
 CREATE TRIGGER update_document_embeddings_updated_at
     BEFORE UPDATE ON document_embeddings
     FOR EACH ROW
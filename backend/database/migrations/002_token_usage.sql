@@ -0,0 +1,118 @@
+-- Sony Interior Database Schema
+-- Migration 002: Token usage accounting and usage rollups
+-- Created: 2026-10-19
+
+-- =====================================================
+-- Per-message usage columns
+-- token_usage keeps the total (prompt + completion)
+-- =====================================================
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER DEFAULT 0;
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS completion_tokens INTEGER DEFAULT 0;
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS cached_tokens INTEGER DEFAULT 0;
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS model_latency_ms REAL;
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS model TEXT;
+
+-- =====================================================
+-- Per-session usage rollup
+-- Maintained by trigger on chat_messages insert
+-- =====================================================
+CREATE TABLE IF NOT EXISTS chat_usage_sessions (
+    session_id UUID PRIMARY KEY,
+    messages INTEGER NOT NULL DEFAULT 0,
+    model_calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cached_tokens BIGINT NOT NULL DEFAULT 0,
+    model_latency_ms_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    model_latency_ms_max REAL NOT NULL DEFAULT 0,
+    first_message_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_message_at TIMESTAMP WITH TIME ZONE NOT NULL,
+
+    CONSTRAINT fk_usage_session
+        FOREIGN KEY (session_id)
+        REFERENCES chat_sessions(session_id)
+        ON DELETE CASCADE
+);
+
+-- =====================================================
+-- Per-hour usage rollup, split by model
+-- =====================================================
+CREATE TABLE IF NOT EXISTS chat_usage_hourly (
+    hour TIMESTAMP WITH TIME ZONE NOT NULL,
+    model TEXT NOT NULL DEFAULT '',
+    messages INTEGER NOT NULL DEFAULT 0,
+    model_calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cached_tokens BIGINT NOT NULL DEFAULT 0,
+    model_latency_ms_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+    model_latency_ms_max REAL NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (hour, model)
+);
+
+-- =====================================================
+-- Rollup trigger
+-- =====================================================
+CREATE OR REPLACE FUNCTION rollup_chat_message_usage()
+RETURNS TRIGGER AS $$
+DECLARE
+    is_model_call INTEGER := CASE WHEN NEW.model_latency_ms IS NOT NULL THEN 1 ELSE 0 END;
+BEGIN
+    INSERT INTO chat_usage_sessions AS u (
+        session_id, messages, model_calls, prompt_tokens, completion_tokens, cached_tokens,
+        model_latency_ms_total, model_latency_ms_max, first_message_at, last_message_at
+    )
+    VALUES (
+        NEW.session_id, 1, is_model_call,
+        COALESCE(NEW.prompt_tokens, 0), COALESCE(NEW.completion_tokens, 0), COALESCE(NEW.cached_tokens, 0),
+        COALESCE(NEW.model_latency_ms, 0), COALESCE(NEW.model_latency_ms, 0),
+        NEW.created_at, NEW.created_at
+    )
+    ON CONFLICT (session_id) DO UPDATE SET
+        messages = u.messages + 1,
+        model_calls = u.model_calls + EXCLUDED.model_calls,
+        prompt_tokens = u.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = u.completion_tokens + EXCLUDED.completion_tokens,
+        cached_tokens = u.cached_tokens + EXCLUDED.cached_tokens,
+        model_latency_ms_total = u.model_latency_ms_total + EXCLUDED.model_latency_ms_total,
+        model_latency_ms_max = GREATEST(u.model_latency_ms_max, EXCLUDED.model_latency_ms_max),
+        last_message_at = GREATEST(u.last_message_at, EXCLUDED.last_message_at);
+
+    INSERT INTO chat_usage_hourly AS h (
+        hour, model, messages, model_calls, prompt_tokens, completion_tokens, cached_tokens,
+        model_latency_ms_total, model_latency_ms_max
+    )
+    VALUES (
+        date_trunc('hour', NEW.created_at), COALESCE(NEW.model, ''), 1, is_model_call,
+        COALESCE(NEW.prompt_tokens, 0), COALESCE(NEW.completion_tokens, 0), COALESCE(NEW.cached_tokens, 0),
+        COALESCE(NEW.model_latency_ms, 0), COALESCE(NEW.model_latency_ms, 0)
+    )
+    ON CONFLICT (hour, model) DO UPDATE SET
+        messages = h.messages + 1,
+        model_calls = h.model_calls + EXCLUDED.model_calls,
+        prompt_tokens = h.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = h.completion_tokens + EXCLUDED.completion_tokens,
+        cached_tokens = h.cached_tokens + EXCLUDED.cached_tokens,
+        model_latency_ms_total = h.model_latency_ms_total + EXCLUDED.model_latency_ms_total,
+        model_latency_ms_max = GREATEST(h.model_latency_ms_max, EXCLUDED.model_latency_ms_max);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rollup_chat_message_usage ON chat_messages;
+CREATE TRIGGER rollup_chat_message_usage
+    AFTER INSERT ON chat_messages
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_chat_message_usage();
+
+-- =====================================================
+-- Verification Queries
+-- =====================================================
+
+-- Token usage for the last 24 hours
+-- SELECT * FROM chat_usage_hourly WHERE hour >= NOW() - INTERVAL '24 hours' ORDER BY hour;
+
+-- Heaviest sessions
+-- SELECT * FROM chat_usage_sessions ORDER BY prompt_tokens DESC LIMIT 10;
@@ -0,0 +1,40 @@
+-- Sony Interior Database Schema
+-- Migration 003: Inventory table for stock lookups
+-- Created: 2026-10-19
+
+-- =====================================================
+-- Inventory Table
+-- One row per Sanity product; stock checks read only this table
+-- =====================================================
+CREATE TABLE IF NOT EXISTS inventory (
+    product_id TEXT PRIMARY KEY,
+    stock_status VARCHAR(20) NOT NULL DEFAULT 'in-stock'
+        CHECK (stock_status IN ('in-stock', 'low-stock', 'out-of-stock')),
+    quantity INTEGER NOT NULL DEFAULT 0 CHECK (quantity >= 0),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+-- Index for recently changed stock
+CREATE INDEX IF NOT EXISTS idx_inventory_updated_at
+ON inventory(updated_at DESC);
+
+-- =====================================================
+-- Backfill from the stock status last embedded with each product
+-- =====================================================
+INSERT INTO inventory (product_id, stock_status)
+SELECT DISTINCT ON (source_id) source_id, metadata->>'stock_status'
+FROM document_embeddings
+WHERE source_type = 'product'
+  AND metadata->>'stock_status' IN ('in-stock', 'low-stock', 'out-of-stock')
+ORDER BY source_id, updated_at DESC
+ON CONFLICT (product_id) DO NOTHING;
+
+-- =====================================================
+-- Verification Queries
+-- =====================================================
+
+-- Stock of several products in one round trip
+-- SELECT * FROM inventory WHERE product_id = ANY(ARRAY['product-1', 'product-2']);
+
+-- Products out of stock
+-- SELECT product_id, updated_at FROM inventory WHERE stock_status = 'out-of-stock';
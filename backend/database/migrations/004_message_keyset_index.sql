@@ -0,0 +1,38 @@
+-- Sony Interior Database Schema
+-- Migration 004: Keyset index for chat history pages
+-- Created: 2026-10-19
+
+-- =====================================================
+-- History is paged by (created_at, message_id) instead of OFFSET.
+-- Adding message_id to the session index lets the forward, "since" and
+-- "latest N" queries walk it in order (backwards for latest) with no sort,
+-- even when messages share a timestamp.
+-- =====================================================
+-- Migrations may run again (see schema_migrations): only rebuild the old two-column index
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = 'idx_chat_messages_session_id' AND i.indnatts < 3
+    ) THEN
+        DROP INDEX idx_chat_messages_session_id;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id
+ON chat_messages(session_id, created_at, message_id);
+
+-- =====================================================
+-- Verification Queries
+-- =====================================================
+
+-- Newest 50 messages: Index Scan Backward, no Sort node
+-- EXPLAIN SELECT * FROM chat_messages
+-- WHERE session_id = '00000000-0000-0000-0000-000000000000'
+-- ORDER BY created_at DESC, message_id DESC LIMIT 50;
+
+-- Messages after a cursor
+-- EXPLAIN SELECT * FROM chat_messages
+-- WHERE session_id = '00000000-0000-0000-0000-000000000000'
+--   AND (created_at, message_id) > ('2026-10-19T00:00:00+00', '00000000-0000-0000-0000-000000000000')
+-- ORDER BY created_at, message_id LIMIT 50;
@@ -0,0 +1,137 @@
+-- Sony Interior Database Schema
+-- Migration 005: Monthly range partitioning of chat_messages
+-- Created: 2026-10-19
+
+-- =====================================================
+-- Partition helper
+-- One partition per calendar month (UTC). Used here and by the
+-- maintenance job (python -m database.partitions) to stay months ahead.
+-- =====================================================
+CREATE OR REPLACE FUNCTION create_chat_messages_partition(month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', month)::date;
+    partition_name TEXT := 'chat_messages_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF chat_messages FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        month_start::timestamp AT TIME ZONE 'UTC',
+        (month_start + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =====================================================
+-- Convert chat_messages (once)
+-- The table is rebuilt as a partitioned table in this transaction: the old
+-- heap is renamed, its rows are copied into monthly partitions and it is
+-- dropped. The primary key includes created_at, as partitioned unique keys
+-- must contain the partition key; message IDs stay UUIDs.
+-- =====================================================
+DO $$
+DECLARE
+    first_month DATE;
+    month DATE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'chat_messages' AND relkind = 'p') THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned;
+    ALTER TABLE chat_messages_unpartitioned RENAME CONSTRAINT chat_messages_pkey TO chat_messages_unpartitioned_pkey;
+    ALTER INDEX IF EXISTS idx_chat_messages_session_id RENAME TO idx_chat_messages_unpartitioned_session_id;
+    ALTER INDEX IF EXISTS idx_chat_messages_role RENAME TO idx_chat_messages_unpartitioned_role;
+
+    CREATE TABLE chat_messages (
+        message_id UUID NOT NULL DEFAULT gen_random_uuid(),
+        session_id UUID NOT NULL,
+        role VARCHAR(20) NOT NULL CHECK (role IN ('user', 'assistant', 'system')),
+        content TEXT NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+        token_usage INTEGER DEFAULT 0,
+        page_context TEXT,
+        metadata JSONB DEFAULT '{}'::jsonb,
+        prompt_tokens INTEGER DEFAULT 0,
+        completion_tokens INTEGER DEFAULT 0,
+        cached_tokens INTEGER DEFAULT 0,
+        model_latency_ms REAL,
+        model TEXT,
+
+        PRIMARY KEY (message_id, created_at),
+
+        -- Foreign key constraint
+        CONSTRAINT fk_session
+            FOREIGN KEY (session_id)
+            REFERENCES chat_sessions(session_id)
+            ON DELETE CASCADE
+    ) PARTITION BY RANGE (created_at);
+
+    -- Every month with messages, through three months ahead
+    SELECT date_trunc('month', MIN(created_at) AT TIME ZONE 'UTC')::date
+    INTO first_month
+    FROM chat_messages_unpartitioned;
+
+    FOR month IN
+        SELECT generate_series(
+            COALESCE(first_month, date_trunc('month', NOW() AT TIME ZONE 'UTC')::date),
+            (date_trunc('month', NOW() AT TIME ZONE 'UTC') + INTERVAL '3 months')::date,
+            INTERVAL '1 month'
+        )::date
+    LOOP
+        PERFORM create_chat_messages_partition(month);
+    END LOOP;
+
+    INSERT INTO chat_messages (
+        message_id, session_id, role, content, created_at, token_usage, page_context,
+        metadata, prompt_tokens, completion_tokens, cached_tokens, model_latency_ms, model
+    )
+    SELECT
+        message_id, session_id, role, content, created_at, token_usage, page_context,
+        metadata, prompt_tokens, completion_tokens, cached_tokens, model_latency_ms, model
+    FROM chat_messages_unpartitioned;
+
+    -- History queries bound a session's messages by its created_at
+    ALTER TABLE chat_sessions DISABLE TRIGGER update_chat_sessions_updated_at;
+    UPDATE chat_sessions s SET created_at = m.first_message_at
+    FROM (
+        SELECT session_id, MIN(created_at) AS first_message_at
+        FROM chat_messages_unpartitioned
+        GROUP BY session_id
+    ) m
+    WHERE m.session_id = s.session_id AND m.first_message_at < s.created_at;
+    ALTER TABLE chat_sessions ENABLE TRIGGER update_chat_sessions_updated_at;
+
+    -- Also drops the usage rollup trigger, recreated below after the copy so
+    -- existing messages are not counted twice
+    DROP TABLE chat_messages_unpartitioned;
+
+    -- Indexes on the parent are created on every partition
+    CREATE INDEX idx_chat_messages_session_id ON chat_messages(session_id, created_at, message_id);
+    CREATE INDEX idx_chat_messages_role ON chat_messages(role);
+
+    CREATE TRIGGER rollup_chat_message_usage
+        AFTER INSERT ON chat_messages
+        FOR EACH ROW
+        EXECUTE FUNCTION rollup_chat_message_usage();
+END $$;
+
+-- Partitions for the coming months (no-op when they exist)
+SELECT create_chat_messages_partition((date_trunc('month', NOW() AT TIME ZONE 'UTC') + m * INTERVAL '1 month')::date)
+FROM generate_series(0, 3) AS m;
+
+-- =====================================================
+-- Verification Queries
+-- =====================================================
+
+-- Partitions and their bounds
+-- SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+-- FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+-- WHERE i.inhparent = 'chat_messages'::regclass ORDER BY c.relname;
+
+-- History queries touch one partition per month of the session only
+-- EXPLAIN SELECT * FROM chat_messages
+-- WHERE session_id = '00000000-0000-0000-0000-000000000000'
+--   AND created_at >= (SELECT created_at FROM chat_sessions WHERE session_id = '00000000-0000-0000-0000-000000000000')
+-- ORDER BY created_at DESC, message_id DESC LIMIT 50;
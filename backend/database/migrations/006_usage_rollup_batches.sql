@@ -0,0 +1,100 @@
+-- Sony Interior Database Schema
+-- Migration 006: Batched usage rollups and per-message model call counts
+-- Created: 2026-10-19
+
+-- =====================================================
+-- Model calls per message
+-- An agent answer can take several model calls (tool loop). Rows written
+-- before this column existed count one call if they carry a latency.
+-- =====================================================
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS model_calls INTEGER;
+
+-- =====================================================
+-- Rollup trigger, once per statement
+-- The row trigger of migration 002 upserted the same chat_usage_hourly row
+-- for every message, serializing concurrent writers on it. This one
+-- aggregates the statement's new rows (a whole transcript batch) first and
+-- upserts each session and (hour, model) row once, in key order so
+-- concurrent batches lock rows in the same order.
+-- =====================================================
+CREATE OR REPLACE FUNCTION rollup_chat_message_usage_batch()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO chat_usage_sessions AS u (
+        session_id, messages, model_calls, prompt_tokens, completion_tokens, cached_tokens,
+        model_latency_ms_total, model_latency_ms_max, first_message_at, last_message_at
+    )
+    SELECT
+        session_id,
+        COUNT(*),
+        SUM(COALESCE(model_calls, CASE WHEN model_latency_ms IS NOT NULL THEN 1 ELSE 0 END)),
+        SUM(COALESCE(prompt_tokens, 0)),
+        SUM(COALESCE(completion_tokens, 0)),
+        SUM(COALESCE(cached_tokens, 0)),
+        SUM(COALESCE(model_latency_ms, 0)),
+        MAX(COALESCE(model_latency_ms, 0)),
+        MIN(created_at),
+        MAX(created_at)
+    FROM new_messages
+    GROUP BY session_id
+    ORDER BY session_id
+    ON CONFLICT (session_id) DO UPDATE SET
+        messages = u.messages + EXCLUDED.messages,
+        model_calls = u.model_calls + EXCLUDED.model_calls,
+        prompt_tokens = u.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = u.completion_tokens + EXCLUDED.completion_tokens,
+        cached_tokens = u.cached_tokens + EXCLUDED.cached_tokens,
+        model_latency_ms_total = u.model_latency_ms_total + EXCLUDED.model_latency_ms_total,
+        model_latency_ms_max = GREATEST(u.model_latency_ms_max, EXCLUDED.model_latency_ms_max),
+        first_message_at = LEAST(u.first_message_at, EXCLUDED.first_message_at),
+        last_message_at = GREATEST(u.last_message_at, EXCLUDED.last_message_at);
+
+    INSERT INTO chat_usage_hourly AS h (
+        hour, model, messages, model_calls, prompt_tokens, completion_tokens, cached_tokens,
+        model_latency_ms_total, model_latency_ms_max
+    )
+    SELECT
+        date_trunc('hour', created_at),
+        COALESCE(model, ''),
+        COUNT(*),
+        SUM(COALESCE(model_calls, CASE WHEN model_latency_ms IS NOT NULL THEN 1 ELSE 0 END)),
+        SUM(COALESCE(prompt_tokens, 0)),
+        SUM(COALESCE(completion_tokens, 0)),
+        SUM(COALESCE(cached_tokens, 0)),
+        SUM(COALESCE(model_latency_ms, 0)),
+        MAX(COALESCE(model_latency_ms, 0))
+    FROM new_messages
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (hour, model) DO UPDATE SET
+        messages = h.messages + EXCLUDED.messages,
+        model_calls = h.model_calls + EXCLUDED.model_calls,
+        prompt_tokens = h.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = h.completion_tokens + EXCLUDED.completion_tokens,
+        cached_tokens = h.cached_tokens + EXCLUDED.cached_tokens,
+        model_latency_ms_total = h.model_latency_ms_total + EXCLUDED.model_latency_ms_total,
+        model_latency_ms_max = GREATEST(h.model_latency_ms_max, EXCLUDED.model_latency_ms_max);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement triggers with transition tables fire on the partitioned parent
+-- for INSERT and COPY alike (PostgreSQL 11+)
+DROP TRIGGER IF EXISTS rollup_chat_message_usage ON chat_messages;
+DROP TRIGGER IF EXISTS rollup_chat_message_usage_batch ON chat_messages;
+CREATE TRIGGER rollup_chat_message_usage_batch
+    AFTER INSERT ON chat_messages
+    REFERENCING NEW TABLE AS new_messages
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION rollup_chat_message_usage_batch();
+
+DROP FUNCTION IF EXISTS rollup_chat_message_usage();
+
+-- =====================================================
+-- Verification Queries
+-- =====================================================
+
+-- Average model calls per answer over the last day
+-- SELECT model, SUM(model_calls)::float / NULLIF(SUM(messages), 0)
+-- FROM chat_usage_hourly WHERE hour >= NOW() - INTERVAL '24 hours' GROUP BY model;
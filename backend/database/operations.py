@@ -1,6 +1,15 @@
 """
 Database operations module
 Helper functions for common database operations
+
+SQL lives in the statement registry (`queries.py`), prepared once per pool
+connection. The `fetch_*` functions are the typed fast path: they return
+`__slots__` records and accept an already acquired connection. The dict
+returning functions wrap them for existing callers.
+
+`json`/`jsonb` values are bound and returned as Python objects, and vectors
+as numpy float32 arrays (lists are accepted too): the pool registers the
+codecs of `codecs.py` on every connection.
 """
 
 import asyncpg
@@ -8,9 +17,10 @@ from typing import List, Dict, Optional, Any
 from datetime import datetime
 import logging
 from uuid import UUID
-import json
 
-from .connection import get_database_pool
+from . import queries
+from .codecs import Embedding
+from .queries import SessionRecord, MessageRecord, SelectionRecord, connection
 
 logger = logging.getLogger(__name__)
 
@@ -35,21 +45,11 @@ async def create_chat_session(
     Returns:
         session_id as string
     """
-    pool = await get_database_pool()
-
-    metadata_json = json.dumps(metadata) if metadata else '{}'
 
-    async with pool.acquire() as conn:
+    async with connection() as conn:
         try:
-            session_id = await conn.fetchval(
-                """
-                INSERT INTO chat_sessions (user_agent, current_page, metadata)
-                VALUES ($1, $2, $3)
-                RETURNING session_id
-                """,
-                user_agent,
-                current_page,
-                metadata_json
+            session_id = await queries.fetchval(
+                conn, "session_create", user_agent, current_page, metadata or {}
             )
 
             logger.info(f"Created chat session: {session_id}")
@@ -60,36 +60,44 @@ async def create_chat_session(
             raise
 
 
-async def get_chat_session(session_id: str) -> Optional[Dict[str, Any]]:
+async def get_chat_session(session_id: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
     """
     Get chat session by ID
 
     Args:
         session_id: Session UUID as string
+        fresh: Read from the primary (read-your-writes) instead of a replica
 
     Returns:
         Session data as dict or None if not found
     """
-    pool = await get_database_pool()
+    session = await fetch_chat_session(session_id, fresh=fresh)
+    return session.to_dict() if session else None
 
-    async with pool.acquire() as conn:
-        try:
-            row = await conn.fetchrow(
-                """
-                SELECT session_id, created_at, updated_at, user_agent, current_page, metadata
-                FROM chat_sessions
-                WHERE session_id = $1
-                """,
-                UUID(session_id)
-            )
 
-            if row:
-                return dict(row)
-            return None
+async def fetch_chat_session(
+    session_id: str,
+    conn: Optional[asyncpg.Connection] = None,
+    fresh: bool = False
+) -> Optional[SessionRecord]:
+    """
+    Get chat session by ID (typed fast path)
 
-        except Exception as e:
-            logger.error(f"Error getting chat session {session_id}: {e}")
-            raise
+    Args:
+        session_id: Session UUID as string
+        conn: Optional connection to run on instead of acquiring one
+        fresh: Read from the primary (read-your-writes) instead of a replica
+
+    Returns:
+        SessionRecord or None if not found
+    """
+    try:
+        row = await queries.read(queries.fetchrow, "session_get", UUID(session_id), conn=conn, fresh=fresh)
+        return SessionRecord.from_row(row)
+
+    except Exception as e:
+        logger.error(f"Error getting chat session {session_id}: {e}")
+        raise
 
 
 async def update_chat_session(
@@ -108,36 +116,19 @@ async def update_chat_session(
     Returns:
         True if update successful, False otherwise
     """
-    pool = await get_database_pool()
+    if current_page is None and metadata is None:
+        return False
 
-    async with pool.acquire() as conn:
+    async with connection() as conn:
         try:
-            # Build update query dynamically based on provided parameters
-            updates = []
-            params = [UUID(session_id)]
-            param_count = 2
-
-            if current_page is not None:
-                updates.append(f"current_page = ${param_count}")
-                params.append(current_page)
-                param_count += 1
-
-            if metadata is not None:
-                updates.append(f"metadata = metadata || ${param_count}::jsonb")
-                params.append(json.dumps(metadata))
-                param_count += 1
-
-            if not updates:
-                return False
-
-            query = f"""
-                UPDATE chat_sessions
-                SET {', '.join(updates)}
-                WHERE session_id = $1
-                RETURNING session_id
-            """
-
-            result = await conn.fetchval(query, *params)
+            # One fixed statement: NULL parameters leave their column unchanged
+            result = await queries.fetchval(
+                conn,
+                "session_update",
+                UUID(session_id),
+                current_page,
+                metadata
+            )
             return result is not None
 
         except Exception as e:
@@ -155,7 +146,8 @@ async def insert_chat_message(
     content: str,
     token_usage: int = 0,
     page_context: Optional[str] = None,
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = None,
+    usage: Optional[Dict[str, Any]] = None
 ) -> str:
     """
     Insert a chat message
@@ -167,35 +159,35 @@ async def insert_chat_message(
         token_usage: Number of tokens used
         page_context: Page context when message was sent
         metadata: Additional message metadata
+        usage: Model usage (prompt_tokens, completion_tokens, cached_tokens,
+               model_latency_ms, model, model_calls); fills token_usage when
+               it is 0
 
     Returns:
         message_id as string
     """
-    pool = await get_database_pool()
-
-    metadata_json = json.dumps(metadata) if metadata else '{}'
+    usage = usage or {}
+    if not token_usage and usage:
+        token_usage = usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
 
-    async with pool.acquire() as conn:
+    async with connection() as conn:
         try:
-            message_id = await conn.fetchval(
-                """
-                INSERT INTO chat_messages
-                (session_id, role, content, token_usage, page_context, metadata)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                RETURNING message_id
-                """,
+            # Also updates the session's updated_at timestamp
+            message_id = await queries.fetchval(
+                conn,
+                "message_insert",
                 UUID(session_id),
                 role,
                 content,
                 token_usage,
                 page_context,
-                metadata_json
-            )
-
-            # Update session's updated_at timestamp
-            await conn.execute(
-                "UPDATE chat_sessions SET updated_at = NOW() WHERE session_id = $1",
-                UUID(session_id)
+                metadata or {},
+                usage.get('prompt_tokens', 0),
+                usage.get('completion_tokens', 0),
+                usage.get('cached_tokens', 0),
+                usage.get('model_latency_ms'),
+                usage.get('model'),
+                usage.get('model_calls')
             )
 
             logger.debug(f"Inserted chat message {message_id} for session {session_id}")
@@ -209,7 +201,8 @@ async def insert_chat_message(
 async def get_chat_history(
     session_id: str,
     limit: int = 50,
-    offset: int = 0
+    after: Optional[str] = None,
+    fresh: bool = False
 ) -> List[Dict[str, Any]]:
     """
     Get chat history for a session
@@ -217,34 +210,194 @@ async def get_chat_history(
     Args:
         session_id: Session UUID as string
         limit: Maximum number of messages to return
-        offset: Number of messages to skip
+        after: Cursor of the last message already seen; only newer messages
+            are returned
+        fresh: Read from the primary (read-your-writes) instead of a replica
 
     Returns:
         List of message dicts ordered by creation time
     """
-    pool = await get_database_pool()
+    messages = await fetch_chat_history(session_id, limit, after, fresh=fresh)
+    return [message.to_dict() for message in messages]
 
-    async with pool.acquire() as conn:
-        try:
-            rows = await conn.fetch(
-                """
-                SELECT message_id, session_id, role, content, created_at,
-                       token_usage, page_context, metadata
-                FROM chat_messages
-                WHERE session_id = $1
-                ORDER BY created_at ASC
-                LIMIT $2 OFFSET $3
-                """,
-                UUID(session_id),
-                limit,
-                offset
+
+async def fetch_chat_history(
+    session_id: str,
+    limit: int = 50,
+    after: Optional[str] = None,
+    conn: Optional[asyncpg.Connection] = None,
+    fresh: bool = False
+) -> List[MessageRecord]:
+    """
+    Get chat history for a session, oldest first (typed fast path)
+
+    Pages are keyed on (created_at, message_id): pass the `cursor` of the
+    last record to get the next page, or to poll for new messages.
+
+    Args:
+        session_id: Session UUID as string
+        limit: Maximum number of messages to return
+        after: Cursor of the last message already seen
+        conn: Optional connection to run on instead of acquiring one
+        fresh: Read from the primary (read-your-writes) instead of a replica
+
+    Returns:
+        List of MessageRecord ordered by creation time
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    position = queries.decode_message_cursor(after) if after else None
+    try:
+        if position is None:
+            rows = await queries.read(
+                queries.fetch, "message_history", UUID(session_id), limit, conn=conn, fresh=fresh
             )
+        else:
+            rows = await queries.read(
+                queries.fetch, "message_after", UUID(session_id), *position, limit, conn=conn, fresh=fresh
+            )
+        return [MessageRecord(*row) for row in rows]
 
-            return [dict(row) for row in rows]
+    except Exception as e:
+        logger.error(f"Error getting chat history for session {session_id}: {e}")
+        raise
 
-        except Exception as e:
-            logger.error(f"Error getting chat history for session {session_id}: {e}")
-            raise
+
+async def get_latest_messages(
+    session_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    fresh: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Get the newest messages of a session
+
+    Args:
+        session_id: Session UUID as string
+        limit: Maximum number of messages to return
+        before: Cursor of the oldest message already seen; only older
+            messages are returned
+        fresh: Read from the primary (read-your-writes) instead of a replica
+
+    Returns:
+        List of message dicts ordered by creation time
+    """
+    messages = await fetch_latest_messages(session_id, limit, before, fresh=fresh)
+    return [message.to_dict() for message in messages]
+
+
+async def fetch_latest_messages(
+    session_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    conn: Optional[asyncpg.Connection] = None,
+    fresh: bool = False
+) -> List[MessageRecord]:
+    """
+    Get the newest messages of a session (typed fast path)
+
+    Reads the session index backwards, so the newest page costs the same
+    however long the session is. Pass the `cursor` of the first record as
+    `before` to page further back.
+
+    Args:
+        session_id: Session UUID as string
+        limit: Maximum number of messages to return
+        before: Cursor of the oldest message already seen
+        conn: Optional connection to run on instead of acquiring one
+        fresh: Read from the primary (read-your-writes) instead of a replica
+
+    Returns:
+        List of MessageRecord ordered by creation time
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    position = queries.decode_message_cursor(before) if before else None
+    try:
+        if position is None:
+            rows = await queries.read(
+                queries.fetch, "message_latest", UUID(session_id), limit, conn=conn, fresh=fresh
+            )
+        else:
+            rows = await queries.read(
+                queries.fetch, "message_before", UUID(session_id), *position, limit, conn=conn, fresh=fresh
+            )
+        return [MessageRecord(*row) for row in reversed(rows)]
+
+    except Exception as e:
+        logger.error(f"Error getting latest messages for session {session_id}: {e}")
+        raise
+
+
+async def count_chat_messages(
+    session_id: str,
+    conn: Optional[asyncpg.Connection] = None,
+    fresh: bool = False
+) -> int:
+    """
+    Count the messages of a session
+
+    Args:
+        session_id: Session UUID as string
+        conn: Optional connection to run on instead of acquiring one
+        fresh: Read from the primary (read-your-writes) instead of a replica
+
+    Returns:
+        Number of messages
+    """
+    return await queries.read(queries.fetchval, "message_count", UUID(session_id), conn=conn, fresh=fresh)
+
+
+# =====================================================
+# Usage Rollup Operations
+# =====================================================
+
+async def get_session_usage(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get token usage and model latency totals for a session
+
+    Args:
+        session_id: Session UUID as string
+
+    Returns:
+        Usage rollup dict or None if the session has no messages
+    """
+    try:
+        row = await queries.read(queries.fetchrow, "usage_session", UUID(session_id))
+
+        return dict(row) if row else None
+
+    except Exception as e:
+        logger.error(f"Error getting usage for session {session_id}: {e}")
+        raise
+
+
+async def get_hourly_usage(
+    since: datetime,
+    until: Optional[datetime] = None,
+    model: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Get hourly token usage and model latency rollups
+
+    Args:
+        since: Start of the time range (inclusive)
+        until: End of the time range (exclusive), defaults to now
+        model: Optional filter by model name
+
+    Returns:
+        List of hourly rollup dicts ordered by hour, with average latency
+    """
+    try:
+        rows = await queries.read(queries.fetch, "usage_hourly", since, until, model)
+
+        return [dict(row) for row in rows]
+
+    except Exception as e:
+        logger.error(f"Error getting hourly usage: {e}")
+        raise
 
 
 # =====================================================
@@ -255,7 +408,7 @@ async def insert_embedding(
     source_type: str,
     source_id: str,
     content_chunk: str,
-    embedding: List[float],
+    embedding: Embedding,
     metadata: Optional[Dict[str, Any]] = None
 ) -> str:
     """
@@ -265,30 +418,23 @@ async def insert_embedding(
         source_type: Type of source (product, page_content, faq, policy)
         source_id: Identifier for the source
         content_chunk: Text content
-        embedding: Vector embedding (384 dimensions)
+        embedding: Vector embedding (384 dimensions), float32 array or list
         metadata: Additional metadata
 
     Returns:
         embedding_id as string
     """
-    pool = await get_database_pool()
 
-    metadata_json = json.dumps(metadata) if metadata else '{}'
-
-    async with pool.acquire() as conn:
+    async with connection() as conn:
         try:
-            embedding_id = await conn.fetchval(
-                """
-                INSERT INTO document_embeddings
-                (source_type, source_id, content_chunk, embedding, metadata)
-                VALUES ($1, $2, $3, $4, $5)
-                RETURNING embedding_id
-                """,
+            embedding_id = await queries.fetchval(
+                conn,
+                "embedding_insert",
                 source_type,
                 source_id,
                 content_chunk,
                 embedding,
-                metadata_json
+                metadata or {}
             )
 
             logger.debug(f"Inserted embedding {embedding_id} for {source_type}/{source_id}")
@@ -312,28 +458,20 @@ async def batch_insert_embeddings(
     Returns:
         List of embedding_ids as strings
     """
-    pool = await get_database_pool()
-
-    async with pool.acquire() as conn:
+    async with connection() as conn:
         try:
             embedding_ids = []
 
             async with conn.transaction():
                 for data in embeddings_data:
-                    metadata_json = json.dumps(data.get('metadata', {}))
-
-                    embedding_id = await conn.fetchval(
-                        """
-                        INSERT INTO document_embeddings
-                        (source_type, source_id, content_chunk, embedding, metadata)
-                        VALUES ($1, $2, $3, $4, $5)
-                        RETURNING embedding_id
-                        """,
+                    embedding_id = await queries.fetchval(
+                        conn,
+                        "embedding_insert",
                         data['source_type'],
                         data['source_id'],
                         data['content_chunk'],
                         data['embedding'],
-                        metadata_json
+                        data.get('metadata') or {}
                     )
 
                     embedding_ids.append(str(embedding_id))
@@ -347,72 +485,46 @@ async def batch_insert_embeddings(
 
 
 async def search_similar_embeddings(
-    query_embedding: List[float],
+    query_embedding: Embedding,
     source_type: Optional[str] = None,
     limit: int = 5,
-    similarity_threshold: float = 0.0
+    similarity_threshold: float = 0.0,
+    fresh: bool = False
 ) -> List[Dict[str, Any]]:
     """
     Search for similar embeddings using cosine similarity
 
     Args:
-        query_embedding: Query vector (384 dimensions)
+        query_embedding: Query vector (384 dimensions), float32 array or list
         source_type: Optional filter by source type
         limit: Maximum number of results to return
         similarity_threshold: Minimum similarity score (0-1)
+        fresh: Read from the primary (read-your-writes) instead of a replica
 
     Returns:
         List of similar documents with similarity scores
     """
-    pool = await get_database_pool()
+    try:
+        if source_type:
+            rows = await queries.read(
+                queries.fetch, "embedding_search_by_type", query_embedding, source_type, limit,
+                fresh=fresh
+            )
+        else:
+            rows = await queries.read(queries.fetch, "embedding_search", query_embedding, limit, fresh=fresh)
 
-    async with pool.acquire() as conn:
-        try:
-            # Build query based on source_type filter
-            if source_type:
-                query = """
-                    SELECT
-                        embedding_id,
-                        source_type,
-                        source_id,
-                        content_chunk,
-                        metadata,
-                        1 - (embedding <=> $1) as similarity
-                    FROM document_embeddings
-                    WHERE source_type = $2
-                    ORDER BY embedding <=> $1
-                    LIMIT $3
-                """
-                params = [query_embedding, source_type, limit]
-            else:
-                query = """
-                    SELECT
-                        embedding_id,
-                        source_type,
-                        source_id,
-                        content_chunk,
-                        metadata,
-                        1 - (embedding <=> $1) as similarity
-                    FROM document_embeddings
-                    ORDER BY embedding <=> $1
-                    LIMIT $2
-                """
-                params = [query_embedding, limit]
-
-            rows = await conn.fetch(query, *params)
-
-            # Filter by similarity threshold
-            results = [
-                dict(row) for row in rows
-                if row['similarity'] >= similarity_threshold
-            ]
-
-            logger.debug(f"Found {len(results)} similar embeddings")
-            return results
+        # Filter by similarity threshold
+        results = [
+            dict(row) for row in rows
+            if row['similarity'] >= similarity_threshold
+        ]
 
-        except Exception as e:
-            logger.error(f"Error searching similar embeddings: {e}")
-            raise
+        logger.debug(f"Found {len(results)} similar embeddings")
+        return results
+
+    except Exception as e:
+        logger.error(f"Error searching similar embeddings: {e}")
+        raise
 
 
 async def delete_embeddings_by_source(
@@ -429,18 +541,9 @@ async def delete_embeddings_by_source(
     Returns:
         Number of embeddings deleted
     """
-    pool = await get_database_pool()
-
-    async with pool.acquire() as conn:
+    async with connection() as conn:
         try:
-            result = await conn.execute(
-                """
-                DELETE FROM document_embeddings
-                WHERE source_type = $1 AND source_id = $2
-                """,
-                source_type,
-                source_id
-            )
+            result = await queries.execute(conn, "embedding_delete", source_type, source_id)
 
             # Extract number from result string like "DELETE 5"
             count = int(result.split()[-1])
@@ -460,7 +563,7 @@ async def insert_text_selection(
     session_id: str,
     selected_text: str,
     page_url: str,
-    embedding: Optional[List[float]] = None,
+    embedding: Optional[Embedding] = None,
     metadata: Optional[Dict[str, Any]] = None
 ) -> str:
     """
@@ -476,24 +579,17 @@ async def insert_text_selection(
     Returns:
         selection_id as string
     """
-    pool = await get_database_pool()
 
-    metadata_json = json.dumps(metadata) if metadata else '{}'
-
-    async with pool.acquire() as conn:
+    async with connection() as conn:
         try:
-            selection_id = await conn.fetchval(
-                """
-                INSERT INTO user_text_selections
-                (session_id, selected_text, page_url, embedding, metadata)
-                VALUES ($1, $2, $3, $4, $5)
-                RETURNING selection_id
-                """,
+            selection_id = await queries.fetchval(
+                conn,
+                "selection_insert",
                 UUID(session_id),
                 selected_text,
                 page_url,
                 embedding,
-                metadata_json
+                metadata or {}
             )
 
             logger.debug(f"Inserted text selection {selection_id}")
@@ -506,7 +602,8 @@ async def insert_text_selection(
 
 async def get_session_selections(
     session_id: str,
-    limit: int = 10
+    limit: int = 10,
+    fresh: bool = False
 ) -> List[Dict[str, Any]]:
     """
     Get text selections for a session
@@ -514,29 +611,39 @@ async def get_session_selections(
     Args:
         session_id: Session UUID as string
         limit: Maximum number of selections to return
+        fresh: Read from the primary (read-your-writes) instead of a replica
 
     Returns:
         List of selection dicts
     """
-    pool = await get_database_pool()
+    selections = await fetch_session_selections(session_id, limit, fresh=fresh)
+    return [selection.to_dict() for selection in selections]
 
-    async with pool.acquire() as conn:
-        try:
-            rows = await conn.fetch(
-                """
-                SELECT selection_id, session_id, selected_text, page_url,
-                       created_at, metadata
-                FROM user_text_selections
-                WHERE session_id = $1
-                ORDER BY created_at DESC
-                LIMIT $2
-                """,
-                UUID(session_id),
-                limit
-            )
 
-            return [dict(row) for row in rows]
+async def fetch_session_selections(
+    session_id: str,
+    limit: int = 10,
+    conn: Optional[asyncpg.Connection] = None,
+    fresh: bool = False
+) -> List[SelectionRecord]:
+    """
+    Get text selections for a session (typed fast path)
+
+    Args:
+        session_id: Session UUID as string
+        limit: Maximum number of selections to return
+        conn: Optional connection to run on instead of acquiring one
+        fresh: Read from the primary (read-your-writes) instead of a replica
 
-        except Exception as e:
-            logger.error(f"Error getting text selections for session {session_id}: {e}")
-            raise
+    Returns:
+        List of SelectionRecord, newest first
+    """
+    try:
+        rows = await queries.read(
+            queries.fetch, "selection_list", UUID(session_id), limit, conn=conn, fresh=fresh
+        )
+        return [SelectionRecord(*row) for row in rows]
+
+    except Exception as e:
+        logger.error(f"Error getting text selections for session {session_id}: {e}")
+        raise
@@ -0,0 +1,279 @@
+"""
+Partition maintenance for chat_messages
+
+chat_messages is range partitioned by month (migration 005). This job keeps
+partitions created ahead of time and retires months past the retention window:
+each expired partition is detached, exported to a gzipped CSV and dropped, so
+old messages go in constant time instead of through a large DELETE. Detaching
+first means no row can reach the partition after its export. Sessions
+idle for longer than the window are deleted afterwards, in small batches.
+
+Run it daily from cron:
+    python -m database.partitions
+    python -m database.partitions --dry-run
+"""
+
+import os
+import re
+import gzip
+import asyncio
+import logging
+import argparse
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+from .queries import connection
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHAT_RETENTION_MONTHS = int(os.getenv("CHAT_RETENTION_MONTHS", 12))
+CHAT_PARTITIONS_AHEAD = int(os.getenv("CHAT_PARTITIONS_AHEAD", 3))
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", "archive/chat_messages")
+CHAT_SESSION_DELETE_BATCH = int(os.getenv("CHAT_SESSION_DELETE_BATCH", 5000))
+
+PARTITION_NAME = re.compile(r"^chat_messages_(\d{4})_(\d{2})$")
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month `months` after (or before) `month`."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month() -> date:
+    today = datetime.now(timezone.utc).date()
+    return today.replace(day=1)
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Month covered by a partition named chat_messages_YYYY_MM."""
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+async def ensure_partitions(
+    months_ahead: int = CHAT_PARTITIONS_AHEAD,
+    conn: Optional[asyncpg.Connection] = None
+) -> List[str]:
+    """
+    Create partitions from the current month through `months_ahead` months.
+
+    Args:
+        months_ahead: Months after the current one to create
+        conn: Optional connection to run on instead of acquiring one
+
+    Returns:
+        Partition names (existing ones included)
+    """
+    start = current_month()
+    async with connection(conn) as conn:
+        return [
+            await conn.fetchval("SELECT create_chat_messages_partition($1)", add_months(start, i))
+            for i in range(months_ahead + 1)
+        ]
+
+
+async def list_partitions(conn: Optional[asyncpg.Connection] = None) -> List[Dict[str, Any]]:
+    """
+    List monthly partitions, including ones left detached by an interrupted run.
+
+    Returns:
+        Dicts with name, month and attached, oldest first
+    """
+    async with connection(conn) as conn:
+        rows = await conn.fetch(
+            """
+            SELECT c.relname AS name, i.inhrelid IS NOT NULL AS attached
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+                AND i.inhparent = 'chat_messages'::regclass
+            WHERE n.nspname = current_schema()
+              AND c.relkind = 'r'
+              AND c.relname ~ '^chat_messages_[0-9]{4}_[0-9]{2}$'
+            """
+        )
+    partitions = [
+        {"name": r["name"], "month": partition_month(r["name"]), "attached": r["attached"]}
+        for r in rows
+    ]
+    return sorted(partitions, key=lambda p: p["month"])
+
+
+async def archive_partition(conn: asyncpg.Connection, name: str, archive_dir: str = CHAT_ARCHIVE_DIR) -> str:
+    """
+    Export a partition to <archive_dir>/<name>.csv.gz.
+
+    The file is written under a temporary name and renamed once complete, so
+    an archive that exists is always whole.
+
+    Returns:
+        Archive path
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial = path + ".partial"
+
+    with open(partial, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            async def write(chunk: bytes):
+                f.write(chunk)
+
+            await conn.copy_from_table(name, output=write, format="csv", header=True)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, path)
+    return path
+
+
+async def detach_pending(conn: asyncpg.Connection, name: str) -> bool:
+    """Whether a concurrent detach of the partition was interrupted halfway."""
+    try:
+        return bool(await conn.fetchval(
+            "SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = $1::regclass",
+            name
+        ))
+    except asyncpg.UndefinedColumnError:
+        # Before PostgreSQL 14 there is no concurrent detach
+        return False
+
+
+async def retire_partition(conn: asyncpg.Connection, partition: Dict[str, Any], archive_dir: str = CHAT_ARCHIVE_DIR) -> str:
+    """Detach, archive and drop one expired partition."""
+    name = partition["name"]
+
+    if partition["attached"]:
+        if await detach_pending(conn, name):
+            await conn.execute(f'ALTER TABLE chat_messages DETACH PARTITION "{name}" FINALIZE')
+        else:
+            try:
+                # Does not block inserts into current months (PostgreSQL 14+)
+                await conn.execute(f'ALTER TABLE chat_messages DETACH PARTITION "{name}" CONCURRENTLY')
+            except asyncpg.PostgresError as e:
+                if await detach_pending(conn, name):
+                    logger.info(f"Concurrent detach of {name} interrupted ({e}); finalizing")
+                    await conn.execute(f'ALTER TABLE chat_messages DETACH PARTITION "{name}" FINALIZE')
+                else:
+                    logger.info(f"Concurrent detach of {name} unavailable ({e}); detaching with a lock")
+                    await conn.execute(f'ALTER TABLE chat_messages DETACH PARTITION "{name}"')
+
+    # Detached: late rows for this month now fail their insert instead of
+    # landing after the export
+    path = await archive_partition(conn, name, archive_dir)
+    await conn.execute(f'DROP TABLE "{name}"')
+    return path
+
+
+async def delete_idle_sessions(conn: asyncpg.Connection, cutoff: datetime, batch_size: int = CHAT_SESSION_DELETE_BATCH) -> int:
+    """
+    Delete sessions idle since `cutoff`, `batch_size` rows at a time.
+
+    Returns:
+        Number of sessions deleted
+    """
+    deleted = 0
+    while True:
+        status = await conn.execute(
+            """
+            DELETE FROM chat_sessions
+            WHERE session_id IN (
+                SELECT s.session_id FROM chat_sessions s
+                WHERE s.updated_at < $1
+                  -- Not every writer touches updated_at; keep sessions with recent messages
+                  AND NOT EXISTS (
+                      SELECT 1 FROM chat_messages m
+                      WHERE m.session_id = s.session_id AND m.created_at >= $1
+                  )
+                LIMIT $2
+            )
+            """,
+            cutoff,
+            batch_size
+        )
+        count = int(status.split()[-1])
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+async def run_maintenance(
+    retention_months: int = CHAT_RETENTION_MONTHS,
+    months_ahead: int = CHAT_PARTITIONS_AHEAD,
+    archive_dir: str = CHAT_ARCHIVE_DIR,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """
+    Create upcoming partitions and retire the ones past retention.
+
+    Args:
+        retention_months: Full months kept before the current one
+        months_ahead: Months after the current one to create
+        archive_dir: Directory for exported partitions
+        dry_run: Only report what would be done
+
+    Returns:
+        Summary with created, retired (name -> archive path) and
+        deleted_sessions
+    """
+    cutoff_month = add_months(current_month(), -retention_months)
+    cutoff = datetime(cutoff_month.year, cutoff_month.month, 1, tzinfo=timezone.utc)
+    summary: Dict[str, Any] = {"cutoff": cutoff.isoformat(), "created": [], "retired": {}, "deleted_sessions": 0}
+
+    async with connection() as conn:
+        existing = {p["name"] for p in await list_partitions(conn)}
+        if dry_run:
+            start = current_month()
+            summary["created"] = [
+                f"chat_messages_{m:%Y_%m}"
+                for m in (add_months(start, i) for i in range(months_ahead + 1))
+                if f"chat_messages_{m:%Y_%m}" not in existing
+            ]
+        else:
+            summary["created"] = [
+                name for name in await ensure_partitions(months_ahead, conn) if name not in existing
+            ]
+
+        for partition in await list_partitions(conn):
+            if partition["month"] >= cutoff_month:
+                break
+            if dry_run:
+                summary["retired"][partition["name"]] = None
+                continue
+            summary["retired"][partition["name"]] = await retire_partition(conn, partition, archive_dir)
+            logger.info(f"Retired partition {partition['name']}")
+
+        if not dry_run:
+            summary["deleted_sessions"] = await delete_idle_sessions(conn, cutoff)
+
+    return summary
+
+
+async def _main(args: argparse.Namespace):
+    from .connection import close_database_pool
+    try:
+        summary = await run_maintenance(args.retention_months, args.ahead, args.archive_dir, args.dry_run)
+    finally:
+        await close_database_pool()
+
+    prefix = "[dry run] " if args.dry_run else ""
+    print(f"{prefix}Retention cutoff: {summary['cutoff']}")
+    print(f"{prefix}Partitions created: {', '.join(summary['created']) or 'none'}")
+    for name, path in summary["retired"].items():
+        print(f"{prefix}Retired {name}" + (f" -> {path}" if path else ""))
+    print(f"{prefix}Idle sessions deleted: {summary['deleted_sessions']}")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Maintain monthly chat_messages partitions")
+    parser.add_argument("--retention-months", type=int, default=CHAT_RETENTION_MONTHS)
+    parser.add_argument("--ahead", type=int, default=CHAT_PARTITIONS_AHEAD)
+    parser.add_argument("--archive-dir", default=CHAT_ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change")
+    asyncio.run(_main(parser.parse_args()))
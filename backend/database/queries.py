@@ -0,0 +1,384 @@
+"""
+Query registry and typed records for database operations
+
+Every statement used by `operations.py` is registered here by name with fixed
+SQL text. The pool's `init` hook prepares all of them once per connection, so
+a call sends only Bind/Execute instead of parsing and planning, and hot paths
+skip the statement cache lookup too. Statements that fail to prepare (e.g.
+vector queries before pgvector is enabled) fall back to plain execution.
+
+Read paths return `__slots__` records built straight from the row tuple
+rather than dicts.
+"""
+
+import os
+import json
+import base64
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DB_PREPARE_STATEMENTS = os.getenv("DB_PREPARE_STATEMENTS", "true").lower() == "true"
+
+
+# =====================================================
+# Statement Registry
+# =====================================================
+
+QUERIES: Dict[str, str] = {
+    # Chat sessions
+    "session_create": """
+        INSERT INTO chat_sessions (user_agent, current_page, metadata)
+        VALUES ($1, $2, $3)
+        RETURNING session_id
+    """,
+    "session_get": """
+        SELECT session_id, created_at, updated_at, user_agent, current_page, metadata
+        FROM chat_sessions
+        WHERE session_id = $1
+    """,
+    # NULL leaves a column unchanged, so one statement covers every update
+    "session_update": """
+        UPDATE chat_sessions
+        SET current_page = COALESCE($2, current_page),
+            metadata = CASE WHEN $3::jsonb IS NULL THEN metadata ELSE metadata || $3::jsonb END
+        WHERE session_id = $1
+        RETURNING session_id
+    """,
+
+    # Chat messages; the insert also touches the session in the same round trip
+    "message_insert": """
+        WITH inserted AS (
+            INSERT INTO chat_messages
+            (session_id, role, content, token_usage, page_context, metadata,
+             prompt_tokens, completion_tokens, cached_tokens, model_latency_ms, model, model_calls)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+            RETURNING message_id, session_id
+        ), touched AS (
+            UPDATE chat_sessions SET updated_at = NOW()
+            WHERE session_id = (SELECT session_id FROM inserted)
+        )
+        SELECT message_id FROM inserted
+    """,
+    # History pages in (created_at, message_id) order, all read straight off
+    # idx_chat_messages_session_id; the latest/before queries scan it backwards.
+    # The plain created_at bounds (a session's messages are never older than
+    # the session) let the executor prune monthly partitions.
+    "message_history": """
+        SELECT message_id, session_id, role, content, created_at,
+               token_usage, page_context, metadata
+        FROM chat_messages
+        WHERE session_id = $1
+          AND created_at >= (SELECT created_at FROM chat_sessions WHERE session_id = $1)
+        ORDER BY created_at, message_id
+        LIMIT $2
+    """,
+    "message_after": """
+        SELECT message_id, session_id, role, content, created_at,
+               token_usage, page_context, metadata
+        FROM chat_messages
+        WHERE session_id = $1
+          AND created_at >= $2 AND (created_at, message_id) > ($2, $3)
+        ORDER BY created_at, message_id
+        LIMIT $4
+    """,
+    "message_latest": """
+        SELECT message_id, session_id, role, content, created_at,
+               token_usage, page_context, metadata
+        FROM chat_messages
+        WHERE session_id = $1
+          AND created_at >= (SELECT created_at FROM chat_sessions WHERE session_id = $1)
+        ORDER BY created_at DESC, message_id DESC
+        LIMIT $2
+    """,
+    "message_count": """
+        SELECT count(*)
+        FROM chat_messages
+        WHERE session_id = $1
+          AND created_at >= (SELECT created_at FROM chat_sessions WHERE session_id = $1)
+    """,
+    "message_before": """
+        SELECT message_id, session_id, role, content, created_at,
+               token_usage, page_context, metadata
+        FROM chat_messages
+        WHERE session_id = $1
+          AND created_at >= (SELECT created_at FROM chat_sessions WHERE session_id = $1)
+          AND created_at <= $2 AND (created_at, message_id) < ($2, $3)
+        ORDER BY created_at DESC, message_id DESC
+        LIMIT $4
+    """,
+
+    # Usage rollups
+    "usage_session": """
+        SELECT session_id, messages, model_calls, prompt_tokens, completion_tokens,
+               cached_tokens, model_latency_ms_total, model_latency_ms_max,
+               first_message_at, last_message_at
+        FROM chat_usage_sessions
+        WHERE session_id = $1
+    """,
+    "usage_hourly": """
+        SELECT hour, model, messages, model_calls, prompt_tokens, completion_tokens,
+               cached_tokens, model_latency_ms_total, model_latency_ms_max,
+               model_latency_ms_total / NULLIF(model_calls, 0) AS model_latency_ms_avg
+        FROM chat_usage_hourly
+        WHERE hour >= date_trunc('hour', $1::timestamptz)
+          AND hour < COALESCE($2::timestamptz, NOW())
+          AND ($3::text IS NULL OR model = $3)
+        ORDER BY hour, model
+    """,
+
+    # Document embeddings
+    "embedding_insert": """
+        INSERT INTO document_embeddings
+        (source_type, source_id, content_chunk, embedding, metadata)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING embedding_id
+    """,
+    "embedding_search": """
+        SELECT embedding_id, source_type, source_id, content_chunk, metadata,
+               1 - (embedding <=> $1) AS similarity
+        FROM document_embeddings
+        ORDER BY embedding <=> $1
+        LIMIT $2
+    """,
+    "embedding_search_by_type": """
+        SELECT embedding_id, source_type, source_id, content_chunk, metadata,
+               1 - (embedding <=> $1) AS similarity
+        FROM document_embeddings
+        WHERE source_type = $2
+        ORDER BY embedding <=> $1
+        LIMIT $3
+    """,
+    "embedding_delete": """
+        DELETE FROM document_embeddings
+        WHERE source_type = $1 AND source_id = $2
+    """,
+
+    # Text selections
+    "selection_insert": """
+        INSERT INTO user_text_selections
+        (session_id, selected_text, page_url, embedding, metadata)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING selection_id
+    """,
+    "selection_list": """
+        SELECT selection_id, session_id, selected_text, page_url, created_at, metadata
+        FROM user_text_selections
+        WHERE session_id = $1
+        ORDER BY created_at DESC
+        LIMIT $2
+    """,
+}
+
+
+class RegistryConnection(asyncpg.Connection):
+    """Connection holding its prepared registry statements by name."""
+
+    __slots__ = ("statements",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements: Dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+
+
+async def prepare_statements(conn: asyncpg.Connection):
+    """
+    Pool `init` hook: prepare every registry statement on a new connection.
+
+    Args:
+        conn: Connection created by the pool
+    """
+    if not DB_PREPARE_STATEMENTS:
+        return
+    statements = getattr(conn, "statements", None)
+    if statements is None:
+        return
+    for name, sql in QUERIES.items():
+        try:
+            statements[name] = await conn.prepare(sql)
+        except asyncpg.PostgresError as e:
+            # Missing table or extension: run it unprepared, and fail there
+            logger.debug(f"Statement {name} not prepared: {e}")
+
+
+def _prepared(conn: asyncpg.Connection, name: str):
+    statements = getattr(conn, "statements", None)
+    return statements.get(name) if statements else None
+
+
+async def fetch(conn: asyncpg.Connection, name: str, *args) -> list:
+    statement = _prepared(conn, name)
+    if statement is not None:
+        return await statement.fetch(*args)
+    return await conn.fetch(QUERIES[name], *args)
+
+
+async def fetchrow(conn: asyncpg.Connection, name: str, *args) -> Optional[asyncpg.Record]:
+    statement = _prepared(conn, name)
+    if statement is not None:
+        return await statement.fetchrow(*args)
+    return await conn.fetchrow(QUERIES[name], *args)
+
+
+async def fetchval(conn: asyncpg.Connection, name: str, *args) -> Any:
+    statement = _prepared(conn, name)
+    if statement is not None:
+        return await statement.fetchval(*args)
+    return await conn.fetchval(QUERIES[name], *args)
+
+
+async def execute(conn: asyncpg.Connection, name: str, *args) -> str:
+    """Run a statement for its effect; returns the command status tag."""
+    statement = _prepared(conn, name)
+    if statement is not None:
+        # PreparedStatement has no execute(); the status tag is kept after a fetch
+        await statement.fetch(*args)
+        return statement.get_statusmsg()
+    return await conn.execute(QUERIES[name], *args)
+
+
+@asynccontextmanager
+async def connection(conn: Optional[asyncpg.Connection] = None) -> AsyncIterator[asyncpg.Connection]:
+    """Use the caller's connection, or acquire one from the pool."""
+    if conn is not None:
+        yield conn
+        return
+    from .connection import get_database_pool
+    pool = await get_database_pool()
+    async with pool.acquire() as acquired:
+        yield acquired
+
+
+async def read(
+    method: Callable[..., Awaitable[Any]],
+    name: str,
+    *args,
+    conn: Optional[asyncpg.Connection] = None,
+    fresh: bool = False
+) -> Any:
+    """
+    Run a read-only statement with `method` (fetch, fetchrow or fetchval).
+
+    Uses the caller's connection if given. Otherwise the statement goes to a
+    read replica, or to the primary for `fresh` (read-your-writes) reads and
+    when no replica can answer it (see `replicas.py`).
+    """
+    if conn is not None:
+        return await method(conn, name, *args)
+    from .replicas import get_replica_router
+    return await get_replica_router().run(lambda c: method(c, name, *args), fresh=fresh)
+
+
+# =====================================================
+# History Cursors
+# =====================================================
+
+def encode_message_cursor(created_at: Any, message_id: Any) -> str:
+    """
+    Opaque cursor positioned at a message in (created_at, message_id) order.
+
+    Args:
+        created_at: Message timestamp (datetime or ISO string)
+        message_id: Message UUID (or its string form)
+    """
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    payload = json.dumps([created_at, str(message_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_message_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Decode a cursor from encode_message_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at, message_id = datetime.fromisoformat(created_at), UUID(message_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at, message_id
+
+
+# =====================================================
+# Typed Records
+# =====================================================
+
+class Record:
+    """
+    Lightweight row with named fields.
+
+    Subclasses list their columns in `__slots__` (in SELECT order) and assign
+    them in an explicit `__init__`, so `Cls(*row)` costs one call.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row: Optional[asyncpg.Record]):
+        return cls(*row) if row is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class SessionRecord(Record):
+    __slots__ = ("session_id", "created_at", "updated_at", "user_agent", "current_page", "metadata")
+
+    def __init__(self, session_id, created_at, updated_at, user_agent, current_page, metadata):
+        self.session_id = session_id
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.user_agent = user_agent
+        self.current_page = current_page
+        self.metadata = metadata
+
+
+class MessageRecord(Record):
+    __slots__ = ("message_id", "session_id", "role", "content", "created_at",
+                 "token_usage", "page_context", "metadata")
+
+    def __init__(self, message_id, session_id, role, content, created_at, token_usage, page_context, metadata):
+        self.message_id = message_id
+        self.session_id = session_id
+        self.role = role
+        self.content = content
+        self.created_at = created_at
+        self.token_usage = token_usage
+        self.page_context = page_context
+        self.metadata = metadata
+
+    @property
+    def cursor(self) -> str:
+        return encode_message_cursor(self.created_at, self.message_id)
+
+
+class SelectionRecord(Record):
+    __slots__ = ("selection_id", "session_id", "selected_text", "page_url", "created_at", "metadata")
+
+    def __init__(self, selection_id, session_id, selected_text, page_url, created_at, metadata):
+        self.selection_id = selection_id
+        self.session_id = session_id
+        self.selected_text = selected_text
+        self.page_url = page_url
+        self.created_at = created_at
+        self.metadata = metadata
@@ -0,0 +1,239 @@
+"""
+Read replica routing
+
+Read-only operations (chat history, session info, similarity search, recent
+sessions) can run on read replicas listed in DATABASE_REPLICA_URLS, leaving
+the primary to the write path. Replicas are used round-robin, skipping any
+that failed their last health check: a check every DB_REPLICA_CHECK_INTERVAL
+seconds confirms the replica answers and lags at most DB_REPLICA_MAX_LAG
+seconds.
+
+A read falls back to the primary when no replica is healthy, when it fails on
+the replica (a connection error also marks the replica down until its next
+check), or when the caller asks for read-your-writes with `fresh=True`.
+
+Without DATABASE_REPLICA_URLS every read goes to the primary, as before.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Configuration
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))  # seconds
+DB_REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT", 2))  # seconds
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 10))  # seconds, 0 to ignore lag
+DB_REPLICA_POOL_MAX = int(os.getenv("DB_REPLICA_POOL_MAX", 10))
+
+# Replay lag in seconds; 0 when the replica has replayed all WAL it received
+# (an idle primary would otherwise look like a lagging replica)
+_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() IS NULL
+          OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# Errors that mean the replica itself is unreachable, not the query
+_CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+)
+
+
+def _host(dsn: str) -> str:
+    """Host part of a DSN, for logs and stats (no credentials)."""
+    return dsn.rsplit("@", 1)[-1].split("/", 1)[0]
+
+
+class Replica:
+    """One read replica and its health."""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.name = _host(dsn)
+        self.pool: Optional[asyncpg.Pool] = None
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.reads = 0
+        self.failures = 0
+
+    def mark_down(self, error: BaseException):
+        if self.healthy:
+            logger.warning(f"Read replica {self.name} marked down: {error}")
+        self.healthy = False
+        self.last_error = str(error)[:200]
+
+
+class ReplicaRouter:
+    """Round-robin router of read-only queries over health-checked replicas."""
+
+    def __init__(
+        self,
+        dsns: Optional[List[str]] = None,
+        check_interval: float = DB_REPLICA_CHECK_INTERVAL,
+        max_lag: float = DB_REPLICA_MAX_LAG
+    ):
+        self.replicas = [Replica(dsn) for dsn in (DATABASE_REPLICA_URLS if dsns is None else dsns)]
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._next = 0
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {"replica_reads": 0, "primary_reads": 0, "fresh_reads": 0, "fallbacks": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self) -> Optional[Replica]:
+        """Next healthy replica in round-robin order, or None."""
+        count = len(self.replicas)
+        for i in range(count):
+            index = (self._next + i) % count
+            replica = self.replicas[index]
+            if replica.healthy and replica.pool is not None:
+                self._next = (index + 1) % count
+                return replica
+        return None
+
+    async def run(
+        self,
+        fn: Callable[[asyncpg.Connection], Awaitable[T]],
+        fresh: bool = False,
+        primary: Optional[asyncpg.Pool] = None
+    ) -> T:
+        """
+        Run a read-only function on a replica connection.
+
+        Args:
+            fn: Coroutine function taking a connection
+            fresh: Read from the primary (read-your-writes)
+            primary: Primary pool to fall back to (defaults to the shared pool)
+
+        Returns:
+            The function's result
+        """
+        if fresh:
+            self._counters["fresh_reads"] += 1
+        else:
+            replica = self.choose()
+            if replica is not None:
+                try:
+                    async with replica.pool.acquire() as conn:
+                        result = await fn(conn)
+                    replica.reads += 1
+                    self._counters["replica_reads"] += 1
+                    return result
+                except _CONNECTION_ERRORS as e:
+                    replica.failures += 1
+                    replica.mark_down(e)
+                except asyncpg.PostgresError as e:
+                    # e.g. a query canceled by recovery conflict; the
+                    # primary can still answer it
+                    replica.failures += 1
+                    logger.info(f"Read on replica {replica.name} failed, retrying on primary: {e}")
+                self._counters["fallbacks"] += 1
+
+        self._counters["primary_reads"] += 1
+        if primary is None:
+            from .connection import get_database_pool
+            primary = await get_database_pool()
+        async with primary.acquire() as conn:
+            return await fn(conn)
+
+    async def _check(self, replica: Replica):
+        """Open the replica's pool if needed and measure its lag."""
+        try:
+            if replica.pool is None:
+                from .connection import create_pool
+                replica.pool = await create_pool(
+                    replica.dsn, min_size=1, max_size=DB_REPLICA_POOL_MAX, timeout=DB_REPLICA_CHECK_TIMEOUT
+                )
+            lag = await replica.pool.fetchval(_LAG_QUERY, timeout=DB_REPLICA_CHECK_TIMEOUT)
+        except Exception as e:
+            replica.mark_down(e)
+            return
+
+        replica.lag = float(lag) if lag is not None else None
+        if self.max_lag and replica.lag is not None and replica.lag > self.max_lag:
+            replica.mark_down(RuntimeError(f"replication lag {replica.lag:.1f}s"))
+            return
+        if not replica.healthy:
+            logger.info(f"Read replica {replica.name} is healthy")
+        replica.healthy = True
+        replica.last_error = None
+
+    async def check(self):
+        """Health check every replica once."""
+        await asyncio.gather(*(self._check(r) for r in self.replicas))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    async def start(self):
+        """Connect to the replicas and start health checks."""
+        if not self.enabled:
+            return
+        await self.check()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop health checks and close the replica pools."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+            replica.healthy = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Read routing counters and per-replica health."""
+        return {
+            **self._counters,
+            "replicas": [
+                {
+                    "host": r.name,
+                    "healthy": r.healthy,
+                    "lag": r.lag,
+                    "reads": r.reads,
+                    "failures": r.failures,
+                    "last_error": r.last_error
+                }
+                for r in self.replicas
+            ]
+        }
+
+
+# Global router instance
+_replica_router: Optional[ReplicaRouter] = None
+
+
+def get_replica_router() -> ReplicaRouter:
+    """Get or create the replica router instance."""
+    global _replica_router
+    if _replica_router is None:
+        _replica_router = ReplicaRouter()
+    return _replica_router
@@ -5,11 +5,17 @@ Main application entry point with CORS configuration
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
 from contextlib import asynccontextmanager
+from typing import Any
+import inspect
 import logging
 import os
 from dotenv import load_dotenv
 
+from utils.json_codec import dumpb
+
 # Load environment variables
 load_dotenv()
 
@@ -39,21 +45,94 @@ async def lifespan(app: FastAPI):
         db_connected = await test_database_connection()
         if db_connected:
             logger.info("✅ Database connection pool initialized")
+
+            # Keep monthly chat_messages partitions created ahead
+            from database.partitions import ensure_partitions
+            try:
+                await ensure_partitions()
+            except Exception as e:
+                logger.warning(f"⚠️  Could not create chat_messages partitions (run migrations): {e}")
         else:
             logger.warning("⚠️  Database connection test failed")
     except Exception as e:
         logger.error(f"❌ Failed to initialize database: {e}")
         logger.warning("API will start but database operations will fail")
 
+    # Route read-only queries to read replicas, if any are configured
+    from database import get_replica_router
+    replica_router = get_replica_router()
+    if replica_router.enabled:
+        try:
+            await replica_router.start()
+            healthy = sum(r.healthy for r in replica_router.replicas)
+            logger.info(f"✅ Read replicas: {healthy}/{len(replica_router.replicas)} healthy")
+        except Exception as e:
+            logger.error(f"❌ Failed to start read replica routing: {e}")
+            logger.warning("Reads will go to the primary")
+
     # Initialize embedding model
     # TODO: Add embedding model initialization in Phase 11
 
+    # Sync the local catalog replica before serving tool queries from it
+    from services.catalog import CATALOG_REPLICA_ENABLED
+    if CATALOG_REPLICA_ENABLED:
+        try:
+            from services.sanity_mcp import get_sanity_server
+            sanity_server = await get_sanity_server()
+            await sanity_server.catalog.full_sync()
+            sanity_server.catalog.start()
+            logger.info("✅ Catalog replica synced")
+        except Exception as e:
+            logger.error(f"❌ Failed to sync catalog replica: {e}")
+            logger.warning("Catalog queries will go to the Sanity API")
+
+    # Start quick answer pre-generation
+    from services.quick_questions import QUICK_ANSWERS_ENABLED, get_quick_answer_cache
+    if QUICK_ANSWERS_ENABLED:
+        get_quick_answer_cache().start()
+        logger.info("✅ Quick answer refresher started")
+
+    # Start batched chat transcript writes
+    from services.transcript_writer import get_transcript_writer
+    transcript_writer = get_transcript_writer()
+    if transcript_writer.enabled:
+        transcript_writer.start()
+        logger.info("✅ Transcript writer started")
+
+    # Sweep idle sessions and follow changes made by other workers
+    from services.session_store import get_session_store
+    session_store = get_session_store()
+    session_store.start()
+
     yield
 
     # Shutdown
     logger.info("Shutting down Sony Interior Backend API...")
 
+    await get_quick_answer_cache().stop()
+    await session_store.stop()
+
+    # Drain buffered chat messages while the database pool is still open
+    if transcript_writer.enabled:
+        try:
+            await transcript_writer.stop()
+            logger.info("✅ Transcript writer drained")
+        except Exception as e:
+            logger.error(f"Error draining transcript writer: {e}")
+
+    # Close pooled Sanity HTTP connections
+    try:
+        from services.sanity_mcp import close_sanity_server
+        await close_sanity_server()
+        logger.info("✅ Sanity HTTP client closed")
+    except Exception as e:
+        logger.error(f"Error closing Sanity HTTP client: {e}")
+
     # Cleanup database connections
+    try:
+        await replica_router.stop()
+    except Exception as e:
+        logger.error(f"Error closing read replica pools: {e}")
     try:
         from database import close_database_pool
         await close_database_pool()
@@ -62,14 +141,44 @@ async def lifespan(app: FastAPI):
         logger.error(f"Error closing database pool: {e}")
 
 
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (or the standard library without it)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumpb(content)
+
+
+# FastAPI versions that serialize response models to JSON bytes with Pydantic
+# only do so under the default response class; elsewhere orjson renders them.
+# The API is left to Pydantic there: for the session history response it is
+# faster than validating and rendering through orjson (65us against 1131us in
+# benchmarks/bench_json_codec.py). The routes without a response model return
+# small dicts (health checks, delete) and keep the default JSONResponse.
+PYDANTIC_JSON_RESPONSES = "dump_json" in inspect.signature(serialize_response).parameters
+
 # Create FastAPI application
 app = FastAPI(
     title="Sony Interior Backend API",
     description="AI-powered furniture consultation backend with RAG capabilities",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    **({} if PYDANTIC_JSON_RESPONSES else {"default_response_class": ORJSONResponse})
 )
 
+# ETags, Cache-Control and compression for read endpoints. Added before CORS
+# so CORS stays the outer middleware and 304s carry its headers too.
+from services.http_cache import HTTPCacheMiddleware, CachePolicy
+from services.quick_questions import QUICK_QUESTIONS_VERSION
+from routers.chat import session_version
+
+app.add_middleware(HTTPCacheMiddleware, policies={
+    "/api/quick-questions": CachePolicy(
+        f"public, max-age={os.getenv('QUICK_QUESTIONS_HTTP_MAX_AGE', 3600)}",
+        version=lambda params, query: QUICK_QUESTIONS_VERSION
+    ),
+    "/api/session/{session_id}": CachePolicy("private, no-cache", version=session_version),
+})
+
 # Configure CORS
 origins = [
     "http://localhost:3000",  # Next.js development server
@@ -118,17 +227,38 @@ async def health_check():
     except Exception as e:
         db_status = f"error: {str(e)[:50]}"
 
+    # LLM resilience metrics
+    try:
+        from services.resilience import get_llm_metrics
+        llm_status = get_llm_metrics()
+    except Exception as e:
+        llm_status = {"error": str(e)[:50]}
+
+    from database import get_replica_router
+    from services.admission import get_admission_controller
+    from services.http_cache import get_http_cache
+    from services.sanity_mcp import get_sanity_server
+    from services.transcript_writer import get_transcript_writer
+    sanity_server = await get_sanity_server()
+
     return {
         "status": "healthy",
         "database": db_status,
+        "replicas": get_replica_router().stats(),
+        "llm": llm_status,
+        "admission": get_admission_controller().stats(),
+        "sanity_cache": sanity_server.cache.stats(),
+        "http_cache": get_http_cache().stats(),
+        "transcripts": get_transcript_writer().stats(),
         "embedding_model": "not_initialized",  # Will update in Phase 11
         "mcp_servers": "not_initialized"  # Will update in Phase 12
     }
 
 
 # TODO: Mount routers in later phases
-from routers import chat
+from routers import chat, products
 app.include_router(chat.router, prefix="/api", tags=["chat"])
+app.include_router(products.router, prefix="/api", tags=["products"])
 
 
 if __name__ == "__main__":
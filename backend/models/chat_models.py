@@ -52,6 +52,7 @@ class SessionResponse(BaseModel):
 
 class Message(BaseModel):
     """Chat message model."""
+    message_id: Optional[str] = Field(None, description="Message ID")
     role: str = Field(..., description="Message role (user/assistant)")
     content: str = Field(..., description="Message content")
     created_at: Optional[datetime] = Field(None, description="Message timestamp")
@@ -62,5 +63,7 @@ class ChatHistoryResponse(BaseModel):
     """Response model for chat history."""
     session_id: str
     messages: List[Message]
+    next_cursor: Optional[str] = Field(None, description="Pass as `since` to fetch newer messages")
+    prev_cursor: Optional[str] = Field(None, description="Pass as `before` to fetch older messages")
     success: bool = True
     error: Optional[str] = None
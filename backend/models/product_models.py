@@ -0,0 +1,21 @@
+"""
+Pydantic models for product API responses.
+"""
+
+from typing import Optional, List
+from pydantic import BaseModel, Field
+
+
+class Suggestion(BaseModel):
+    """One autocomplete suggestion."""
+    type: str = Field(..., description="Suggestion type (product or category)")
+    id: Optional[str] = Field(None, description="Sanity document ID")
+    name: str = Field(..., description="Product or category name")
+    slug: Optional[str] = Field(None, description="URL slug")
+    distance: int = Field(0, description="Typos corrected to match the query")
+
+
+class SuggestResponse(BaseModel):
+    """Response model for product name autocomplete."""
+    query: str
+    suggestions: List[Suggestion]
@@ -5,12 +5,13 @@ Phase 14: FastAPI Chat Endpoint
 
 import os
 import uuid
-import json
 import logging
-from typing import Optional, List, Dict, Any
+from itertools import islice
+from typing import Optional, List, Dict, Any, Sequence, Tuple
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from models.chat_models import (
     ChatRequest,
@@ -22,8 +23,19 @@ from models.chat_models import (
     ChatHistoryResponse,
     Message
 )
-from services.agent import run_agent_query
+from services.agent import run_agent_query, stream_agent_query
+from services.quick_questions import (
+    get_quick_questions as get_page_quick_questions,
+    get_quick_answer_cache
+)
+from services.summarizer import get_summarizer, summary_window
+from services.admission import AdmissionRejected, get_admission_controller, retry_after_header
+from services.resilience import get_fallback_cache
 from services.database_mcp import get_db_server, create_session as db_create_session
+from services.session_store import get_session_store
+from services.session_cache import CachedMessage, to_micros
+from database.queries import decode_message_cursor
+from utils.json_codec import dumps
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -31,136 +43,114 @@ logger = logging.getLogger(__name__)
 # Create router
 router = APIRouter(tags=["chat"])
 
-# In-memory session storage (for development - use database in production)
-# Format: {session_id: {"created_at": datetime, "messages": [], "current_page": str}}
-sessions: Dict[str, Dict[str, Any]] = {}
-
-# Quick questions by page type
-QUICK_QUESTIONS = {
-    "product": [
-        "What are the dimensions of this item?",
-        "Is this currently in stock?",
-        "What materials is this made from?",
-        "Show me similar products",
-        "What's the price and any current deals?"
-    ],
-    "products": [
-        "What are your bestselling items?",
-        "Show me sofas under $1000",
-        "What new products arrived recently?",
-        "Help me find a dining table",
-        "What furniture categories do you offer?"
-    ],
-    "home": [
-        "What makes Sony Interior unique?",
-        "Tell me about your featured collection",
-        "How can I visit your showroom?",
-        "What's your return policy?",
-        "What are your bestsellers?"
-    ],
-    "about": [
-        "Where are you located?",
-        "Tell me about your craftsmanship",
-        "What's your sustainability approach?",
-        "How long have you been in business?",
-        "Do you offer interior design services?"
-    ],
-    "contact": [
-        "What are your store hours?",
-        "How can I schedule a showroom visit?",
-        "Do you offer delivery services?",
-        "What is your return policy?",
-        "How can I contact customer support?"
-    ],
-    "default": [
-        "Help me find the perfect furniture",
-        "What are your featured products?",
-        "Tell me about your company",
-        "What categories do you offer?",
-        "How can I contact you?"
-    ]
-}
-
-
 def generate_session_id() -> str:
     """Generate a new session ID."""
     return str(uuid.uuid4())
 
 
+def session_version(params: Dict[str, str], query: str) -> Optional[str]:
+    """HTTP cache version stamp of a locally held session's history."""
+    session = get_session_store().peek(params.get("session_id"))
+    if session is None:
+        return None
+    # The ring buffer stops growing once full; count every message instead
+    return f"{session.created_at}:{session.total_messages}"
+
+
+def client_key(req: Request, session_id: Optional[str] = None) -> str:
+    """Rate-limit key: the session ID, or the client address without one."""
+    if session_id:
+        return session_id
+    return req.client.host if req.client else "unknown"
+
+
+def shed_answer(request: ChatRequest, page_context: str) -> Optional[str]:
+    """Find a cached answer to serve instead of running a shed request."""
+    cached = get_quick_answer_cache().lookup(request.message, page_context, request.selected_text)
+    if cached is None and not request.selected_text:
+        cached = get_fallback_cache().get(request.message, page_context)
+    return cached
+
+
+def shed_error(error: AdmissionRejected) -> HTTPException:
+    """429 response for a shed request."""
+    return HTTPException(
+        status_code=429,
+        detail=f"Too many requests ({error.reason}). Please try again shortly.",
+        headers=retry_after_header(error)
+    )
+
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, req: Request):
+async def chat(request: ChatRequest, req: Request, background_tasks: BackgroundTasks):
     """
     Main chat endpoint - receives user message and returns agent response.
 
     Args:
         request: Chat request with message and optional context
         req: FastAPI request object
+        background_tasks: Tasks run after the response is sent
 
     Returns:
         ChatResponse with agent's reply
     """
+    try:
+        ticket = await get_admission_controller().acquire("chat", client_key(req, request.session_id))
+    except AdmissionRejected as e:
+        # Shed with a cached answer when we have one, otherwise 429
+        page_context = request.page_context or req.headers.get("X-Page-Context", "/")
+        cached_answer = shed_answer(request, page_context)
+        if cached_answer is None:
+            raise shed_error(e)
+        return ChatResponse(
+            response=cached_answer,
+            session_id=request.session_id or generate_session_id(),
+            success=True
+        )
+
     try:
         # Get or create session ID
         session_id = request.session_id or generate_session_id()
 
-        # Get chat history for context
-        chat_history = sessions.get(session_id, {}).get("messages", [])
-
         # Build page context
         page_context = request.page_context or req.headers.get("X-Page-Context", "/")
 
+        # Get chat history for context (summary + unsummarized turns)
+        store = get_session_store()
+        session = await store.get_or_create(session_id, page_context)
+        summary, chat_history = summary_window(session)
+
         # Run agent query
         logger.info(f"Processing chat message for session {session_id}: {request.message[:50]}...")
 
-        result = await run_agent_query(
-            user_message=request.message,
-            session_id=session_id,
-            page_context=page_context,
-            selected_text=request.selected_text,
-            chat_history=chat_history
+        cached_answer = get_quick_answer_cache().lookup(
+            request.message, page_context, request.selected_text
         )
-
-        # Store messages in session
-        if session_id not in sessions:
-            sessions[session_id] = {
-                "created_at": datetime.now(),
-                "messages": [],
-                "current_page": page_context
-            }
-
-        # Add user message
-        sessions[session_id]["messages"].append({
-            "role": "user",
-            "content": request.message,
-            "created_at": datetime.now().isoformat()
-        })
-
-        # Add assistant response
-        sessions[session_id]["messages"].append({
-            "role": "assistant",
-            "content": result.get("response", ""),
-            "created_at": datetime.now().isoformat()
-        })
-
-        # Try to save to database (if available)
-        try:
-            db_server = await get_db_server()
-            await db_server.save_chat_message(
-                session_id=session_id,
-                role="user",
-                content=request.message,
-                page_context=page_context
-            )
-            await db_server.save_chat_message(
+        if cached_answer is not None:
+            result = {"response": cached_answer, "session_id": session_id, "success": True, "error": None}
+        else:
+            result = await run_agent_query(
+                user_message=request.message,
                 session_id=session_id,
-                role="assistant",
-                content=result.get("response", "")
+                page_context=page_context,
+                selected_text=request.selected_text,
+                chat_history=chat_history,
+                summary=summary
             )
-        except Exception as e:
-            logger.warning(f"Failed to save to database: {e}")
 
-        # Update session page
-        sessions[session_id]["current_page"] = page_context
+        usage = result.get("usage") or {}
+
+        # Add user message and assistant response; the store queues both for
+        # the transcript writer (IDs and timestamps match the stored
+        # transcript, so history cursors work against memory and the database)
+        await store.append(session_id, session, "user", request.message, page_context=page_context)
+        await store.append(
+            session_id, session, "assistant", result.get("response", ""), usage=usage,
+            token_usage=usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+        )
+
+        # Condense older turns once the response is on its way
+        background_tasks.add_task(get_summarizer().maybe_summarize, session_id, session)
 
         return ChatResponse(
             response=result.get("response", "I apologize, but I couldn't generate a response."),
@@ -173,46 +163,60 @@ async def chat(request: ChatRequest, req: Request):
         logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    finally:
+        ticket.release()
+
 
 @router.post("/chat/stream")
 async def chat_stream(request: ChatRequest, req: Request):
     """
-    Streaming chat endpoint - streams agent response token by token.
-
-    Note: This is a placeholder. Full streaming implementation requires
-    modifying the agent to yield chunks instead of waiting for complete response.
+    Streaming chat endpoint - streams agent response as the model generates it.
     """
-    # For now, return a simple streaming response
-    # Full streaming would require modifying the agent to support async generation
-
     session_id = request.session_id or generate_session_id()
+    page_context = request.page_context or "/"
+
+    ticket = None
+    shed_text = None
+    try:
+        ticket = await get_admission_controller().acquire("chat_stream", client_key(req, request.session_id))
+    except AdmissionRejected as e:
+        # Shed with a cached answer when we have one, otherwise 429
+        shed_text = shed_answer(request, page_context)
+        if shed_text is None:
+            raise shed_error(e)
 
     async def generate():
         # First, yield the session ID
-        yield f"data: {json.dumps({'session_id': session_id})}\n\n"
+        yield f"data: {dumps({'session_id': session_id})}\n\n"
 
         # Then process the message
         try:
-            page_context = request.page_context or "/"
-            result = await run_agent_query(
-                user_message=request.message,
-                session_id=session_id,
-                page_context=page_context,
-                selected_text=request.selected_text
+            cached_answer = shed_text or get_quick_answer_cache().lookup(
+                request.message, page_context, request.selected_text
             )
-
-            response_text = result.get("response", "")
-
-            # Stream the response in chunks
-            chunk_size = 20
-            for i in range(0, len(response_text), chunk_size):
-                chunk = response_text[i:i + chunk_size]
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
+            if cached_answer is not None:
+                # Stream the cached response in chunks
+                chunk_size = 20
+                for i in range(0, len(cached_answer), chunk_size):
+                    chunk = cached_answer[i:i + chunk_size]
+                    yield f"data: {dumps({'content': chunk})}\n\n"
+            else:
+                async for chunk in stream_agent_query(
+                    user_message=request.message,
+                    session_id=session_id,
+                    page_context=page_context,
+                    selected_text=request.selected_text
+                ):
+                    yield f"data: {dumps({'content': chunk})}\n\n"
 
             yield "data: [DONE]\n\n"
 
         except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield f"data: {dumps({'error': str(e)})}\n\n"
+
+        finally:
+            if ticket is not None:
+                ticket.release()
 
     return StreamingResponse(
         generate(),
@@ -220,7 +224,9 @@ async def chat_stream(request: ChatRequest, req: Request):
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-        }
+        },
+        # Also release if the stream never started (release is idempotent)
+        background=BackgroundTask(ticket.release) if ticket is not None else None
     )
 
 
@@ -236,50 +242,43 @@ async def get_quick_questions(page_type: str = "default", product_id: Optional[s
     Returns:
         List of quick questions
     """
-    questions = QUICK_QUESTIONS.get(page_type, QUICK_QUESTIONS["default"])
-
-    # If on a product page, add product-specific questions
-    if page_type == "product" and product_id:
-        product_questions = [
-            f"What are the dimensions of this product?",
-            f"Is this product in stock?",
-            f"What materials is this made from?"
-        ]
-        questions = product_questions + questions[:2]
+    questions = get_page_quick_questions(page_type, product_id)
 
     return QuickQuestionsResponse(questions=questions)
 
 
 @router.post("/session", response_model=SessionResponse)
-async def create_session(request: SessionCreateRequest):
+async def create_session(request: SessionCreateRequest, req: Request):
     """
     Create a new chat session.
 
     Args:
         request: Session creation request
+        req: FastAPI request object
 
     Returns:
         Session ID
     """
-    session_id = generate_session_id()
-
-    # Store in memory
-    sessions[session_id] = {
-        "created_at": datetime.now(),
-        "messages": [],
-        "current_page": request.current_page or "/"
-    }
+    try:
+        ticket = await get_admission_controller().acquire("session", client_key(req))
+    except AdmissionRejected as e:
+        raise shed_error(e)
 
-    # Try to create in database
     try:
-        db_server = await get_db_server()
-        await db_server.create_chat_session(
-            user_agent=request.user_agent,
-            current_page=request.current_page,
-            metadata=request.metadata
-        )
-    except Exception as e:
-        logger.warning(f"Failed to create session in database: {e}")
+        return await _create_session(request)
+    finally:
+        ticket.release()
+
+
+async def _create_session(request: SessionCreateRequest) -> SessionResponse:
+    """Create a session in the session store (and the database, if available)."""
+    session_id = generate_session_id()
+    await get_session_store().create(
+        session_id,
+        current_page=request.current_page,
+        user_agent=request.user_agent,
+        metadata=request.metadata
+    )
 
     return SessionResponse(
         session_id=session_id,
@@ -288,36 +287,120 @@ async def create_session(request: SessionCreateRequest):
     )
 
 
+def _cursor_key(cursor: str) -> Tuple[int, int]:
+    created_at, message_id = decode_message_cursor(cursor)
+    return to_micros(created_at), message_id.int
+
+
+def page_messages(
+    messages: Sequence[CachedMessage],
+    limit: int,
+    since: Optional[str] = None,
+    before: Optional[str] = None
+) -> List[CachedMessage]:
+    """
+    Keyset page of an in-memory session's messages.
+
+    Messages are appended in order, so both cursors are found by scanning
+    back from the end; a poll with `since` only touches the new messages.
+
+    Args:
+        messages: Session messages, oldest first
+        limit: Maximum messages to return
+        since: Only messages after this cursor (the first `limit` of them)
+        before: Only messages before this cursor (the last `limit` of them)
+
+    Returns:
+        Messages, oldest first
+
+    Raises:
+        ValueError: If a cursor is malformed
+    """
+    if since:
+        position = _cursor_key(since)
+        start = len(messages)
+        while start > 0 and messages[start - 1].key > position:
+            start -= 1
+        return list(islice(messages, start, start + limit))
+
+    end = len(messages)
+    if before:
+        position = _cursor_key(before)
+        while end > 0 and messages[end - 1].key >= position:
+            end -= 1
+    return list(islice(messages, max(0, end - limit), end))
+
+
+def history_response(
+    session_id: str,
+    messages: List[Dict[str, Any]],
+    since: Optional[str] = None,
+    before: Optional[str] = None
+) -> ChatHistoryResponse:
+    """History page with the cursors to continue from either end."""
+    if messages:
+        prev_cursor, next_cursor = messages[0]["cursor"], messages[-1]["cursor"]
+    else:
+        # Nothing new: keep polling from the same place
+        prev_cursor, next_cursor = before, since
+    return ChatHistoryResponse(
+        session_id=session_id,
+        messages=[Message(**msg) for msg in messages],
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        success=True
+    )
+
+
 @router.get("/session/{session_id}", response_model=ChatHistoryResponse)
-async def get_session_history(session_id: str, limit: int = 50):
+async def get_session_history(
+    session_id: str,
+    limit: int = 50,
+    since: Optional[str] = None,
+    before: Optional[str] = None
+):
     """
     Get chat history for a session.
 
+    Without cursors the latest `limit` messages are returned. Pass the
+    response's `next_cursor` as `since` to fetch only messages added after
+    it, or its `prev_cursor` as `before` to page back through older ones.
+
     Args:
         session_id: Session ID
         limit: Maximum messages to return
+        since: Cursor; return the messages after it
+        before: Cursor; return the messages before it
 
     Returns:
         Chat history
     """
-    # Check in-memory storage first
-    if session_id in sessions:
-        messages = sessions[session_id].get("messages", [])[-limit:]
-        return ChatHistoryResponse(
-            session_id=session_id,
-            messages=[Message(**msg) for msg in messages],
-            success=True
-        )
+    if since and before:
+        raise HTTPException(status_code=400, detail="Pass either since or before, not both")
+
+    # Serve from the session store unless the cursor reaches back past the
+    # messages it holds for a session loaded from the database
+    try:
+        session = await get_session_store().get(session_id)
+    except Exception as e:
+        logger.warning(f"Failed to load session {session_id}: {e}")
+        session = None
+    if session is not None and (not session.message_offset or not (since or before)):
+        try:
+            messages = page_messages(session.messages, limit, since, before)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return history_response(session_id, [m.to_dict() for m in messages], since, before)
 
     # Try database
     try:
         db_server = await get_db_server()
-        history = await db_server.get_chat_history(session_id, limit)
-        return ChatHistoryResponse(
-            session_id=session_id,
-            messages=[Message(**msg) for msg in history],
-            success=True
+        history = await db_server.get_chat_history(
+            session_id, limit, since=since, before=before, latest=not since
         )
+        return history_response(session_id, history, since, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         return ChatHistoryResponse(
             session_id=session_id,
@@ -338,8 +421,12 @@ async def delete_session(session_id: str):
     Returns:
         Success message
     """
-    if session_id in sessions:
-        del sessions[session_id]
+    try:
+        deleted = await get_session_store().delete(session_id)
+    except Exception as e:
+        logger.error(f"Failed to delete session {session_id}: {e}")
+        raise HTTPException(status_code=503, detail="Session store unavailable")
+    if deleted:
         return {"success": True, "message": "Session deleted"}
 
     raise HTTPException(status_code=404, detail="Session not found")
@@ -353,6 +440,13 @@ async def chat_health_check():
     return {
         "status": "healthy",
         "service": "chat",
-        "sessions_active": len(sessions),
-        "model": os.getenv("GEMINI_MODEL", "gemini/gemini-2.5-flash")
+        "sessions_active": len(get_session_store()),
+        "session_store": get_session_store().stats(),
+        "admission": get_admission_controller().stats(),
+        "quick_answers": {
+            "cached": len(get_quick_answer_cache().answers),
+            "catalog_version": get_quick_answer_cache().catalog_version
+        },
+        "model": os.getenv("GEMINI_MODEL", "gemini/gemini-2.5-flash"),
+        "llm_provider": os.getenv("LLM_PROVIDER", "gemini")
     }
@@ -0,0 +1,40 @@
+"""
+Products router - Product lookup endpoints for the storefront.
+"""
+
+import logging
+from fastapi import APIRouter, Query
+
+from models.product_models import SuggestResponse
+from services.sanity_mcp import get_sanity_server
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Create router
+router = APIRouter(tags=["products"])
+
+
+@router.get("/products/suggest", response_model=SuggestResponse)
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100, description="Text typed so far"),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """
+    Autocomplete product and category names, tolerating typos.
+
+    Args:
+        q: Text typed so far
+        limit: Maximum number of suggestions
+
+    Returns:
+        Suggestions, best match first
+    """
+    server = await get_sanity_server()
+    try:
+        suggestions = await server.suggest(q, limit)
+    except Exception as e:
+        logger.error(f"Suggest failed for {q!r}: {e}")
+        suggestions = []
+
+    return SuggestResponse(query=q, suggestions=suggestions)
@@ -21,9 +21,18 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Applied migration files, so each is run once per database
+SCHEMA_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        filename TEXT PRIMARY KEY,
+        applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+    )
+"""
+
+
 async def run_migration(migration_file: Path, conn: asyncpg.Connection):
     """
-    Run a single migration file
+    Run a single migration file and record it as applied
 
     Args:
         migration_file: Path to SQL migration file
@@ -36,8 +45,13 @@ async def run_migration(migration_file: Path, conn: asyncpg.Connection):
         with open(migration_file, 'r') as f:
             sql = f.read()
 
-        # Execute migration
-        await conn.execute(sql)
+        # Execute migration; a failure leaves nothing half-applied
+        async with conn.transaction():
+            await conn.execute(sql)
+            await conn.execute(
+                "INSERT INTO schema_migrations (filename) VALUES ($1)",
+                migration_file.name
+            )
 
         logger.info(f"✅ Successfully applied: {migration_file.name}")
         return True
@@ -82,9 +96,16 @@ async def run_all_migrations():
 
         logger.info(f"Found {len(migration_files)} migration file(s)")
 
+        # Skip files already applied. Databases migrated before this table
+        # existed re-run every file once; they are idempotent.
+        await conn.execute(SCHEMA_MIGRATIONS_TABLE)
+        applied = {r["filename"] for r in await conn.fetch("SELECT filename FROM schema_migrations")}
+        pending = [f for f in migration_files if f.name not in applied]
+        logger.info(f"{len(applied)} already applied, {len(pending)} pending")
+
         # Run each migration
         success_count = 0
-        for migration_file in migration_files:
+        for migration_file in pending:
             if await run_migration(migration_file, conn):
                 success_count += 1
             else:
@@ -134,7 +155,7 @@ async def run_all_migrations():
 
         logger.info(f"\n{'='*60}")
         logger.info(f"Migration complete!")
-        logger.info(f"Applied {success_count}/{len(migration_files)} migration(s)")
+        logger.info(f"Applied {success_count}/{len(pending)} pending migration(s)")
         logger.info(f"{'='*60}")
 
     except asyncpg.PostgresError as e:
@@ -183,7 +204,7 @@ async def test_database():
 
         # Test chat history retrieval
         logger.info("\n3. Testing chat history retrieval...")
-        history = await get_chat_history(session_id)
+        history = await get_chat_history(session_id, fresh=True)
         logger.info(f"✅ Retrieved {len(history)} message(s)")
 
         # Test embedding insertion
@@ -203,7 +224,8 @@ async def test_database():
         query_embedding = [0.1] * 384
         results = await search_similar_embeddings(
             query_embedding=query_embedding,
-            limit=5
+            limit=5,
+            fresh=True
         )
         logger.info(f"✅ Found {len(results)} similar embedding(s)")
 
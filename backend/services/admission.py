@@ -0,0 +1,251 @@
+"""
+Admission Control - Concurrency caps and per-session rate limiting for chat routes.
+
+Each request must take a slot under a global in-flight cap and its route's own
+cap, and pass its session's token bucket for that route. When no slot frees up
+within a short bounded wait, or the session is over its rate, the request is
+shed immediately instead of queueing more work onto the model and database.
+"""
+
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+@dataclass
+class RouteLimits:
+    """Admission limits for one route."""
+    max_in_flight: int
+    session_rate: float  # requests per second per session
+    session_burst: int
+    max_queue: int = 0  # requests allowed to wait for a slot
+    queue_timeout: float = 0.0  # seconds a queued request may wait
+
+
+# Configuration
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_GLOBAL_MAX_IN_FLIGHT = _env_int("ADMISSION_GLOBAL_MAX_IN_FLIGHT", 64)
+ADMISSION_MAX_TRACKED_SESSIONS = _env_int("ADMISSION_MAX_TRACKED_SESSIONS", 10000)
+
+ROUTE_LIMITS: Dict[str, RouteLimits] = {
+    "chat": RouteLimits(
+        max_in_flight=_env_int("ADMISSION_CHAT_MAX_IN_FLIGHT", 32),
+        session_rate=_env_float("ADMISSION_CHAT_RATE", 0.5),
+        session_burst=_env_int("ADMISSION_CHAT_BURST", 5),
+        max_queue=_env_int("ADMISSION_CHAT_MAX_QUEUE", 8),
+        queue_timeout=_env_float("ADMISSION_CHAT_QUEUE_TIMEOUT", 0.5),
+    ),
+    "chat_stream": RouteLimits(
+        max_in_flight=_env_int("ADMISSION_CHAT_STREAM_MAX_IN_FLIGHT", 32),
+        session_rate=_env_float("ADMISSION_CHAT_STREAM_RATE", 0.5),
+        session_burst=_env_int("ADMISSION_CHAT_STREAM_BURST", 5),
+        max_queue=_env_int("ADMISSION_CHAT_STREAM_MAX_QUEUE", 8),
+        queue_timeout=_env_float("ADMISSION_CHAT_STREAM_QUEUE_TIMEOUT", 0.5),
+    ),
+    "session": RouteLimits(
+        max_in_flight=_env_int("ADMISSION_SESSION_MAX_IN_FLIGHT", 16),
+        session_rate=_env_float("ADMISSION_SESSION_RATE", 1.0),
+        session_burst=_env_int("ADMISSION_SESSION_BURST", 10),
+    ),
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed."""
+
+    def __init__(self, route: str, reason: str, retry_after: float):
+        super().__init__(f"{route}: {reason}")
+        self.route = route
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take one token.
+
+        Returns:
+            0 if a token was taken, otherwise seconds until one is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class AdmissionTicket:
+    """Slot held by an admitted request; release exactly once when done."""
+
+    __slots__ = ("_controller", "route", "_released")
+
+    def __init__(self, controller: "AdmissionController", route: str):
+        self._controller = controller
+        self.route = route
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self.route)
+
+
+class AdmissionController:
+    """Global and per-route in-flight caps plus per-session token buckets."""
+
+    def __init__(
+        self,
+        routes: Dict[str, RouteLimits] = ROUTE_LIMITS,
+        global_max_in_flight: int = ADMISSION_GLOBAL_MAX_IN_FLIGHT,
+        max_tracked_sessions: int = ADMISSION_MAX_TRACKED_SESSIONS
+    ):
+        self.routes = routes
+        self.global_max_in_flight = global_max_in_flight
+        self.max_tracked_sessions = max_tracked_sessions
+        self.in_flight = 0
+        self.route_in_flight: Dict[str, int] = {route: 0 for route in routes}
+        self.route_waiting: Dict[str, int] = {route: 0 for route in routes}
+        self.admitted: Dict[str, int] = {route: 0 for route in routes}
+        self.shed: Dict[str, Dict[str, int]] = {route: {} for route in routes}
+        self._buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+        self._slot_freed = asyncio.Condition()
+
+    def _bucket(self, route: str, session_key: str) -> TokenBucket:
+        key = (route, session_key)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limits = self.routes[route]
+            bucket = self._buckets[key] = TokenBucket(limits.session_rate, limits.session_burst)
+            while len(self._buckets) > self.max_tracked_sessions:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _has_slot(self, route: str) -> bool:
+        return (
+            self.in_flight < self.global_max_in_flight
+            and self.route_in_flight[route] < self.routes[route].max_in_flight
+        )
+
+    def _reject(self, route: str, reason: str, retry_after: float):
+        self.shed[route][reason] = self.shed[route].get(reason, 0) + 1
+        raise AdmissionRejected(route, reason, retry_after)
+
+    async def acquire(self, route: str, session_key: str) -> AdmissionTicket:
+        """
+        Admit a request or shed it.
+
+        Args:
+            route: Route name (chat, chat_stream, session)
+            session_key: Session ID, or client address when there is none
+
+        Returns:
+            Ticket to release when the request finishes
+
+        Raises:
+            AdmissionRejected: If the request is shed
+        """
+        limits = self.routes[route]
+
+        if not ADMISSION_ENABLED:
+            self.admitted[route] += 1
+            return AdmissionTicket(self, route)
+
+        wait = self._bucket(route, session_key).take()
+        if wait > 0:
+            self._reject(route, "rate_limited", wait)
+
+        if not self._has_slot(route):
+            if self.route_waiting[route] >= limits.max_queue or limits.queue_timeout <= 0:
+                self._reject(route, "over_capacity", 1.0)
+
+            # Short bounded wait for a slot, never an unbounded queue
+            self.route_waiting[route] += 1
+            try:
+                async with self._slot_freed:
+                    await asyncio.wait_for(
+                        self._slot_freed.wait_for(lambda: self._has_slot(route)),
+                        timeout=limits.queue_timeout
+                    )
+            except asyncio.TimeoutError:
+                self._reject(route, "queue_timeout", 1.0)
+            finally:
+                self.route_waiting[route] -= 1
+
+        self.in_flight += 1
+        self.route_in_flight[route] += 1
+        self.admitted[route] += 1
+        return AdmissionTicket(self, route)
+
+    def _release(self, route: str):
+        self.in_flight -= 1
+        self.route_in_flight[route] -= 1
+        asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self._slot_freed:
+            self._slot_freed.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """In-flight, queue depth and shed counts for health reporting."""
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.global_max_in_flight,
+            "queue_depth": sum(self.route_waiting.values()),
+            "tracked_sessions": len(self._buckets),
+            "routes": {
+                route: {
+                    "in_flight": self.route_in_flight[route],
+                    "max_in_flight": limits.max_in_flight,
+                    "queue_depth": self.route_waiting[route],
+                    "admitted": self.admitted[route],
+                    "shed": dict(self.shed[route]),
+                    "shed_total": sum(self.shed[route].values()),
+                }
+                for route, limits in self.routes.items()
+            },
+        }
+
+
+def retry_after_header(error: AdmissionRejected) -> Dict[str, str]:
+    """Retry-After header for a shed request."""
+    return {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+
+
+# Global controller instance
+_admission_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the admission controller instance."""
+    global _admission_controller
+    if _admission_controller is None:
+        _admission_controller = AdmissionController()
+    return _admission_controller
@@ -1,19 +1,22 @@
 """
-AI Agent Service - Using Google Gemini directly for AI responses.
+AI Agent Service - Runs the furniture consultant through a pluggable LLM provider.
 Phase 13: Direct Gemini Integration
 """
 
 import os
 import json
 import asyncio
-from typing import Dict, Any, Optional, List
-from google.genai import types
-from google.genai import Client
+import logging
+from typing import Dict, Any, Optional, List, AsyncIterator
+
+from services.llm import LLMResponse, ToolCall, get_llm_provider
+from services.resilience import CircuitOpenError, FALLBACK_MESSAGE, get_fallback_cache
+
+logger = logging.getLogger(__name__)
 
 # Configuration
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
-# Use just the model name without the provider prefix
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash").replace("gemini/", "")
+AGENT_TOOLS_ENABLED = os.getenv("AGENT_TOOLS_ENABLED", "false").lower() == "true"
+MAX_TOOL_ROUNDS = int(os.getenv("AGENT_MAX_TOOL_ROUNDS", 3))
 
 # Import MCP services
 from services.sanity_mcp import (
@@ -23,7 +26,8 @@ from services.sanity_mcp import (
     get_products_by_category_tool as sanity_get_products_by_category,
     search_products_filtered as sanity_search_products_filtered,
     get_categories as sanity_get_categories,
-    get_featured as sanity_get_featured
+    get_featured as sanity_get_featured,
+    start_lookup_scope
 )
 
 from services.database_mcp import (
@@ -58,19 +62,132 @@ Sony Interior is a premium furniture store offering high-quality, modern furnitu
 - Use bullet points for multiple options
 - Be concise but informative
 
-IMPORTANT: You have access to search product information from Sanity CMS. When customers ask about products, use your knowledge about furniture to provide helpful responses. If you need specific product details, suggest they browse the website or ask about specific items."""
+IMPORTANT: You have access to search product information from Sanity CMS. """
+
+if AGENT_TOOLS_ENABLED:
+    SYSTEM_PROMPT += "When customers ask about products, use your tools to look up current products, prices and stock. If you cannot find specific product details, suggest they browse the website or ask about specific items."
+else:
+    SYSTEM_PROMPT += "When customers ask about products, use your knowledge about furniture to provide helpful responses. If you need specific product details, suggest they browse the website or ask about specific items."
+
+
+# Tools the model may call, keyed by function name
+AGENT_TOOLS = [
+    sanity_search_products,
+    sanity_get_product_details,
+    sanity_get_product_by_slug,
+    sanity_get_products_by_category,
+    sanity_search_products_filtered,
+    sanity_get_categories,
+    sanity_get_featured,
+    db_check_inventory,
+]
+TOOLS_BY_NAME = {tool.__name__: tool for tool in AGENT_TOOLS}
+
+
+async def execute_tool_call(call: ToolCall) -> str:
+    """Execute a tool requested by the model and return its output."""
+    tool = TOOLS_BY_NAME.get(call.name)
+    if tool is None:
+        return json.dumps({"error": f"Unknown tool: {call.name}"})
+    try:
+        return await tool(**call.args)
+    except Exception as e:
+        return json.dumps({"error": f"Tool {call.name} failed: {e}"})
+
+
+def build_messages(
+    user_message: str,
+    page_context: Optional[str] = None,
+    selected_text: Optional[str] = None,
+    chat_history: Optional[List[Dict[str, Any]]] = None,
+    extra_context: Optional[str] = None,
+    summary: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Build the provider-neutral message list for a query.
+
+    With a conversation summary, `chat_history` is expected to hold only the
+    turns after the summarized prefix and is sent in full; without one, the
+    last five messages are sent.
+    """
+    # Build context
+    context_parts = []
+    if summary:
+        context_parts.append(f"Summary of the earlier conversation: {summary}")
+    if page_context:
+        context_parts.append(f"User is currently on page: {page_context}")
+    if selected_text:
+        context_parts.append(f"User selected this text: {selected_text}")
+    if extra_context:
+        context_parts.append(extra_context)
+
+    context_info = "\n".join(context_parts)
+
+    # Build chat history for context
+    messages = []
+    if chat_history and len(chat_history) > 0:
+        for msg in (chat_history if summary else chat_history[-5:]):
+            role = "user" if msg.get("role") == "user" else "assistant"
+            messages.append({"role": role, "content": msg.get("content", "")})
+
+    # Initial message with context
+    user_content = user_message
+    if context_info:
+        user_content = f"{context_info}\n\nUser message: {user_message}"
+
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+
+def fallback_answer(
+    user_message: str,
+    session_id: Optional[str],
+    page_context: Optional[str],
+    error: str
+) -> Dict[str, Any]:
+    """Answer from recent responses when the model cannot be reached."""
+    cached = get_fallback_cache().get(user_message, page_context)
+    if cached is not None:
+        return {"response": cached, "session_id": session_id, "success": True, "error": None}
+    return {"response": FALLBACK_MESSAGE, "session_id": session_id, "success": False, "error": error}
 
 
-# Global client
-_gemini_client: Optional[Client] = None
+def _answer_is_shareable(
+    selected_text: Optional[str],
+    chat_history: Optional[List[Dict[str, Any]]],
+    summary: Optional[str]
+) -> bool:
+    """Whether an answer depends only on the message and page, so other sessions may be served it."""
+    return not selected_text and not chat_history and not summary
 
 
-async def get_gemini_client() -> Client:
-    """Get or create Gemini client."""
-    global _gemini_client
-    if _gemini_client is None:
-        _gemini_client = Client(api_key=GEMINI_API_KEY)
-    return _gemini_client
+def _new_usage(model: str) -> Dict[str, Any]:
+    """Empty usage record for one agent query."""
+    return {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "model_latency_ms": 0.0,
+        "model_calls": 0,
+        "model": model
+    }
+
+
+def _add_usage(usage: Dict[str, Any], response: LLMResponse):
+    """Accumulate a model call's token counts and latency into a usage record."""
+    usage["prompt_tokens"] += response.usage.prompt_tokens
+    usage["completion_tokens"] += response.usage.completion_tokens
+    usage["cached_tokens"] += response.usage.cached_tokens
+    usage["model_latency_ms"] += response.latency_ms
+    usage["model_calls"] += 1
+
+
+async def _resolve_tool_calls(messages: List[Dict[str, Any]], response: LLMResponse):
+    """Append a tool-calling turn and the tool results to the messages."""
+    messages.append({"role": "assistant", "content": response.text, "tool_calls": response.tool_calls})
+    results = await asyncio.gather(*(execute_tool_call(call) for call in response.tool_calls))
+    for call, result in zip(response.tool_calls, results):
+        messages.append({"role": "tool", "name": call.name, "content": result})
 
 
 async def run_agent_query(
@@ -78,72 +195,61 @@ async def run_agent_query(
     session_id: Optional[str] = None,
     page_context: Optional[str] = None,
     selected_text: Optional[str] = None,
-    chat_history: Optional[List[Dict[str, Any]]] = None
+    chat_history: Optional[List[Dict[str, Any]]] = None,
+    extra_context: Optional[str] = None,
+    summary: Optional[str] = None
 ) -> Dict[str, Any]:
-    """Run the agent with a user query using Gemini API."""
+    """Run the agent with a user query using the configured LLM provider."""
+    # Product lookups made by this turn's tool calls are batched and memoized
+    start_lookup_scope()
     try:
-        client = await get_gemini_client()
-
-        # Build context
-        context_parts = []
-        if page_context:
-            context_parts.append(f"User is currently on page: {page_context}")
-        if selected_text:
-            context_parts.append(f"User selected this text: {selected_text}")
-
-        context_info = "\n".join(context_parts)
-
-        # Build chat history for context
-        history_messages = []
-        if chat_history and len(chat_history) > 0:
-            for msg in chat_history[-5:]:
-                role = "user" if msg.get("role") == "user" else "model"
-                history_messages.append(
-                    types.Content(
-                        role=role,
-                        parts=[types.Part(text=msg.get("content", ""))]
-                    )
-                )
-
-        # Initial message with context
-        user_content = user_message
-        if context_info:
-            user_content = f"{context_info}\n\nUser message: {user_message}"
-
-        contents = history_messages + [
-            types.Content(
-                role="user",
-                parts=[types.Part(text=user_content)]
-            )
-        ]
+        provider = get_llm_provider()
+        messages = build_messages(
+            user_message, page_context, selected_text, chat_history, extra_context, summary
+        )
+        tools = AGENT_TOOLS if AGENT_TOOLS_ENABLED else None
+        usage = _new_usage(provider.model)
 
-        # Make the API call with system instruction in config
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=contents,
-            config=types.GenerateContentConfig(
+        response = await provider.generate(
+            messages,
+            system_instruction=SYSTEM_PROMPT,
+            temperature=0.7,
+            max_output_tokens=2048,
+            tools=tools
+        )
+        _add_usage(usage, response)
+
+        # Let the model call tools until it produces a final answer
+        rounds = 0
+        while response.tool_calls and rounds < MAX_TOOL_ROUNDS:
+            await _resolve_tool_calls(messages, response)
+            rounds += 1
+            response = await provider.generate(
+                messages,
                 system_instruction=SYSTEM_PROMPT,
                 temperature=0.7,
                 max_output_tokens=2048,
+                tools=tools if rounds < MAX_TOOL_ROUNDS else None
             )
-        )
+            _add_usage(usage, response)
 
-        # Extract response
-        final_response = ""
-        if response.candidates and response.candidates[0].content.parts:
-            final_response = response.candidates[0].content.parts[0].text
+        if response.text and _answer_is_shareable(selected_text, chat_history, summary):
+            get_fallback_cache().put(user_message, page_context, response.text)
 
         return {
-            "response": final_response,
+            "response": response.text,
             "session_id": session_id,
             "success": True,
-            "error": None
+            "error": None,
+            "usage": usage
         }
 
+    except CircuitOpenError as e:
+        # Fail fast while the model is unavailable
+        return fallback_answer(user_message, session_id, page_context, str(e))
+
     except Exception as e:
-        print(f"Agent error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Agent query failed")
         return {
             "response": "I apologize, but I encountered an error processing your request. Please try again.",
             "session_id": session_id,
@@ -152,6 +258,51 @@ async def run_agent_query(
         }
 
 
+async def stream_agent_query(
+    user_message: str,
+    session_id: Optional[str] = None,
+    page_context: Optional[str] = None,
+    selected_text: Optional[str] = None,
+    chat_history: Optional[List[Dict[str, Any]]] = None,
+    summary: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Run the agent and yield response text as the model produces it.
+
+    Tool calls are resolved between streamed rounds; only text is yielded.
+    """
+    start_lookup_scope()
+    provider = get_llm_provider()
+    messages = build_messages(user_message, page_context, selected_text, chat_history, summary=summary)
+    tools = AGENT_TOOLS if AGENT_TOOLS_ENABLED else None
+
+    for rounds in range(MAX_TOOL_ROUNDS + 1):
+        text_parts = []
+        tool_calls = []
+        try:
+            async for chunk in provider.stream(
+                messages,
+                system_instruction=SYSTEM_PROMPT,
+                temperature=0.7,
+                max_output_tokens=2048,
+                tools=tools if rounds < MAX_TOOL_ROUNDS else None
+            ):
+                if chunk.text:
+                    text_parts.append(chunk.text)
+                    yield chunk.text
+                tool_calls.extend(chunk.tool_calls)
+        except CircuitOpenError as e:
+            if not text_parts:
+                yield fallback_answer(user_message, session_id, page_context, str(e))["response"]
+            return
+
+        if not tool_calls:
+            if text_parts and _answer_is_shareable(selected_text, chat_history, summary):
+                get_fallback_cache().put(user_message, page_context, "".join(text_parts))
+            return
+        await _resolve_tool_calls(messages, LLMResponse(text="".join(text_parts), tool_calls=tool_calls))
+
+
 # Standalone test function
 async def test_agent():
     """Test the agent with sample queries."""
@@ -0,0 +1,281 @@
+"""
+Autocomplete - Typo-tolerant prefix suggestions over product and category names.
+
+Two indexes over the words of every name:
+- a prefix trie, each node holding the entries with a word starting with that
+  prefix, so exact prefix lookups cost one walk of the typed characters
+- a character bigram index over the vocabulary, used to find candidate words
+  for misspelled terms ("sofaa", "ottomon"), which are then ranked by
+  Damerau-Levenshtein distance. Bigrams rather than trigrams, so short words
+  with a transposition ("nrod" for "nord") still share grams
+
+Every query term must match a word of the entry; the last term is matched as a
+prefix (the user is still typing it). The index is updated in place as catalog
+documents change.
+"""
+
+import heapq
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Set, Tuple, Iterable
+
+from services.search_engine import tokenize
+
+# Misspellings tolerated per term, by term length
+MIN_LENGTH_ONE_TYPO = 4
+MIN_LENGTH_TWO_TYPOS = 8
+
+
+@dataclass
+class Suggestion:
+    """One autocomplete suggestion."""
+    type: str  # product or category
+    id: str
+    name: str
+    slug: Optional[str]
+    distance: int  # total edits needed to match the query
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "type": self.type,
+            "id": self.id,
+            "name": self.name,
+            "slug": self.slug,
+            "distance": self.distance,
+        }
+
+
+def max_typos(term: str) -> int:
+    if len(term) >= MIN_LENGTH_TWO_TYPOS:
+        return 2
+    if len(term) >= MIN_LENGTH_ONE_TYPO:
+        return 1
+    return 0
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Damerau-Levenshtein (optimal string alignment) distance, capped.
+
+    Returns:
+        The distance, or limit + 1 once it is known to exceed `limit`
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _ngrams(word: str) -> Set[str]:
+    padded = f"^{word}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.entries: Set[str] = set()
+
+
+class _Entry:
+    __slots__ = ("kind", "name", "slug", "words", "text", "is_product", "length")
+
+    def __init__(self, kind: str, name: str, slug: Optional[str], words: Tuple[str, ...]):
+        self.kind = kind
+        self.name = name
+        self.slug = slug
+        self.words = words
+        self.text = " ".join(words)
+        self.is_product = kind != "category"
+        self.length = len(name)
+
+
+class AutocompleteIndex:
+    """Prefix trie plus bigram index over name words, updated incrementally."""
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._entries: Dict[str, _Entry] = {}
+        # word -> ids of entries containing it
+        self._words: Dict[str, Set[str]] = {}
+        self._ngrams: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # Maintenance
+
+    def add(self, kind: str, doc: Dict[str, Any]):
+        """Index (or re-index) a product or category document."""
+        doc_id = doc.get("_id")
+        name = doc.get("name")
+        if not doc_id or not name:
+            return
+        self.remove(doc_id)
+        words = tuple(dict.fromkeys(tokenize(name)))
+        self._entries[doc_id] = _Entry(kind, name, doc.get("slug"), words)
+        for word in words:
+            node = self._root
+            for char in word:
+                node = node.children.setdefault(char, _TrieNode())
+                node.entries.add(doc_id)
+            holders = self._words.setdefault(word, set())
+            if not holders:
+                for gram in _ngrams(word):
+                    self._ngrams.setdefault(gram, set()).add(word)
+            holders.add(doc_id)
+
+    def remove(self, doc_id: str):
+        """Drop a document from the index."""
+        entry = self._entries.pop(doc_id, None)
+        if entry is None:
+            return
+        for word in entry.words:
+            node = self._root
+            path = []
+            for char in word:
+                child = node.children.get(char)
+                if child is None:
+                    break
+                child.entries.discard(doc_id)
+                path.append((node, char, child))
+                node = child
+            # Prune branches no entry goes through any more
+            for parent, char, child in reversed(path):
+                if child.entries:
+                    break
+                del parent.children[char]
+
+            holders = self._words.get(word)
+            if holders is not None:
+                holders.discard(doc_id)
+                if not holders:
+                    del self._words[word]
+                    for gram in _ngrams(word):
+                        words = self._ngrams.get(gram)
+                        if words is not None:
+                            words.discard(word)
+                            if not words:
+                                del self._ngrams[gram]
+
+    def update(
+        self,
+        products: Iterable[Dict[str, Any]] = (),
+        categories: Iterable[Dict[str, Any]] = (),
+        removed: Iterable[str] = ()
+    ):
+        """Apply a batch of catalog changes."""
+        for doc_id in removed:
+            self.remove(doc_id)
+        for doc in categories:
+            self.add("category", doc)
+        for doc in products:
+            self.add("product", doc)
+
+    # Lookup
+
+    def _prefix_entries(self, prefix: str) -> Set[str]:
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.entries
+
+    def _term_matches(self, term: str, is_prefix: bool) -> Dict[str, int]:
+        """Entries matching one query term, with the edits needed."""
+        matches: Dict[str, int] = {}
+        if is_prefix:
+            for doc_id in self._prefix_entries(term):
+                matches[doc_id] = 0
+        else:
+            for doc_id in self._words.get(term, ()):
+                matches[doc_id] = 0
+
+        limit = max_typos(term)
+        if limit == 0 or (matches and is_prefix and len(matches) >= 10):
+            return matches
+
+        # Fuzzy candidates: vocabulary words sharing bigrams with the term.
+        # One edit changes at most two bigrams (three for a transposition).
+        # A prefix has no end-of-word bigram.
+        grams = _ngrams(term)
+        if is_prefix:
+            grams.discard(f"{term[-1]}$")
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for word in self._ngrams.get(gram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        min_shared = max(1, len(grams) - 3 * limit)
+
+        for word, count in shared.items():
+            if count < min_shared:
+                continue
+            distance = edit_distance(term, word, limit)
+            if is_prefix and len(word) > len(term):
+                # Still typing: compare against the word's beginning as well
+                distance = min(distance, edit_distance(term, word[:len(term)], limit))
+            if distance > limit:
+                continue
+            for doc_id in self._words[word]:
+                if distance < matches.get(doc_id, limit + 1):
+                    matches[doc_id] = distance
+        return matches
+
+    def suggest(self, query: str, limit: int = 8, kinds: Optional[Set[str]] = None) -> List[Suggestion]:
+        """
+        Suggest products and categories for a partially typed query.
+
+        Args:
+            query: Text typed so far
+            limit: Maximum suggestions
+            kinds: Restrict to "product" and/or "category"
+
+        Returns:
+            Suggestions, fewest edits first, then categories before products,
+            then names starting with the query, then shorter names
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        scores: Optional[Dict[str, int]] = None
+        for i, term in enumerate(terms):
+            matches = self._term_matches(term, is_prefix=i == len(terms) - 1)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {k: scores[k] + d for k, d in matches.items() if k in scores}
+            if not scores:
+                return []
+
+        query_text = " ".join(terms)
+        entries = self._entries
+
+        def rank(doc_id: str):
+            entry = entries[doc_id]
+            return (
+                scores[doc_id],
+                entry.is_product,
+                not entry.text.startswith(query_text),
+                entry.length,
+                entry.name,
+            )
+
+        candidates = [k for k in scores if entries[k].kind in kinds] if kinds else scores
+        return [
+            Suggestion(entries[k].kind, k, entries[k].name, entries[k].slug, scores[k])
+            for k in heapq.nsmallest(limit, candidates, key=rank)
+        ]
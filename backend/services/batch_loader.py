@@ -0,0 +1,86 @@
+"""
+Batch Loader - DataLoader-style batching of keyed lookups.
+
+Every `load(key)` made within one event-loop tick is collected and resolved by
+a single call to the batch function, with duplicate keys sent once. A loader
+created with `memoize=True` also remembers each key's result for its lifetime,
+so it should live no longer than one request.
+"""
+
+import asyncio
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Hashable
+
+
+BatchFunction = Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+
+
+class BatchLoader:
+    """Coalesces keyed lookups into batched calls."""
+
+    def __init__(self, batch_fn: BatchFunction, max_batch_size: int = 100, memoize: bool = True):
+        """
+        Args:
+            batch_fn: Coroutine taking a list of unique keys and returning a
+                dict of key -> value; keys missing from the dict resolve to None
+            max_batch_size: Maximum keys per batch_fn call
+            memoize: Remember results per key for the loader's lifetime
+        """
+        self._batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.memoize = memoize
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._memo: Dict[Hashable, asyncio.Future] = {}
+        self._dispatch_scheduled = False
+        self.loads = 0
+        self.batches = 0
+
+    async def load(self, key: Hashable) -> Any:
+        """Load one key, batched with every other load made in the same tick."""
+        self.loads += 1
+        future = self._memo.get(key) or self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if self.memoize:
+                self._memo[key] = future
+            if not self._dispatch_scheduled:
+                self._dispatch_scheduled = True
+                loop.call_soon(self._dispatch)
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: List[Hashable]) -> List[Any]:
+        """Load several keys in one batch."""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        self._dispatch_scheduled = False
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = {key: pending[key] for key in keys[start:start + self.max_batch_size]}
+            asyncio.ensure_future(self._run_batch(chunk))
+
+    async def _run_batch(self, batch: Dict[Hashable, asyncio.Future]):
+        self.batches += 1
+        try:
+            results = await self._batch_fn(list(batch))
+        except Exception as e:
+            for key, future in batch.items():
+                # Failures are not memoized; the next load retries
+                self._memo.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()
+            return
+
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+    def clear(self, key: Optional[Hashable] = None):
+        """Forget memoized results (one key, or all)."""
+        if key is None:
+            self._memo.clear()
+        else:
+            self._memo.pop(key, None)
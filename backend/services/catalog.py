@@ -0,0 +1,423 @@
+"""
+Catalog Replica - In-memory indexed copy of the Sanity product catalog.
+
+The catalog is small and changes rarely, so instead of sending every agent tool
+call to Sanity, the full catalog is synced at startup and refreshed
+incrementally (by `_updatedAt`) in the background. Queries are answered from
+in-memory indexes:
+- dicts by `_id` and slug
+- the featured product list
+- bitset category, facet, price and text indexes for filtered search and
+  keyset-paginated listings (see search_engine.py)
+- a typo-tolerant autocomplete index, updated incrementally (see autocomplete.py)
+
+Results use the same shapes as the GROQ projections in SanityMCPServer.
+"""
+
+import os
+import json
+import base64
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Tuple
+
+from services.search_engine import FacetedSearchIndex, sort_key
+from services.autocomplete import AutocompleteIndex
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CATALOG_REPLICA_ENABLED = os.getenv("CATALOG_REPLICA_ENABLED", "true").lower() == "true"
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", 60))  # seconds
+
+# Full product document, as returned by get_product_by_id plus sync bookkeeping
+PRODUCT_SYNC_PROJECTION = """{
+    _id,
+    _type,
+    _createdAt,
+    _updatedAt,
+    name,
+    "slug": slug.current,
+    description,
+    shortDescription,
+    price,
+    compareAtPrice,
+    "category": category->{
+        _id,
+        name,
+        "slug": slug.current
+    },
+    mainImage{
+        asset->{
+            _id,
+            url
+        },
+        alt
+    },
+    images[]{
+        asset->{
+            _id,
+            url
+        },
+        alt
+    },
+    dimensions,
+    materials,
+    colors,
+    stockStatus,
+    sku,
+    weight,
+    warranty,
+    careInstructions,
+    featured
+}"""
+
+CATEGORY_SYNC_PROJECTION = """{
+    _id,
+    _updatedAt,
+    name,
+    "slug": slug.current,
+    description,
+    "imageUrl": image.asset->url
+}"""
+
+# Fields removed from documents before returning them
+_SYNC_FIELDS = ("_createdAt", "_updatedAt")
+
+# Fields of the product list projection used by most queries
+SUMMARY_FIELDS = (
+    "_id", "name", "slug", "shortDescription", "price", "compareAtPrice",
+    "category", "imageUrl", "stockStatus", "featured"
+)
+
+
+def product_detail(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Full product shape (get_product_by_id / get_product_by_slug)."""
+    return {k: v for k, v in doc.items() if k not in _SYNC_FIELDS}
+
+
+def product_summary(doc: Dict[str, Any], extra_fields: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """Product list shape, with category name and main image URL flattened."""
+    category = doc.get("category")
+    main_image = doc.get("mainImage") or {}
+    flattened = {
+        "category": category.get("name") if isinstance(category, dict) else category,
+        "imageUrl": (main_image.get("asset") or {}).get("url"),
+    }
+    summary = {}
+    for field in SUMMARY_FIELDS + extra_fields:
+        summary[field] = flattened[field] if field in flattened else doc.get(field)
+    return summary
+
+
+def _newest_first(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(docs, key=sort_key, reverse=True)
+
+
+# Keyset pagination cursors
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque cursor positioned after a document in (_createdAt, _id) order."""
+    payload = json.dumps([doc.get("_createdAt") or "", doc.get("_id") or ""], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a cursor from encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(created_at, str) or not isinstance(doc_id, str):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return created_at, doc_id
+
+
+class CatalogIndexes:
+    """Immutable set of indexes built from one snapshot of the catalog."""
+
+    def __init__(self, products: Dict[str, Dict[str, Any]], categories: Dict[str, Dict[str, Any]]):
+        self.by_id = products
+        self.by_slug = {d["slug"]: d for d in products.values() if d.get("slug")}
+
+        # All lists are kept newest first, matching `order(_createdAt desc, _id desc)`
+        self.newest = _newest_first(list(products.values()))
+        self.featured = [d for d in self.newest if d.get("featured") is True]
+
+        self.categories = sorted(categories.values(), key=lambda c: c.get("name") or "")
+        self.search = FacetedSearchIndex(self.newest)
+
+
+class CatalogReplica:
+    """In-memory catalog kept in sync with Sanity."""
+
+    def __init__(self, fetch: Callable[..., Awaitable[Any]]):
+        """
+        Args:
+            fetch: Coroutine executing a GROQ query against the Sanity API,
+                raising on API errors so a failed sync is never mistaken
+                for an empty catalog
+        """
+        self._fetch = fetch
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._categories: Dict[str, Dict[str, Any]] = {}
+        self.indexes: Optional[CatalogIndexes] = None
+        self.autocomplete = AutocompleteIndex()
+        self.version: Optional[str] = None
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.indexes is not None
+
+    def add_listener(self, callback: Callable[[List[str], List[str]], None]):
+        """
+        Register a callback run after each sync with (changed_ids, removed_ids).
+
+        A full sync reports every document as changed.
+        """
+        self._listeners.append(callback)
+
+    def _rebuild(self, changed: List[str], removed: List[str]):
+        self.indexes = CatalogIndexes(dict(self._products), dict(self._categories))
+        self.autocomplete.update(
+            products=[self._products[i] for i in changed if i in self._products],
+            categories=[self._categories[i] for i in changed if i in self._categories],
+            removed=removed
+        )
+        stamps = [d.get("_updatedAt") or "" for d in self._products.values()]
+        stamps += [c.get("_updatedAt") or "" for c in self._categories.values()]
+        self.version = max(stamps) if stamps else None
+        for callback in self._listeners:
+            try:
+                callback(changed, removed)
+            except Exception as e:
+                logger.warning(f"Catalog listener failed: {e}")
+
+    async def full_sync(self):
+        """Load the whole catalog."""
+        async with self._lock:
+            products = await self._fetch(f'*[_type == "product"] {PRODUCT_SYNC_PROJECTION}')
+            categories = await self._fetch(f'*[_type == "category"] {CATEGORY_SYNC_PROJECTION}')
+            if not isinstance(products, list) or not isinstance(categories, list):
+                raise RuntimeError("Catalog sync returned an unexpected result")
+
+            synced_ids = {p["_id"] for p in products} | {c["_id"] for c in categories}
+            removed = [i for i in list(self._products) + list(self._categories) if i not in synced_ids]
+            self._products = {p["_id"]: p for p in products}
+            self._categories = {c["_id"]: c for c in categories}
+            self._rebuild(list(self._products) + list(self._categories), removed)
+            logger.info(f"Catalog replica synced: {len(products)} products, {len(categories)} categories")
+
+    async def refresh(self):
+        """Apply changes made since the last sync."""
+        if not self.ready:
+            await self.full_sync()
+            return
+
+        async with self._lock:
+            since = self.version or ""
+            changed_categories = await self._fetch(
+                f'*[_type == "category" && _updatedAt > $since] {CATEGORY_SYNC_PROJECTION}',
+                {"since": since}
+            )
+            category_ids = await self._fetch('*[_type == "category"]._id')
+
+        if not category_ids and self._categories:
+            # Treat an empty or failed listing as a transient error, not a wipe
+            return
+
+        # Products embed their category's name, so category edits need a full pass
+        if changed_categories or set(category_ids) != set(self._categories):
+            await self.full_sync()
+            return
+
+        async with self._lock:
+            changed = await self._fetch(
+                f'*[_type == "product" && _updatedAt > $since] {PRODUCT_SYNC_PROJECTION}',
+                {"since": since}
+            )
+            current_ids = set(await self._fetch('*[_type == "product"]._id') or [])
+            if not isinstance(changed, list) or (not current_ids and self._products):
+                return
+
+            removed = [i for i in self._products if i not in current_ids]
+            if not changed and not removed:
+                return
+
+            for doc in changed:
+                self._products[doc["_id"]] = doc
+            for product_id in removed:
+                self._products.pop(product_id, None)
+            self._rebuild([d["_id"] for d in changed], removed)
+            logger.info(f"Catalog replica refreshed: {len(changed)} changed, {len(removed)} removed")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Catalog refresh failed: {e}")
+            await asyncio.sleep(CATALOG_REFRESH_INTERVAL)
+
+    def start(self):
+        """Start background sync (the first pass is a full sync)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop background sync."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # Queries - same output shapes as the SanityMCPServer GROQ projections
+
+    def get_product_by_id(self, product_id: str) -> Optional[Dict[str, Any]]:
+        doc = self.indexes.by_id.get(product_id)
+        return product_detail(doc) if doc else None
+
+    def get_product_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
+        doc = self.indexes.by_slug.get(slug)
+        return product_detail(doc) if doc else None
+
+    def search_products_by_name(self, name: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Typo-tolerant product name search.
+
+        Falls back to the products of the best matching category when no
+        product name matches (e.g. "sofaa" lists sofas).
+        """
+        suggestions = self.autocomplete.suggest(name, limit)
+        product_ids = [s.id for s in suggestions if s.type == "product"]
+        if product_ids:
+            return [product_summary(self.indexes.by_id[i]) for i in product_ids if i in self.indexes.by_id]
+
+        categories = [s for s in suggestions if s.type == "category"]
+        if categories:
+            return self.get_products_by_category(categories[0].name, limit)
+        return []
+
+    def suggest(self, query: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """Autocomplete suggestions for product and category names."""
+        return [s.to_dict() for s in self.autocomplete.suggest(query, limit)]
+
+    def get_products_by_category(
+        self,
+        category_name: str,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        return self.products_page(category=category_name, limit=limit, cursor=cursor)["products"]
+
+    def search_products_by_filter(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        materials: Optional[List[str]] = None,
+        in_stock_only: bool = False,
+        featured_only: bool = False,
+        limit: int = 20,
+        query: Optional[str] = None,
+        colors: Optional[List[str]] = None,
+        cursor: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        return self.products_page(
+            query=query, category=category, min_price=min_price, max_price=max_price,
+            materials=materials, colors=colors, in_stock_only=in_stock_only,
+            featured_only=featured_only, limit=limit, cursor=cursor,
+            extra_fields=("materials", "dimensions")
+        )["products"]
+
+    def products_page(
+        self,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        extra_fields: Tuple[str, ...] = (),
+        **filters
+    ) -> Dict[str, Any]:
+        """
+        One page of a filtered listing in (_createdAt, _id) descending order.
+
+        Args:
+            limit: Page size
+            cursor: Cursor from the previous page's next_cursor
+            extra_fields: Fields added to the product list shape
+            **filters: Search filters (see FacetedSearchIndex.match)
+
+        Returns:
+            Dict with products and next_cursor (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        result = self.indexes.search.search(
+            limit=limit,
+            facets=False,
+            after=decode_cursor(cursor) if cursor else None,
+            relevance=False,
+            **filters
+        )
+        return {
+            "products": [product_summary(d, extra_fields) for d in result.docs],
+            "next_cursor": encode_cursor(result.docs[-1]) if result.has_more and result.docs else None,
+        }
+
+    def search_products_faceted(
+        self,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        materials: Optional[List[str]] = None,
+        colors: Optional[List[str]] = None,
+        in_stock_only: bool = False,
+        featured_only: bool = False,
+        limit: int = 20,
+        facets: bool = True
+    ) -> Dict[str, Any]:
+        """Filtered search with total match count and facet counts."""
+        result = self.indexes.search.search(
+            limit=limit,
+            facets=facets,
+            query=query,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            materials=materials,
+            colors=colors,
+            in_stock_only=in_stock_only,
+            featured_only=featured_only
+        )
+        return {
+            "products": [product_summary(d, ("materials", "dimensions")) for d in result.docs],
+            "total": result.total,
+            "facets": result.facets,
+        }
+
+    def get_all_categories(self) -> List[Dict[str, Any]]:
+        return [
+            {k: v for k, v in c.items() if k not in _SYNC_FIELDS}
+            for c in self.indexes.categories
+        ]
+
+    def get_featured_products(self, limit: int = 6) -> List[Dict[str, Any]]:
+        return [product_summary(d) for d in self.indexes.featured[:limit]]
+
+    def get_all_product_slugs(self) -> List[str]:
+        return [d["slug"] for d in self.indexes.newest if d.get("slug")]
@@ -4,20 +4,86 @@ Phase 12: MCP Server Development
 """
 
 import os
+import time
 import asyncio
-import json
-from typing import Dict, Any, Optional, List
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, Iterable
 import asyncpg
 
+from database.codecs import register_codecs
+from database.operations import fetch_chat_history, fetch_latest_messages
+from database.replicas import get_replica_router
+from utils.json_codec import dumps, loads
+from services.batch_loader import BatchLoader
+from services.tool_encoding import encode_tool_result
+from services.http_cache import CachePolicy, aiohttp_cache_middleware
+
 # Configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "")
 
+# In-process inventory cache. Writes through update_inventory invalidate it;
+# the TTL bounds staleness from writes made by other processes.
+INVENTORY_CACHE_TTL = float(os.getenv("INVENTORY_CACHE_TTL", 30))
+INVENTORY_CACHE_MAX_ENTRIES = int(os.getenv("INVENTORY_CACHE_MAX_ENTRIES", 5000))
+
+# Stock statuses a product can be ordered in
+STOCK_AVAILABLE = ("in-stock", "low-stock")
+
+
+def _inventory_record(row) -> Dict[str, Any]:
+    return {
+        "product_id": row["product_id"],
+        "stock_status": row["stock_status"],
+        "quantity": row["quantity"],
+        "available": row["stock_status"] in STOCK_AVAILABLE,
+        "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None
+    }
+
+
+class InventoryCache:
+    """TTL cache of inventory records by product ID."""
+
+    def __init__(self, ttl: float = INVENTORY_CACHE_TTL, max_entries: int = INVENTORY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get_many(self, product_ids: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """
+        Returns:
+            Tuple of (cached records by product ID, IDs to look up)
+        """
+        now = time.monotonic()
+        found, missing = {}, []
+        for product_id in dict.fromkeys(product_ids):
+            entry = self._entries.get(product_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                found[product_id] = entry[1]
+            else:
+                missing.append(product_id)
+        return found, missing
+
+    def put_many(self, records: Dict[str, Dict[str, Any]]):
+        now = time.monotonic()
+        for product_id, record in records.items():
+            self._entries.pop(product_id, None)
+            self._entries[product_id] = (now, record)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, product_ids: Iterable[str]):
+        for product_id in product_ids:
+            self._entries.pop(product_id, None)
+
 
 class DatabaseMCPServer:
     """MCP Server for Neon database queries."""
 
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        self.inventory_cache = InventoryCache()
+        # Stock checks made in the same tick (parallel tool calls) share a query
+        self._stock_loader = BatchLoader(self.check_inventory_many, memoize=False)
 
     async def connect(self):
         """Initialize database connection pool."""
@@ -25,7 +91,9 @@ class DatabaseMCPServer:
             self.pool = await asyncpg.create_pool(
                 DATABASE_URL,
                 min_size=2,
-                max_size=10
+                max_size=10,
+                # json/jsonb and vector values as Python objects
+                init=register_codecs
             )
             print("Database connection pool initialized")
 
@@ -41,11 +109,20 @@ class DatabaseMCPServer:
             await self.connect()
 
         async with self.pool.acquire() as conn:
-            if query.strip().upper().startswith("SELECT"):
+            if query.strip().upper().startswith("SELECT") or "RETURNING" in query.upper():
                 return await conn.fetch(query, *args)
             else:
                 return await conn.execute(query, *args)
 
+    async def _fetch_read(self, query: str, *args, fresh: bool = False) -> List[asyncpg.Record]:
+        """Run a read-only query on a read replica, falling back to the primary."""
+        if not self.pool:
+            await self.connect()
+
+        return await get_replica_router().run(
+            lambda conn: conn.fetch(query, *args), fresh=fresh, primary=self.pool
+        )
+
     async def check_product_stock(self, product_id: str) -> Optional[Dict[str, Any]]:
         """
         Check stock status for a product.
@@ -54,65 +131,157 @@ class DatabaseMCPServer:
             product_id: Product ID to check
 
         Returns:
-            Stock information or None
+            Stock information
         """
-        # First check product_embeddings table
-        result = await self._execute(
-            """
-            SELECT source_id, metadata
-            FROM document_embeddings
-            WHERE source_type = 'product' AND source_id = $1
-            LIMIT 1
-            """,
-            product_id
-        )
+        return await self._stock_loader.load(product_id)
 
-        if result:
-            return {
-                "product_id": product_id,
-                "stock_status": result[0].get("metadata", {}).get("stock_status", "unknown"),
-                "available": True
-            }
+    async def check_inventory_many(self, product_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Check stock for several products with one query.
 
-        return {
-            "product_id": product_id,
-            "stock_status": "unknown",
-            "available": False,
-            "message": "Product not found in database"
-        }
+        Cached entries are served without a query; the rest are read with a
+        single `= ANY($1)` lookup on the inventory primary key.
+
+        Args:
+            product_ids: Product IDs to check
+
+        Returns:
+            Stock information by product ID (products without an inventory
+            row are reported as unknown)
+        """
+        stock, missing = self.inventory_cache.get_many(product_ids)
+        if missing:
+            rows = await self._execute(
+                """
+                SELECT product_id, stock_status, quantity, updated_at
+                FROM inventory
+                WHERE product_id = ANY($1::text[])
+                """,
+                missing
+            )
+            found = {r["product_id"]: _inventory_record(r) for r in rows}
+            for product_id in missing:
+                found.setdefault(product_id, {
+                    "product_id": product_id,
+                    "stock_status": "unknown",
+                    "available": False,
+                    "message": "Product not found in inventory"
+                })
+            self.inventory_cache.put_many(found)
+            stock.update(found)
+        return stock
+
+    async def update_inventory(self, items: List[Dict[str, Any]]) -> int:
+        """
+        Bulk update stock levels.
 
-    async def get_chat_history(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        Rows are streamed with COPY into a temporary staging table and merged
+        into inventory with one upsert, so a full stock feed is a single round
+        trip instead of one statement per product. Cached entries for the
+        products are invalidated.
+
+        Args:
+            items: Dicts with product_id, stock_status and quantity
+
+        Returns:
+            Number of inventory rows inserted or changed
+        """
+        if not items:
+            return 0
+        if not self.pool:
+            await self.connect()
+
+        # Last entry wins for repeated products
+        latest = {item["product_id"]: item for item in items}
+        records = [
+            (product_id, item["stock_status"], int(item.get("quantity") or 0))
+            for product_id, item in latest.items()
+        ]
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    CREATE TEMP TABLE inventory_staging (
+                        product_id TEXT,
+                        stock_status VARCHAR(20),
+                        quantity INTEGER
+                    ) ON COMMIT DROP
+                    """
+                )
+                await conn.copy_records_to_table(
+                    "inventory_staging",
+                    records=records,
+                    columns=["product_id", "stock_status", "quantity"]
+                )
+                status = await conn.execute(
+                    """
+                    INSERT INTO inventory (product_id, stock_status, quantity, updated_at)
+                    SELECT product_id, stock_status, quantity, NOW()
+                    FROM inventory_staging
+                    ON CONFLICT (product_id) DO UPDATE SET
+                        stock_status = EXCLUDED.stock_status,
+                        quantity = EXCLUDED.quantity,
+                        updated_at = EXCLUDED.updated_at
+                    WHERE (inventory.stock_status, inventory.quantity)
+                        IS DISTINCT FROM (EXCLUDED.stock_status, EXCLUDED.quantity)
+                    """
+                )
+
+        self.inventory_cache.invalidate(latest.keys())
+        return int(status.split()[-1])
+
+    async def get_chat_history(
+        self,
+        session_id: str,
+        limit: int = 50,
+        since: Optional[str] = None,
+        before: Optional[str] = None,
+        latest: bool = False,
+        fresh: bool = False
+    ) -> List[Dict[str, Any]]:
         """
         Get chat message history for a session.
 
+        Pages are keyed on (created_at, message_id); every message carries
+        the `cursor` to continue from.
+
         Args:
             session_id: Chat session ID
             limit: Maximum messages to return
+            since: Only messages after this cursor (poll for new messages)
+            before: Only messages before this cursor (page back from the latest)
+            latest: Return the newest messages instead of the oldest
+            fresh: Read from the primary (read-your-writes) instead of a replica
 
         Returns:
-            List of chat messages
+            List of chat messages, oldest first
+
+        Raises:
+            ValueError: If a cursor is malformed
         """
-        results = await self._execute(
-            """
-            SELECT message_id, session_id, role, content, created_at, token_usage, page_context
-            FROM chat_messages
-            WHERE session_id = $1
-            ORDER BY created_at ASC
-            LIMIT $2
-            """,
-            session_id,
-            limit
-        )
+        # Same statements as the chat API, with this server's pool as the primary
+        async def read(conn: asyncpg.Connection):
+            if since:
+                return await fetch_chat_history(session_id, limit, after=since, conn=conn)
+            if before or latest:
+                return await fetch_latest_messages(session_id, limit, before=before, conn=conn)
+            return await fetch_chat_history(session_id, limit, conn=conn)
+
+        if not self.pool:
+            await self.connect()
+        results = await get_replica_router().run(read, fresh=fresh, primary=self.pool)
 
         return [
             {
-                "message_id": str(r["message_id"]),
-                "session_id": str(r["session_id"]),
-                "role": r["role"],
-                "content": r["content"],
-                "created_at": r["created_at"].isoformat() if r["created_at"] else None,
-                "token_usage": r["token_usage"],
-                "page_context": r["page_context"]
+                "message_id": str(r.message_id),
+                "session_id": str(r.session_id),
+                "role": r.role,
+                "content": r.content,
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+                "token_usage": r.token_usage,
+                "page_context": r.page_context,
+                "cursor": r.cursor
             }
             for r in results
         ]
@@ -156,7 +325,8 @@ class DatabaseMCPServer:
         role: str,
         content: str,
         token_usage: Optional[int] = None,
-        page_context: Optional[str] = None
+        page_context: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None
     ) -> str:
         """
         Save a chat message to the database.
@@ -167,24 +337,58 @@ class DatabaseMCPServer:
             content: Message content
             token_usage: Optional token count
             page_context: Optional page context
+            usage: Optional model usage (prompt_tokens, completion_tokens,
+                cached_tokens, model_latency_ms, model, model_calls) from the
+                agent
 
         Returns:
             Message ID
         """
-        result = await self._execute(
-            """
-            INSERT INTO chat_messages (message_id, session_id, role, content, token_usage, page_context)
-            VALUES (gen_random_uuid(), $1, $2, $3, $4, $5)
-            RETURNING message_id
-            """,
-            session_id,
-            role,
-            content,
-            token_usage,
-            page_context
-        )
+        usage = usage or {}
+        if token_usage is None and usage:
+            token_usage = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+
+        if not self.pool:
+            await self.connect()
 
-        return str(result[0]["message_id"]) if result else ""
+        # The session may exist only in the chat API's session store; create
+        # it (or touch it) in the same transaction, as the transcript writer does
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    INSERT INTO chat_sessions (session_id, current_page)
+                    VALUES ($1, $2)
+                    ON CONFLICT (session_id) DO UPDATE SET
+                        current_page = COALESCE(EXCLUDED.current_page, chat_sessions.current_page),
+                        updated_at = NOW()
+                    """,
+                    session_id,
+                    page_context
+                )
+                message_id = await conn.fetchval(
+                    """
+                    INSERT INTO chat_messages (
+                        message_id, session_id, role, content, token_usage, page_context,
+                        prompt_tokens, completion_tokens, cached_tokens, model_latency_ms, model, model_calls
+                    )
+                    VALUES (gen_random_uuid(), $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+                    RETURNING message_id
+                    """,
+                    session_id,
+                    role,
+                    content,
+                    token_usage,
+                    page_context,
+                    usage.get("prompt_tokens", 0),
+                    usage.get("completion_tokens", 0),
+                    usage.get("cached_tokens", 0),
+                    usage.get("model_latency_ms"),
+                    usage.get("model"),
+                    usage.get("model_calls")
+                )
+
+        return str(message_id) if message_id else ""
 
     async def create_chat_session(
         self,
@@ -211,7 +415,7 @@ class DatabaseMCPServer:
             """,
             user_agent,
             current_page,
-            json.dumps(metadata) if metadata else {}
+            metadata or {}
         )
 
         return str(result[0]["session_id"]) if result else ""
@@ -228,15 +432,28 @@ class DatabaseMCPServer:
             page_url
         )
 
-    async def get_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Get session information."""
-        results = await self._execute(
+    async def update_session_metadata(self, session_id: str, metadata: Dict[str, Any]):
+        """Merge keys into the metadata of a session."""
+        await self._execute(
+            """
+            UPDATE chat_sessions
+            SET metadata = COALESCE(metadata, '{}'::jsonb) || $2::jsonb, updated_at = NOW()
+            WHERE session_id = $1
+            """,
+            session_id,
+            metadata
+        )
+
+    async def get_session_info(self, session_id: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
+        """Get session information (from the primary when `fresh`)."""
+        results = await self._fetch_read(
             """
             SELECT session_id, created_at, updated_at, user_agent, current_page, metadata
             FROM chat_sessions
             WHERE session_id = $1
             """,
-            session_id
+            session_id,
+            fresh=fresh
         )
 
         if not results:
@@ -254,7 +471,7 @@ class DatabaseMCPServer:
 
     async def get_recent_sessions(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent chat sessions."""
-        results = await self._execute(
+        results = await self._fetch_read(
             """
             SELECT session_id, created_at, updated_at, current_page
             FROM chat_sessions
@@ -298,27 +515,40 @@ async def check_inventory(product_id: str) -> str:
         product_id: Product ID to check
 
     Returns:
-        JSON string of stock information
+        Compact text of stock information
     """
     server = await get_db_server()
     result = await server.check_product_stock(product_id)
-    return json.dumps(result, indent=2)
+    return encode_tool_result("check_inventory", result)
 
 
-async def get_chat_history_tool(session_id: str, limit: int = 50) -> str:
+async def get_chat_history_tool(
+    session_id: str,
+    limit: int = 50,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    latest: bool = False
+) -> str:
     """
     Tool: Get chat history for a session.
 
     Args:
         session_id: Session ID
         limit: Maximum messages
+        since: Only messages after this cursor
+        before: Only messages before this cursor
+        latest: Return the newest messages instead of the oldest
 
     Returns:
         JSON string of chat messages
     """
     server = await get_db_server()
-    history = await server.get_chat_history(session_id, limit)
-    return json.dumps(history, indent=2)
+    history = await server.get_chat_history(session_id, limit, since=since, before=before, latest=latest)
+    return dumps(history, indent=True)
+
+
+def _vector_search_unavailable(query: str) -> Dict[str, Any]:
+    return {"error": "Use the embeddings service for vector search", "query": query}
 
 
 async def search_similar_content_tool(query: str, limit: int = 5) -> str:
@@ -335,10 +565,7 @@ async def search_similar_content_tool(query: str, limit: int = 5) -> str:
     """
     # This will be called with pre-computed embeddings from the agent service
     # For now, return a placeholder
-    return json.dumps({
-        "error": "Use the embeddings service for vector search",
-        "query": query
-    }, indent=2)
+    return dumps(_vector_search_unavailable(query), indent=True)
 
 
 async def save_message(
@@ -365,7 +592,7 @@ async def save_message(
     message_id = await server.save_chat_message(
         session_id, role, content, token_usage, page_context
     )
-    return json.dumps({"message_id": message_id, "success": True}, indent=2)
+    return dumps({"message_id": message_id, "success": True}, indent=True)
 
 
 async def create_session(
@@ -384,7 +611,7 @@ async def create_session(
     """
     server = await get_db_server()
     session_id = await server.create_chat_session(user_agent, current_page)
-    return json.dumps({"session_id": session_id, "success": True}, indent=2)
+    return dumps({"session_id": session_id, "success": True}, indent=True)
 
 
 async def get_session(session_id: str) -> str:
@@ -400,59 +627,96 @@ async def get_session(session_id: str) -> str:
     server = await get_db_server()
     info = await server.get_session_info(session_id)
     if not info:
-        return json.dumps({"error": "Session not found"})
-    return json.dumps(info, indent=2)
+        return dumps({"error": "Session not found"})
+    return dumps(info, indent=True)
 
 
 # MCP Server runner for standalone execution
 
 async def run_database_mcp_server(port: int = 3002):
     """Run the Database MCP server as HTTP server."""
+    from functools import partial
     from aiohttp import web
 
+    # Handlers call the server directly and encode their dicts once
+    json_response = partial(web.json_response, dumps=dumps)
+
     async def handle_check_stock(request):
-        product_id = request.match_info["product_id"]
-        result = await check_inventory(product_id)
-        return web.json_response(json.loads(result))
+        server = await get_db_server()
+        result = await server.check_product_stock(request.match_info["product_id"])
+        return json_response(result)
+
+    async def handle_check_stock_many(request):
+        server = await get_db_server()
+        product_ids = [i for i in request.query.get("ids", "").split(",") if i]
+        return json_response(await server.check_inventory_many(product_ids))
+
+    async def handle_update_stock(request):
+        server = await get_db_server()
+        data = await request.json(loads=loads)
+        updated = await server.update_inventory(data.get("items", []))
+        return json_response({"success": True, "updated": updated})
 
     async def handle_get_history(request):
+        server = await get_db_server()
         session_id = request.match_info["session_id"]
         limit = int(request.query.get("limit", 50))
-        result = await get_chat_history_tool(session_id, limit)
-        return web.json_response(json.loads(result))
+        try:
+            history = await server.get_chat_history(
+                session_id,
+                limit,
+                since=request.query.get("since"),
+                before=request.query.get("before"),
+                latest=request.query.get("latest", "").lower() == "true",
+                fresh=request.query.get("fresh", "").lower() == "true"
+            )
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=400)
+        return json_response(history)
 
     async def handle_search(request):
-        data = await request.json()
-        query = data.get("query", "")
-        limit = data.get("limit", 5)
-        result = await search_similar_content_tool(query, limit)
-        return web.json_response(json.loads(result))
+        data = await request.json(loads=loads)
+        return json_response(_vector_search_unavailable(data.get("query", "")))
 
     async def handle_save_message(request):
-        data = await request.json()
-        result = await save_message(
+        server = await get_db_server()
+        data = await request.json(loads=loads)
+        message_id = await server.save_chat_message(
             data.get("session_id"),
             data.get("role"),
             data.get("content"),
             data.get("token_usage"),
             data.get("page_context")
         )
-        return web.json_response(json.loads(result))
+        return json_response({"message_id": message_id, "success": True})
 
     async def handle_create_session(request):
-        data = await request.json() if request.can_read_body else {}
-        result = await create_session(
+        server = await get_db_server()
+        data = await request.json(loads=loads) if request.can_read_body else {}
+        session_id = await server.create_chat_session(
             data.get("user_agent"),
             data.get("current_page")
         )
-        return web.json_response(json.loads(result))
+        return json_response({"session_id": session_id, "success": True})
 
     async def handle_get_session(request):
-        session_id = request.match_info["session_id"]
-        result = await get_session(session_id)
-        return web.json_response(json.loads(result))
-
-    app = web.Application()
+        server = await get_db_server()
+        info = await server.get_session_info(
+            request.match_info["session_id"],
+            fresh=request.query.get("fresh", "").lower() == "true"
+        )
+        return json_response(info or {"error": "Session not found"})
+
+    # Database reads have no cheap version stamp: body ETags only
+    revalidate = CachePolicy("private, no-cache")
+    app = web.Application(middlewares=[aiohttp_cache_middleware({
+        "/stock": revalidate,
+        "/stock/{product_id}": revalidate,
+        "/history/{session_id}": revalidate,
+        "/session/{session_id}": revalidate,
+    })])
+    app.router.add_get("/stock", handle_check_stock_many)
+    app.router.add_post("/stock", handle_update_stock)
     app.router.add_get("/stock/{product_id}", handle_check_stock)
     app.router.add_get("/history/{session_id}", handle_get_history)
     app.router.add_post("/search", handle_search)
@@ -460,6 +724,8 @@ async def run_database_mcp_server(port: int = 3002):
     app.router.add_post("/session", handle_create_session)
     app.router.add_get("/session/{session_id}", handle_get_session)
 
+    await get_replica_router().start()
+
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "localhost", port)
@@ -467,12 +733,14 @@ async def run_database_mcp_server(port: int = 3002):
 
     print(f"Database MCP Server running on http://localhost:{port}")
     print("Endpoints:")
+    print(f"  GET  /stock?ids=<id>,<id>")
+    print(f"  POST /stock")
     print(f"  GET  /stock/<product_id>")
-    print(f"  GET  /history/<session_id>?limit=<limit>")
+    print(f"  GET  /history/<session_id>?limit=<limit>&since=<cursor>&before=<cursor>&latest=true&fresh=true")
     print(f"  POST /search")
     print(f"  POST /message")
     print(f"  POST /session")
-    print(f"  GET  /session/<session_id>")
+    print(f"  GET  /session/<session_id>?fresh=true")
 
     await asyncio.Event().wait()
 
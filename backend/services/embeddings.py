@@ -8,10 +8,11 @@ import asyncio
 from typing import List, Dict, Any, Optional
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from pgvector.asyncpg import Vector
 import asyncpg
 from functools import lru_cache
 
+from database.codecs import register_codecs
+
 # Get database URL from environment
 DATABASE_URL = os.getenv("DATABASE_URL", "")
 
@@ -40,7 +41,7 @@ class EmbeddingsService:
             )
             print(f"Loaded embedding model: {EMBEDDING_MODEL_NAME}")
 
-    def generate_embedding(self, text: str) -> List[float]:
+    def generate_embedding(self, text: str) -> np.ndarray:
         """
         Generate embedding vector for a single text.
 
@@ -48,19 +49,19 @@ class EmbeddingsService:
             text: Input text string
 
         Returns:
-            List of floats representing the embedding vector
+            float32 array, bound to vector columns as it is
         """
         if not self.model:
             raise RuntimeError("Model not initialized. Call initialize() first.")
 
         if not text or not text.strip():
-            return [0.0] * 384  # Return zero vector for empty text
+            return np.zeros(384, dtype=np.float32)  # Return zero vector for empty text
 
         # Generate embedding
         embedding = self.model.encode(text, convert_to_numpy=True)
-        return embedding.tolist()
+        return embedding.astype(np.float32, copy=False)
 
-    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
         """
         Generate embedding vectors for multiple texts.
 
@@ -68,7 +69,7 @@ class EmbeddingsService:
             texts: List of input text strings
 
         Returns:
-            List of embedding vectors
+            float32 array with one embedding per row
         """
         if not self.model:
             raise RuntimeError("Model not initialized. Call initialize() first.")
@@ -78,7 +79,7 @@ class EmbeddingsService:
 
         # Generate embeddings in batch
         embeddings = self.model.encode(valid_texts, convert_to_numpy=True)
-        return [e.tolist() for e in embeddings]
+        return embeddings.astype(np.float32, copy=False)
 
 
 # Global service instance
@@ -213,24 +214,25 @@ def chunk_page_content_for_embedding(page_slug: str, content: str, title: str =
 
 async def get_db_pool():
     """Get database connection pool."""
-    return await asyncpg.create_pool(DATABASE_URL)
+    # jsonb metadata as dicts, embeddings as float32 arrays
+    return await asyncpg.create_pool(DATABASE_URL, init=register_codecs)
 
 
 async def store_embeddings(
     chunks: List[Dict[str, Any]],
-    embeddings: List[List[float]]
+    embeddings: np.ndarray
 ) -> bool:
     """
     Store embeddings in the database.
 
     Args:
         chunks: List of chunk dictionaries with text and metadata
-        embeddings: List of embedding vectors
+        embeddings: Embedding vectors, one row per chunk
 
     Returns:
         True if successful, False otherwise
     """
-    if not chunks or not embeddings:
+    if not chunks or len(embeddings) == 0:
         return False
 
     try:
@@ -247,7 +249,7 @@ async def store_embeddings(
                     chunk["source_type"],
                     chunk["source_id"],
                     chunk["text"],
-                    Vector(embedding),
+                    embedding,
                     chunk.get("metadata", {})
                 )
 
@@ -296,7 +298,7 @@ async def search_similar_content(
                     ORDER BY embedding <=> $1
                     LIMIT $3
                     """,
-                    Vector(query_embedding),
+                    query_embedding,
                     source_type,
                     limit
                 )
@@ -313,7 +315,7 @@ async def search_similar_content(
                     ORDER BY embedding <=> $1
                     LIMIT $2
                     """,
-                    Vector(query_embedding),
+                    query_embedding,
                     limit
                 )
 
@@ -376,7 +378,7 @@ def build_rag_context(query: str, results: List[Dict[str, Any]], max_length: int
 
 # Standalone functions for direct use
 
-async def embed_text(text: str) -> List[float]:
+async def embed_text(text: str) -> np.ndarray:
     """Generate embedding for a single text."""
     service = await get_embeddings_service()
     return service.generate_embedding(text)
@@ -0,0 +1,269 @@
+"""
+GROQ Result Cache - Stale-while-revalidate cache for Sanity query results.
+
+Results are keyed by the canonicalized query (whitespace collapsed) plus a hash
+of its parameters. Each query family has its own TTL:
+- fresh entries are served directly
+- expired entries are served stale while a single background refresh runs
+- entries older than TTL + GROQ_CACHE_MAX_STALE are never served; the caller
+  waits for a fresh result instead
+
+The cache is a size-bounded LRU. Entries are indexed by the document ids they
+contain, so change notifications invalidate exactly the affected results.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Iterable, Set
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+GROQ_CACHE_ENABLED = os.getenv("GROQ_CACHE_ENABLED", "true").lower() == "true"
+GROQ_CACHE_MAX_ENTRIES = int(os.getenv("GROQ_CACHE_MAX_ENTRIES", 2000))
+# Longest time past its TTL a result may still be served while refreshing
+GROQ_CACHE_MAX_STALE = float(os.getenv("GROQ_CACHE_MAX_STALE", 300))  # seconds
+
+# TTL per query family, in seconds
+GROQ_CACHE_TTLS: Dict[str, float] = {
+    "document": float(os.getenv("GROQ_CACHE_TTL_DOCUMENT", 300)),
+    "list": float(os.getenv("GROQ_CACHE_TTL_LIST", 60)),
+    "categories": float(os.getenv("GROQ_CACHE_TTL_CATEGORIES", 600)),
+    "version": float(os.getenv("GROQ_CACHE_TTL_VERSION", 15)),
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Filters of queries fetching specific documents
+_DOCUMENT_FILTERS = ("_id == $id", "_id in $ids", "slug.current == $slug", "slug.current in $slugs")
+
+
+def canonical_query(query: str) -> str:
+    """Collapse whitespace so formatting differences share one cache entry."""
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def query_family(query: str) -> str:
+    """
+    Classify a canonical query into a TTL family.
+
+    Returns:
+        One of "document", "categories", "version" or "list"
+    """
+    if "_updatedAt desc)[0]._updatedAt" in query:
+        return "version"
+    if query.startswith('*[_type == "category"]'):
+        return "categories"
+    if any(term in query for term in _DOCUMENT_FILTERS):
+        return "document"
+    return "list"
+
+
+def cache_key(query: str, params: Optional[Dict[str, Any]]) -> str:
+    """Cache key from the canonical query and a hash of its parameters."""
+    payload = json.dumps(params or {}, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha1(payload.encode()).hexdigest()
+    return f"{canonical_query(query)}|{digest}"
+
+
+def _document_ids(result: Any) -> Set[str]:
+    """Collect every `_id` found in a query result."""
+    ids: Set[str] = set()
+    stack = [result]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            doc_id = value.get("_id")
+            if isinstance(doc_id, str):
+                ids.add(doc_id)
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return ids
+
+
+class CacheEntry:
+    """One cached query result."""
+
+    __slots__ = ("value", "family", "fetched_at", "expires_at", "doc_ids")
+
+    def __init__(self, value: Any, family: str, ttl: float, doc_ids: Set[str]):
+        self.value = value
+        self.family = family
+        self.fetched_at = time.monotonic()
+        self.expires_at = self.fetched_at + ttl
+        self.doc_ids = doc_ids
+
+
+class GroqResultCache:
+    """Size-bounded LRU of GROQ results with stale-while-revalidate refresh."""
+
+    def __init__(
+        self,
+        max_entries: int = GROQ_CACHE_MAX_ENTRIES,
+        ttls: Dict[str, float] = GROQ_CACHE_TTLS,
+        max_stale: float = GROQ_CACHE_MAX_STALE
+    ):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self.max_stale = max_stale
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._by_doc: Dict[str, Set[str]] = {}
+        # In-flight loads, shared by concurrent callers of the same key
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Entry bookkeeping
+
+    def _store(self, key: str, value: Any, family: str):
+        self._drop(key)
+        entry = CacheEntry(value, family, self.ttls.get(family, self.ttls["list"]), _document_ids(value))
+        self._entries[key] = entry
+        for doc_id in entry.doc_ids:
+            self._by_doc.setdefault(doc_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for doc_id in entry.doc_ids:
+            keys = self._by_doc.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_doc[doc_id]
+
+    # Loading
+
+    async def _load(self, key: str, family: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Run the loader once per key, sharing the result with concurrent callers."""
+        future = self._loading.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure is not logged as lost
+            future.exception()
+            raise
+        else:
+            self._store(key, value, family)
+            future.set_result(value)
+            return value
+        finally:
+            self._loading.pop(key, None)
+
+    async def _refresh(self, key: str, family: str, loader: Callable[[], Awaitable[Any]]):
+        self.refreshes += 1
+        try:
+            await self._load(key, family, loader)
+        except Exception as e:
+            # Keep serving the stale entry until it exceeds the staleness bound
+            self.refresh_failures += 1
+            logger.warning(f"GROQ cache refresh failed: {e}")
+
+    async def get(self, query: str, params: Optional[Dict[str, Any]], loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Get a query result, loading or refreshing it as needed.
+
+        Args:
+            query: GROQ query
+            params: Query parameters
+            loader: Coroutine function executing the query; must raise on
+                errors so failures are never cached
+
+        Returns:
+            Query result
+        """
+        key = cache_key(query, params)
+        family = query_family(canonical_query(query))
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            self._entries.move_to_end(key)
+            if now < entry.expires_at:
+                self.hits += 1
+                return entry.value
+            if now < entry.expires_at + self.max_stale:
+                self.stale_hits += 1
+                if key not in self._loading:
+                    task = asyncio.create_task(self._refresh(key, family, loader))
+                    self._refresh_tasks.add(task)
+                    task.add_done_callback(self._refresh_tasks.discard)
+                return entry.value
+
+        self.misses += 1
+        return await self._load(key, family, loader)
+
+    # Invalidation
+
+    def invalidate_documents(self, changed_ids: Iterable[str], removed_ids: Iterable[str] = ()):
+        """
+        Drop cached results affected by document changes.
+
+        Results containing a changed or removed document are dropped. A changed
+        document no cached result contains may be new, and could now match any
+        list query, so list results are dropped as well in that case.
+
+        Signature matches CatalogReplica listeners.
+        """
+        keys: Set[str] = set()
+        unseen = False
+        for doc_id in list(changed_ids) + list(removed_ids):
+            indexed = self._by_doc.get(doc_id)
+            if indexed:
+                keys |= indexed
+            else:
+                unseen = True
+        if unseen:
+            keys |= {k for k, e in self._entries.items() if e.family in ("list", "version")}
+        else:
+            keys |= {k for k, e in self._entries.items() if e.family == "version"}
+
+        for key in keys:
+            self._drop(key)
+        self.invalidations += len(keys)
+
+    def clear(self):
+        """Drop every cached result."""
+        self._entries.clear()
+        self._by_doc.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters for health reporting."""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "enabled": GROQ_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else None,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,395 @@
+"""
+HTTP Response Cache - ETag validators, Cache-Control and compression for read endpoints.
+
+Read endpoints are registered with a CachePolicy by path template. For a GET on
+one of them:
+- When the policy has a version function, a strong ETag is derived from the
+  path, query string and the version stamp (catalog `_updatedAt`, session
+  message count, ...) before the handler runs. A matching `If-None-Match` is
+  answered with 304 and a cached encoded body is served as is; both skip the
+  handler's payload work and serialization.
+- Otherwise the handler runs and the ETag is a hash of the response body,
+  which still saves the transfer when the client has it.
+Bodies above a size threshold are brotli or gzip compressed per
+`Accept-Encoding`, and encoded bodies are kept in a small in-process LRU.
+
+The same policies drive an ASGI middleware for the FastAPI app and an aiohttp
+middleware for the MCP servers.
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Callable, Tuple, List
+
+# Optional brotli compression (installed with httpx[brotli])
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", 512))
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", 1024))
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", 6))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", 5))
+
+# Version stamp of a request, from its path parameters and query string
+VersionFunction = Callable[[Dict[str, str], str], Optional[str]]
+
+
+@dataclass
+class CachePolicy:
+    """Caching behaviour of one read endpoint."""
+    cache_control: str
+    version: Optional[VersionFunction] = None
+
+
+# Content-Encoding -> ETag suffix; each encoded representation gets its own
+# strong validator, and suffixes are ignored when comparing If-None-Match
+_ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gz"}
+
+
+def strong_etag(*parts: str) -> str:
+    """Strong ETag from version stamps or a body."""
+    digest = hashlib.sha1("\0".join(parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def body_etag(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()[:32]}"'
+
+
+def _encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    if encoding is None:
+        return etag
+    return etag[:-1] + _ENCODING_SUFFIXES[encoding] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag, as RFC 9110 requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        for suffix in _ENCODING_SUFFIXES.values():
+            if candidate.endswith(suffix + '"'):
+                candidate = candidate[:-len(suffix) - 1] + '"'
+                break
+        if candidate == etag:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Preferred content coding the client accepts: br, then gzip."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and not BROTLI_AVAILABLE:
+            continue
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=HTTP_GZIP_LEVEL)
+
+
+def compile_template(template: str) -> re.Pattern:
+    """Regex for a path template such as `/api/session/{session_id}`."""
+    pattern = re.sub(r"\\{(\w+)\\}", r"(?P<\1>[^/]+)", re.escape(template))
+    return re.compile(f"^{pattern}$")
+
+
+@dataclass
+class EncodedBody:
+    """A response body ready to send."""
+    body: bytes
+    content_type: str
+    encoding: Optional[str]
+
+
+class HTTPResponseCache:
+    """Validators, compression and an LRU of encoded bodies keyed by ETag."""
+
+    def __init__(self, max_entries: int = HTTP_CACHE_MAX_ENTRIES, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, Optional[str]], EncodedBody]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.compressed = 0
+
+    def version_etag(self, policy: CachePolicy, template: str, params: Dict[str, str], query: str) -> Optional[str]:
+        """ETag from the policy's version stamp, or None without one."""
+        if policy.version is None:
+            return None
+        try:
+            stamp = policy.version(params, query)
+        except Exception as e:
+            logger.warning(f"Version stamp for {template} failed: {e}")
+            return None
+        if stamp is None:
+            return None
+        return strong_etag(template, *(f"{k}={v}" for k, v in sorted(params.items())), query, stamp)
+
+    def lookup(self, etag: str, encoding: Optional[str]) -> Optional[EncodedBody]:
+        entry = self._entries.get((etag, encoding))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((etag, encoding))
+        self.hits += 1
+        return entry
+
+    def encode(
+        self,
+        body: bytes,
+        content_type: str,
+        encoding: Optional[str],
+        etag: Optional[str] = None
+    ) -> Tuple[str, EncodedBody]:
+        """
+        Compress a fresh body and cache it under its ETag.
+
+        Args:
+            body: Uncompressed body
+            content_type: Content-Type header value
+            encoding: Coding negotiated with choose_encoding
+            etag: Version ETag; bodies without one are keyed by their hash
+
+        Returns:
+            Tuple of (base ETag, encoded body)
+        """
+        etag = etag or body_etag(body)
+        key = (etag, encoding)
+        cached = self._entries.get(key)
+        if cached is not None:
+            # Same body as before: skip recompressing it
+            self._entries.move_to_end(key)
+            return etag, cached
+        if encoding is not None and len(body) >= HTTP_COMPRESS_MIN_BYTES:
+            entry = EncodedBody(compress(body, encoding), content_type, encoding)
+            self.compressed += 1
+        else:
+            entry = EncodedBody(body, content_type, None)
+        self._store(key, entry)
+        return etag, entry
+
+    def _store(self, key: Tuple[str, Optional[str]], entry: EncodedBody):
+        size = len(entry.body)
+        if size > self.max_bytes // 8:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old.body)
+        self._entries[key] = entry
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+
+    def headers(self, policy: CachePolicy, etag: str, entry: Optional[EncodedBody] = None) -> Dict[str, str]:
+        """Validator and caching headers; 304 responses pass no entry."""
+        headers = {
+            "ETag": _encoded_etag(etag, entry.encoding if entry else None),
+            "Cache-Control": policy.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if entry is not None:
+            headers["Content-Type"] = entry.content_type
+            if entry.encoding:
+                headers["Content-Encoding"] = entry.encoding
+        return headers
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "compressed": self.compressed,
+        }
+
+
+# Global cache instance
+_http_cache: Optional[HTTPResponseCache] = None
+
+
+def get_http_cache() -> HTTPResponseCache:
+    """Get or create the global HTTP response cache."""
+    global _http_cache
+    if _http_cache is None:
+        _http_cache = HTTPResponseCache()
+    return _http_cache
+
+
+# FastAPI / ASGI
+
+class HTTPCacheMiddleware:
+    """ASGI middleware applying CachePolicy to GET requests by path template."""
+
+    def __init__(self, app, policies: Dict[str, CachePolicy], cache: Optional[HTTPResponseCache] = None):
+        self.app = app
+        self.routes: List[Tuple[str, re.Pattern, CachePolicy]] = [
+            (template, compile_template(template), policy) for template, policy in policies.items()
+        ]
+        self.cache = cache or get_http_cache()
+
+    def _match(self, path: str) -> Optional[Tuple[str, CachePolicy, Dict[str, str]]]:
+        for template, pattern, policy in self.routes:
+            match = pattern.match(path)
+            if match:
+                return template, policy, match.groupdict()
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not HTTP_CACHE_ENABLED or scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        route = self._match(scope["path"])
+        if route is None:
+            return await self.app(scope, receive, send)
+        template, policy, params = route
+
+        request_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        if_none_match = request_headers.get("if-none-match")
+        encoding = choose_encoding(request_headers.get("accept-encoding"))
+        query = scope.get("query_string", b"").decode("latin-1")
+        cache = self.cache
+
+        etag = cache.version_etag(policy, template, params, query)
+        if etag is not None:
+            if etag_matches(if_none_match, etag):
+                cache.not_modified += 1
+                return await self._send(send, 304, cache.headers(policy, etag), b"")
+            entry = cache.lookup(etag, encoding)
+            if entry is not None:
+                return await self._send(send, 200, cache.headers(policy, etag, entry), entry.body)
+
+        # Run the handler, buffering its response
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        headers = [(k, v) for k, v in start.get("headers", []) if k.lower() not in (b"content-length",)]
+        content_type = next((v.decode("latin-1") for k, v in headers if k.lower() == b"content-type"), "application/json")
+        body = b"".join(chunks)
+        status = start.get("status", 500)
+        if status != 200 or any(k.lower() == b"content-encoding" for k, _ in headers):
+            return await self._send(send, status, headers, body)
+
+        etag, entry = cache.encode(body, content_type, encoding, etag)
+        if etag_matches(if_none_match, etag):
+            cache.not_modified += 1
+            return await self._send(send, 304, cache.headers(policy, etag), b"")
+
+        replaced = {"content-type", "etag", "cache-control", "vary", "content-encoding"}
+        headers = [(k, v) for k, v in headers if k.decode("latin-1").lower() not in replaced]
+        headers += [(k.encode("latin-1"), v.encode("latin-1")) for k, v in cache.headers(policy, etag, entry).items()]
+        await self._send(send, 200, headers, entry.body)
+
+    @staticmethod
+    async def _send(send, status: int, headers, body: bytes):
+        if isinstance(headers, dict):
+            headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+        headers = list(headers)
+        if status != 304:
+            headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+# aiohttp
+
+def aiohttp_cache_middleware(policies: Dict[str, CachePolicy], cache: Optional[HTTPResponseCache] = None):
+    """
+    aiohttp middleware applying CachePolicy to GET routes.
+
+    Args:
+        policies: Policies keyed by route path template (`/product/{product_id}`)
+        cache: Response cache (defaults to the global one)
+
+    Returns:
+        Middleware for `web.Application(middlewares=[...])`
+    """
+    from aiohttp import web
+
+    @web.middleware
+    async def middleware(request, handler):
+        resource = request.match_info.route.resource
+        template = resource.canonical if resource is not None else None
+        policy = policies.get(template)
+        if not HTTP_CACHE_ENABLED or request.method != "GET" or policy is None:
+            return await handler(request)
+
+        http_cache = cache or get_http_cache()
+        params = dict(request.match_info)
+        if_none_match = request.headers.get("If-None-Match")
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+
+        etag = http_cache.version_etag(policy, template, params, request.query_string)
+        if etag is not None:
+            if etag_matches(if_none_match, etag):
+                http_cache.not_modified += 1
+                return web.Response(status=304, headers=http_cache.headers(policy, etag))
+            entry = http_cache.lookup(etag, encoding)
+            if entry is not None:
+                return web.Response(body=entry.body, headers=http_cache.headers(policy, etag, entry))
+
+        response = await handler(request)
+        if response.status != 200 or not isinstance(response, web.Response) or not isinstance(response.body, bytes):
+            return response
+
+        content_type = response.headers.get("Content-Type", "application/json")
+        etag, entry = http_cache.encode(response.body, content_type, encoding, etag)
+        if etag_matches(if_none_match, etag):
+            http_cache.not_modified += 1
+            return web.Response(status=304, headers=http_cache.headers(policy, etag))
+
+        headers = {
+            k: v for k, v in response.headers.items()
+            if k.lower() not in ("content-length", "content-type", "content-encoding", "etag", "cache-control", "vary")
+        }
+        headers.update(http_cache.headers(policy, etag, entry))
+        return web.Response(body=entry.body, headers=headers)
+
+    return middleware
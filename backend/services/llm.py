@@ -0,0 +1,426 @@
+"""
+LLM Provider Layer - Pluggable model backends for the agent.
+
+The agent talks to a provider through a small interface (generate, stream,
+count tokens, tool calls) so the chat pipeline is not tied to one SDK.
+
+Providers:
+- gemini: Google Gemini via google-genai (default)
+- fake: Deterministic local model with configurable latency and token rate,
+  for load testing the backend offline without spending quota
+
+Select the provider with the LLM_PROVIDER environment variable.
+"""
+
+import os
+import json
+import time
+import math
+import zlib
+import random
+import asyncio
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, AsyncIterator, Callable
+
+# Configuration
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_RESILIENCE_ENABLED = os.getenv("LLM_RESILIENCE_ENABLED", "true").lower() == "true"
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+# Use just the model name without the provider prefix
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash").replace("gemini/", "")
+
+# Fake provider settings
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", 800))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", 0.3))
+FAKE_LLM_LATENCY_DISTRIBUTION = os.getenv("FAKE_LLM_LATENCY_DISTRIBUTION", "lognormal")
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", 80))
+FAKE_LLM_RESPONSE_TOKENS = int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", 120))
+FAKE_LLM_TOOL_CALLS = os.getenv("FAKE_LLM_TOOL_CALLS", "")
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", 0))
+
+
+@dataclass
+class ToolCall:
+    """A tool invocation requested by the model."""
+    name: str
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class LLMUsage:
+    """Token usage reported for a model call."""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+@dataclass
+class LLMResponse:
+    """Result of a model call."""
+    text: str = ""
+    tool_calls: List[ToolCall] = field(default_factory=list)
+    usage: LLMUsage = field(default_factory=LLMUsage)
+    latency_ms: float = 0.0
+    model: str = ""
+
+
+@dataclass
+class LLMChunk:
+    """Incremental piece of a streamed model call."""
+    text: str = ""
+    tool_calls: List[ToolCall] = field(default_factory=list)
+    usage: Optional[LLMUsage] = None
+
+
+class LLMProvider(ABC):
+    """
+    Interface for LLM backends.
+
+    Messages are provider-neutral dicts:
+        {"role": "user" | "assistant", "content": str}
+        {"role": "assistant", "content": str, "tool_calls": [ToolCall, ...]}
+        {"role": "tool", "name": str, "content": str}
+    """
+
+    name: str = "base"
+    model: str = ""
+
+    @abstractmethod
+    async def generate(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_output_tokens: int = 2048,
+        tools: Optional[List[Callable]] = None
+    ) -> LLMResponse:
+        """Generate a complete response."""
+
+    @abstractmethod
+    def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_output_tokens: int = 2048,
+        tools: Optional[List[Callable]] = None
+    ) -> AsyncIterator[LLMChunk]:
+        """Stream a response as chunks of text and tool calls."""
+
+    @abstractmethod
+    async def count_tokens(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None
+    ) -> int:
+        """Count prompt tokens for a set of messages."""
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini provider using the async google-genai client."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str = GEMINI_API_KEY, model: str = GEMINI_MODEL):
+        from google.genai import Client
+
+        self.client = Client(api_key=api_key)
+        self.model = model
+
+    def _contents(self, messages: List[Dict[str, Any]]) -> List[Any]:
+        """Convert provider-neutral messages to Gemini contents."""
+        from google.genai import types
+
+        contents = []
+        for msg in messages:
+            role = msg.get("role")
+            if role == "tool":
+                contents.append(types.Content(
+                    role="user",
+                    parts=[types.Part.from_function_response(
+                        name=msg["name"],
+                        response={"result": msg.get("content", "")}
+                    )]
+                ))
+                continue
+
+            parts = []
+            if msg.get("content"):
+                parts.append(types.Part(text=msg["content"]))
+            for call in msg.get("tool_calls") or []:
+                parts.append(types.Part.from_function_call(name=call.name, args=call.args))
+            contents.append(types.Content(
+                role="user" if role == "user" else "model",
+                parts=parts or [types.Part(text="")]
+            ))
+        return contents
+
+    def _config(self, system_instruction, temperature, max_output_tokens, tools):
+        from google.genai import types
+
+        config = types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+        )
+        if tools:
+            config.tools = list(tools)
+            # Tool calls are executed by the agent, not the SDK
+            config.automatic_function_calling = types.AutomaticFunctionCallingConfig(disable=True)
+        return config
+
+    @staticmethod
+    def _usage(metadata: Any) -> LLMUsage:
+        if metadata is None:
+            return LLMUsage()
+        return LLMUsage(
+            prompt_tokens=metadata.prompt_token_count or 0,
+            completion_tokens=metadata.candidates_token_count or 0,
+            cached_tokens=metadata.cached_content_token_count or 0,
+        )
+
+    @staticmethod
+    def _parts(response: Any) -> List[Any]:
+        if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+            return response.candidates[0].content.parts
+        return []
+
+    async def generate(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_output_tokens: int = 2048,
+        tools: Optional[List[Callable]] = None
+    ) -> LLMResponse:
+        started = time.perf_counter()
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=self._contents(messages),
+            config=self._config(system_instruction, temperature, max_output_tokens, tools)
+        )
+
+        text_parts = []
+        tool_calls = []
+        for part in self._parts(response):
+            if part.text:
+                text_parts.append(part.text)
+            if part.function_call:
+                tool_calls.append(ToolCall(part.function_call.name, dict(part.function_call.args or {})))
+
+        return LLMResponse(
+            text="".join(text_parts),
+            tool_calls=tool_calls,
+            usage=self._usage(response.usage_metadata),
+            latency_ms=(time.perf_counter() - started) * 1000,
+            model=self.model
+        )
+
+    async def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_output_tokens: int = 2048,
+        tools: Optional[List[Callable]] = None
+    ) -> AsyncIterator[LLMChunk]:
+        response_stream = await self.client.aio.models.generate_content_stream(
+            model=self.model,
+            contents=self._contents(messages),
+            config=self._config(system_instruction, temperature, max_output_tokens, tools)
+        )
+
+        async for response in response_stream:
+            chunk = LLMChunk()
+            for part in self._parts(response):
+                if part.text:
+                    chunk.text += part.text
+                if part.function_call:
+                    chunk.tool_calls.append(
+                        ToolCall(part.function_call.name, dict(part.function_call.args or {}))
+                    )
+            if response.usage_metadata is not None:
+                chunk.usage = self._usage(response.usage_metadata)
+            yield chunk
+
+    async def count_tokens(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None
+    ) -> int:
+        contents = self._contents(messages)
+        if system_instruction:
+            contents = self._contents([{"role": "user", "content": system_instruction}]) + contents
+        result = await self.client.aio.models.count_tokens(model=self.model, contents=contents)
+        return result.total_tokens or 0
+
+
+_FAKE_WORDS = (
+    "our sofa chair table oak walnut linen leather velvet comfortable modern "
+    "classic design crafted showroom delivery warranty dimensions finish "
+    "cushions frame premium collection living dining bedroom storage lighting"
+).split()
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    Deterministic local model for load testing.
+
+    The same messages always produce the same text, latency sample and tool
+    calls for a given seed, so runs are reproducible. Latency is the sampled
+    time to first token plus completion tokens divided by the token rate.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency_ms: float = FAKE_LLM_LATENCY_MS,
+        latency_sigma: float = FAKE_LLM_LATENCY_SIGMA,
+        latency_distribution: str = FAKE_LLM_LATENCY_DISTRIBUTION,
+        tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND,
+        response_tokens: int = FAKE_LLM_RESPONSE_TOKENS,
+        tool_calls: Optional[List[Dict[str, Any]]] = None,
+        seed: int = FAKE_LLM_SEED
+    ):
+        self.model = "fake"
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.latency_distribution = latency_distribution
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        if tool_calls is None:
+            tool_calls = json.loads(FAKE_LLM_TOOL_CALLS) if FAKE_LLM_TOOL_CALLS else []
+        self.tool_calls = [ToolCall(c["name"], c.get("args", {})) for c in tool_calls]
+        self.seed = seed
+
+    def _rng(self, messages: List[Dict[str, Any]]) -> random.Random:
+        key = json.dumps(
+            [(m.get("role"), m.get("content", "")) for m in messages],
+            sort_keys=True
+        ).encode()
+        return random.Random(zlib.crc32(key) ^ self.seed)
+
+    def _first_token_delay(self, rng: random.Random) -> float:
+        """Sample time to first token in seconds."""
+        if self.latency_distribution == "fixed":
+            ms = self.latency_ms
+        elif self.latency_distribution == "uniform":
+            spread = self.latency_ms * self.latency_sigma
+            ms = rng.uniform(self.latency_ms - spread, self.latency_ms + spread)
+        elif self.latency_distribution == "normal":
+            ms = rng.gauss(self.latency_ms, self.latency_ms * self.latency_sigma)
+        else:
+            # lognormal with the configured median
+            ms = rng.lognormvariate(math.log(max(self.latency_ms, 1e-3)), self.latency_sigma)
+        return max(ms, 0.0) / 1000
+
+    def _plan(self, messages: List[Dict[str, Any]], tools: Optional[List[Callable]]):
+        """Decide the deterministic output for a call."""
+        rng = self._rng(messages)
+        delay = self._first_token_delay(rng)
+
+        # Canned tool calls are issued once, before any tool results exist
+        has_tool_results = any(m.get("role") == "tool" for m in messages)
+        if tools and self.tool_calls and not has_tool_results:
+            available = {getattr(t, "__name__", "") for t in tools}
+            calls = [c for c in self.tool_calls if c.name in available]
+            if calls:
+                return delay, [], calls
+
+        tokens = [rng.choice(_FAKE_WORDS) for _ in range(self.response_tokens)]
+        return delay, tokens, []
+
+    def _usage(self, messages, system_instruction, completion_tokens) -> LLMUsage:
+        return LLMUsage(
+            prompt_tokens=self._count(messages, system_instruction),
+            completion_tokens=completion_tokens
+        )
+
+    @staticmethod
+    def _count(messages: List[Dict[str, Any]], system_instruction: Optional[str] = None) -> int:
+        # Roughly four characters per token
+        chars = len(system_instruction or "") + sum(len(m.get("content") or "") for m in messages)
+        return max(1, chars // 4)
+
+    async def generate(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_output_tokens: int = 2048,
+        tools: Optional[List[Callable]] = None
+    ) -> LLMResponse:
+        started = time.perf_counter()
+        delay, tokens, tool_calls = self._plan(messages, tools)
+        tokens = tokens[:max_output_tokens]
+
+        await asyncio.sleep(delay + len(tokens) / self.tokens_per_second)
+
+        return LLMResponse(
+            text=" ".join(tokens),
+            tool_calls=tool_calls,
+            usage=self._usage(messages, system_instruction, len(tokens)),
+            latency_ms=(time.perf_counter() - started) * 1000,
+            model=self.model
+        )
+
+    async def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_output_tokens: int = 2048,
+        tools: Optional[List[Callable]] = None
+    ) -> AsyncIterator[LLMChunk]:
+        delay, tokens, tool_calls = self._plan(messages, tools)
+        tokens = tokens[:max_output_tokens]
+
+        await asyncio.sleep(delay)
+        if tool_calls:
+            yield LLMChunk(tool_calls=tool_calls, usage=self._usage(messages, system_instruction, 0))
+            return
+
+        interval = 1 / self.tokens_per_second
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(interval)
+            yield LLMChunk(text=token if i == 0 else f" {token}")
+        yield LLMChunk(usage=self._usage(messages, system_instruction, len(tokens)))
+
+    async def count_tokens(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None
+    ) -> int:
+        return self._count(messages, system_instruction)
+
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "fake": FakeLLMProvider,
+}
+
+
+# Global provider instance
+_provider: Optional[LLMProvider] = None
+
+
+def get_llm_provider() -> LLMProvider:
+    """Get or create the configured LLM provider."""
+    global _provider
+    if _provider is None:
+        if LLM_PROVIDER not in PROVIDERS:
+            raise ValueError(
+                f"Unknown LLM_PROVIDER '{LLM_PROVIDER}'. Choose from: {', '.join(PROVIDERS)}"
+            )
+        _provider = PROVIDERS[LLM_PROVIDER]()
+        if LLM_RESILIENCE_ENABLED:
+            from services.resilience import ResilientLLMProvider
+            _provider = ResilientLLMProvider(_provider)
+    return _provider
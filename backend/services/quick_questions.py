@@ -0,0 +1,418 @@
+"""
+Quick Questions Service - Page-specific suggested questions and pre-generated answers.
+
+The quick questions shown in the chat widget are static, so their answers can
+be generated ahead of time. A background refresher pre-generates an answer for
+every question per page type (and per product for product-page questions) and
+regenerates them when the answers exceed their TTL. With the catalog replica,
+only the answers of products edited since are regenerated; otherwise any
+catalog change regenerates everything. Stock questions are left to the agent,
+which reads the inventory table.
+"""
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.sanity_mcp import get_sanity_server
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+QUICK_ANSWERS_ENABLED = os.getenv("QUICK_ANSWERS_ENABLED", "true").lower() == "true"
+QUICK_ANSWERS_TTL = int(os.getenv("QUICK_ANSWERS_TTL", 6 * 60 * 60))  # seconds
+QUICK_ANSWERS_CHECK_INTERVAL = int(os.getenv("QUICK_ANSWERS_CHECK_INTERVAL", 300))  # seconds
+QUICK_ANSWERS_CONCURRENCY = int(os.getenv("QUICK_ANSWERS_CONCURRENCY", 2))
+# Share of answers a full refresh must generate to count as done; a worse run
+# (model down, breaker open) keeps the previous answers and retries
+QUICK_ANSWERS_MIN_SUCCESS = float(os.getenv("QUICK_ANSWERS_MIN_SUCCESS", 0.5))
+
+# Quick questions by page type
+QUICK_QUESTIONS = {
+    "product": [
+        "What are the dimensions of this item?",
+        "Is this currently in stock?",
+        "What materials is this made from?",
+        "Show me similar products",
+        "What's the price and any current deals?"
+    ],
+    "products": [
+        "What are your bestselling items?",
+        "Show me sofas under $1000",
+        "What new products arrived recently?",
+        "Help me find a dining table",
+        "What furniture categories do you offer?"
+    ],
+    "home": [
+        "What makes Sony Interior unique?",
+        "Tell me about your featured collection",
+        "How can I visit your showroom?",
+        "What's your return policy?",
+        "What are your bestsellers?"
+    ],
+    "about": [
+        "Where are you located?",
+        "Tell me about your craftsmanship",
+        "What's your sustainability approach?",
+        "How long have you been in business?",
+        "Do you offer interior design services?"
+    ],
+    "contact": [
+        "What are your store hours?",
+        "How can I schedule a showroom visit?",
+        "Do you offer delivery services?",
+        "What is your return policy?",
+        "How can I contact customer support?"
+    ],
+    "default": [
+        "Help me find the perfect furniture",
+        "What are your featured products?",
+        "Tell me about your company",
+        "What categories do you offer?",
+        "How can I contact you?"
+    ]
+}
+
+# Extra questions shown on a specific product's page
+PRODUCT_SPECIFIC_QUESTIONS = [
+    "What are the dimensions of this product?",
+    "Is this product in stock?",
+    "What materials is this made from?"
+]
+
+# Stock changes outside the catalog (inventory table); always asked live
+STOCK_QUESTIONS = frozenset({
+    "Is this currently in stock?",
+    "Is this product in stock?"
+})
+
+# Changes only with the question lists above; stamps HTTP ETags
+QUICK_QUESTIONS_VERSION = hashlib.sha1(
+    json.dumps([QUICK_QUESTIONS, PRODUCT_SPECIFIC_QUESTIONS]).encode()
+).hexdigest()[:16]
+
+# Page path for each page type, used as the page context when pre-generating
+PAGE_PATHS = {
+    "home": "/",
+    "products": "/products",
+    "about": "/about",
+    "contact": "/contact",
+    "default": "/"
+}
+
+
+def get_quick_questions(page_type: str = "default", product_id: Optional[str] = None) -> List[str]:
+    """
+    Get quick questions for a page.
+
+    Args:
+        page_type: Type of page (home, product, products, about, contact)
+        product_id: Optional product ID for product-specific questions
+
+    Returns:
+        List of quick questions
+    """
+    questions = QUICK_QUESTIONS.get(page_type, QUICK_QUESTIONS["default"])
+
+    # If on a product page, add product-specific questions
+    if page_type == "product" and product_id:
+        questions = PRODUCT_SPECIFIC_QUESTIONS + questions[:2]
+
+    return questions
+
+
+def get_page_type(page_context: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Determine page type (and product slug) from a page path.
+
+    Mirrors the mapping used by the frontend chat widget.
+
+    Args:
+        page_context: Page URL or path
+
+    Returns:
+        Tuple of (page_type, product_slug)
+    """
+    path = (page_context or "/").split("?", 1)[0].split("#", 1)[0]
+    if "://" in path:
+        path = "/" + path.split("://", 1)[1].partition("/")[2]
+    path = path.rstrip("/") or "/"
+
+    if path.startswith("/products/"):
+        return "product", path[len("/products/"):].split("/", 1)[0] or None
+    if path == "/products":
+        return "products", None
+    if path == "/about":
+        return "about", None
+    if path == "/contact":
+        return "contact", None
+    if path == "/":
+        return "home", None
+    return "default", None
+
+
+def _product_questions() -> List[str]:
+    """Questions asked on a product page that are pre-generated."""
+    questions = dict.fromkeys(PRODUCT_SPECIFIC_QUESTIONS + QUICK_QUESTIONS["product"])
+    return [q for q in questions if q not in STOCK_QUESTIONS]
+
+
+def _format_product_context(product: Dict) -> str:
+    """Build the product facts passed to the agent for product-page answers."""
+    category = product.get("category") or {}
+    lines = [
+        f"The user is viewing this product: {product.get('name', '')}",
+        f"Price: {product.get('price')}",
+    ]
+    if product.get("compareAtPrice"):
+        lines.append(f"Compare at price: {product.get('compareAtPrice')}")
+    if isinstance(category, dict) and category.get("name"):
+        lines.append(f"Category: {category['name']}")
+    if product.get("shortDescription"):
+        lines.append(f"Summary: {product['shortDescription']}")
+    if product.get("dimensions"):
+        lines.append(f"Dimensions: {product['dimensions']}")
+    if product.get("materials"):
+        lines.append(f"Materials: {', '.join(map(str, product['materials']))}")
+    if product.get("colors"):
+        lines.append(f"Colors: {product['colors']}")
+    if product.get("warranty"):
+        lines.append(f"Warranty: {product['warranty']}")
+    return "\n".join(lines)
+
+
+@dataclass
+class QuickAnswer:
+    """A pre-generated answer to a quick question."""
+    answer: str
+    catalog_version: Optional[str]
+    generated_at: float
+
+
+class QuickAnswerCache:
+    """Pre-generated answers for quick questions, refreshed in the background."""
+
+    def __init__(self):
+        # Keyed by (scope, question) where scope is a page type or "product:<slug>"
+        self.answers: Dict[Tuple[str, str], QuickAnswer] = {}
+        self.catalog_version: Optional[str] = None
+        self.last_refresh: float = 0.0
+        # Catalog replica changes: product ID -> slug of its answers, and
+        # slugs whose answers need regenerating
+        self._slugs: Dict[str, str] = {}
+        self._dirty: Set[str] = set()
+        self._catalog = None
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+
+    def lookup(
+        self,
+        message: str,
+        page_context: Optional[str] = None,
+        selected_text: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Find a pre-generated answer for a message.
+
+        Only verbatim quick questions match, answered for the same page type
+        (or the generic "default" page). Messages with selected text are
+        never served from the cache since their context differs.
+
+        Args:
+            message: Incoming user message
+            page_context: Page the user is on
+            selected_text: Text the user highlighted, if any
+
+        Returns:
+            Answer text or None on a miss
+        """
+        if selected_text:
+            return None
+
+        question = message.strip()
+        page_type, slug = get_page_type(page_context)
+
+        if page_type == "product":
+            scope = f"product:{slug}" if slug else None
+            entry = self.answers.get((scope, question)) if scope else None
+            return entry.answer if entry and self._is_fresh(entry) else None
+
+        # Answers were generated with their page's context; only the generic
+        # "default" answers are shared across pages
+        entry = self.answers.get((page_type, question))
+        if entry is None and page_type != "default":
+            entry = self.answers.get(("default", question))
+
+        return entry.answer if entry and self._is_fresh(entry) else None
+
+    def _is_fresh(self, entry: QuickAnswer) -> bool:
+        """Check an entry against the TTL (edited products' entries are dropped)."""
+        return time.time() - entry.generated_at < QUICK_ANSWERS_TTL
+
+    def _drop_product(self, slug: str):
+        scope = f"product:{slug}"
+        for key in [k for k in self.answers if k[0] == scope]:
+            del self.answers[key]
+
+    def _on_catalog_change(self, changed: List[str], removed: List[str]):
+        """Catalog replica listener: drop and queue answers of edited products."""
+        indexes = self._catalog.indexes if self._catalog is not None else None
+        for product_id in list(changed) + list(removed):
+            old_slug = self._slugs.pop(product_id, None)
+            if old_slug:
+                self._drop_product(old_slug)
+                self._dirty.discard(old_slug)
+            doc = indexes.by_id.get(product_id) if indexes and product_id not in removed else None
+            if doc and doc.get("slug"):
+                self._slugs[product_id] = doc["slug"]
+                self._drop_product(doc["slug"])
+                self._dirty.add(doc["slug"])
+
+    async def _generate(self, question: str, page_context: str, extra_context: Optional[str] = None) -> Optional[str]:
+        """Generate one answer through the agent."""
+        from services.agent import run_agent_query
+
+        result = await run_agent_query(
+            user_message=question,
+            page_context=page_context,
+            extra_context=extra_context
+        )
+        if not result.get("success") or not result.get("response"):
+            return None
+        return result["response"]
+
+    async def refresh(self, force: bool = False) -> int:
+        """
+        Regenerate answers if the catalog changed or the TTL expired.
+
+        Args:
+            force: Regenerate even if answers are still fresh
+
+        Returns:
+            Number of answers generated
+        """
+        async with self._refresh_lock:
+            server = await get_sanity_server()
+            if self._catalog is not server.catalog:
+                self._catalog = server.catalog
+                self._catalog.add_listener(self._on_catalog_change)
+            version = await server.get_catalog_version()
+            expired = time.time() - self.last_refresh >= QUICK_ANSWERS_TTL
+            incremental = server._use_catalog
+
+            if not force and not expired and self.answers:
+                if incremental and self._dirty:
+                    return await self._refresh_products(server, version, sorted(self._dirty))
+                if incremental or version == self.catalog_version:
+                    return 0
+
+            logger.info(f"Refreshing quick answers (catalog version {version})")
+
+            jobs: List[Tuple[Tuple[str, str], str, Optional[str]]] = []
+            for page_type, questions in QUICK_QUESTIONS.items():
+                if page_type == "product":
+                    continue
+                for question in questions:
+                    jobs.append(((page_type, question), PAGE_PATHS[page_type], None))
+
+            slugs = await server.get_all_product_slugs() or []
+            jobs += await self._product_jobs(server, slugs)
+            # Edits made while this runs are queued again by the listener
+            self._dirty.difference_update(slugs)
+
+            generated = await self._run_jobs(jobs, version)
+            if jobs and generated < len(jobs) * QUICK_ANSWERS_MIN_SUCCESS:
+                # Keep what worked alongside the previous answers; retry at
+                # the next check instead of waiting out the TTL
+                logger.warning(f"Generated only {generated}/{len(jobs)} quick answers, will retry")
+                return generated
+
+            self.catalog_version = version
+            self.last_refresh = time.time()
+            logger.info(f"Generated {generated}/{len(jobs)} quick answers")
+            return generated
+
+    async def _product_jobs(self, server, slugs: List[str]) -> List[Tuple[Tuple[str, str], str, Optional[str]]]:
+        """Generation jobs for the questions of each product page."""
+        # Lookups issued together are batched into one query per tick
+        products = await asyncio.gather(*(server.get_product_by_slug(slug) for slug in slugs))
+        jobs = []
+        for slug, product in zip(slugs, products):
+            if not product:
+                continue
+            if product.get("_id"):
+                self._slugs[product["_id"]] = slug
+            product_context = _format_product_context(product)
+            for question in _product_questions():
+                jobs.append(((f"product:{slug}", question), f"/products/{slug}", product_context))
+        return jobs
+
+    async def _refresh_products(self, server, version: Optional[str], slugs: List[str]) -> int:
+        """Regenerate the answers of edited products only."""
+        self._dirty.difference_update(slugs)
+        jobs = await self._product_jobs(server, slugs)
+        generated = await self._run_jobs(jobs, version)
+        failed = {key[0][len("product:"):] for key, _, _ in jobs if key not in self.answers}
+        # Retried at the next check
+        self._dirty.update(failed)
+        logger.info(f"Regenerated {generated}/{len(jobs)} quick answers for {len(slugs)} edited product(s)")
+        return generated
+
+    async def _run_jobs(self, jobs: List[Tuple[Tuple[str, str], str, Optional[str]]], version: Optional[str]) -> int:
+        """Generate answers; a failed job keeps the key's previous answer."""
+        semaphore = asyncio.Semaphore(QUICK_ANSWERS_CONCURRENCY)
+        generated = 0
+
+        async def run_job(key, page_context, extra_context):
+            nonlocal generated
+            async with semaphore:
+                answer = await self._generate(key[1], page_context, extra_context)
+            if answer:
+                self.answers[key] = QuickAnswer(answer, version, time.time())
+                generated += 1
+
+        await asyncio.gather(*(run_job(*job) for job in jobs))
+        return generated
+
+    async def _run(self):
+        """Background loop checking for catalog changes and TTL expiry."""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Quick answer refresh failed: {e}")
+            await asyncio.sleep(QUICK_ANSWERS_CHECK_INTERVAL)
+
+    def start(self):
+        """Start the background refresher."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background refresher."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global cache instance
+_quick_answer_cache: Optional[QuickAnswerCache] = None
+
+
+def get_quick_answer_cache() -> QuickAnswerCache:
+    """Get or create the quick answer cache instance."""
+    global _quick_answer_cache
+    if _quick_answer_cache is None:
+        _quick_answer_cache = QuickAnswerCache()
+    return _quick_answer_cache
@@ -0,0 +1,416 @@
+"""
+Resilience Layer - Deadlines, retries, hedging and circuit breaking for LLM calls.
+
+ResilientLLMProvider wraps any LLMProvider so a slow or failing model cannot
+pile up blocked requests:
+- every call runs under a per-call deadline
+- retryable failures (timeouts, connection errors, 429/5xx) are retried a
+  bounded number of times with full-jitter exponential backoff
+- optionally, a hedged second request is sent once a call has been running
+  longer than the observed p95 latency, and the first success wins
+- a circuit breaker opens after consecutive failures; while open, calls fail
+  fast with CircuitOpenError so callers can answer from a cache or fallback
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, List, AsyncIterator, Callable, Awaitable
+
+from services.llm import LLMProvider, LLMResponse, LLMChunk
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 4.0))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+LLM_FALLBACK_CACHE_SIZE = int(os.getenv("LLM_FALLBACK_CACHE_SIZE", 500))
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+FALLBACK_MESSAGE = (
+    "I'm sorry, our assistant is temporarily unavailable. Please try again in a "
+    "moment, or browse our products and contact page in the meantime."
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a call."""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Extract an HTTP status code from a provider exception, if any."""
+    for attr in ("code", "status_code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether a failed call is worth retrying."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, OSError)):
+        return True
+    # Programming errors will fail the same way again
+    if isinstance(error, (TypeError, ValueError, KeyError, AttributeError)):
+        return False
+    status = _status_code(error)
+    return status is None or status in RETRYABLE_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed -> open after `failure_threshold` consecutive failures.
+    open -> half_open once `reset_timeout` has elapsed; one probe call is let
+    through. A successful probe closes the breaker, a failed one reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = LLM_BREAKER_RESET_SECONDS
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Check whether a call may proceed."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def release_probe(self):
+        """
+        Let another probe through after one ended without an outcome.
+
+        Called when the probe was cancelled (client disconnect) or failed
+        with a non-retryable error; the breaker stays half-open.
+        """
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            logger.info("LLM circuit breaker closed")
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(
+                    f"LLM circuit breaker opened after {self.consecutive_failures} failure(s)"
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class FallbackAnswerCache:
+    """LRU of recent successful answers, served while the breaker is open."""
+
+    def __init__(self, max_size: int = LLM_FALLBACK_CACHE_SIZE):
+        self.max_size = max_size
+        self._answers: "OrderedDict[tuple, str]" = OrderedDict()
+
+    @staticmethod
+    def _key(message: str, page_context: Optional[str]) -> tuple:
+        return (" ".join(message.lower().split()), page_context or "/")
+
+    def get(self, message: str, page_context: Optional[str] = None) -> Optional[str]:
+        key = self._key(message, page_context)
+        answer = self._answers.get(key)
+        if answer is not None:
+            self._answers.move_to_end(key)
+        return answer
+
+    def put(self, message: str, page_context: Optional[str], answer: str):
+        key = self._key(message, page_context)
+        self._answers[key] = answer
+        self._answers.move_to_end(key)
+        while len(self._answers) > self.max_size:
+            self._answers.popitem(last=False)
+
+
+class ResilientLLMProvider(LLMProvider):
+    """LLMProvider wrapper adding deadlines, retries, hedging and a circuit breaker."""
+
+    def __init__(
+        self,
+        inner: LLMProvider,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.inner = inner
+        self.name = inner.name
+        self.model = inner.model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies: deque = deque(maxlen=200)
+        # Time to first chunk of streams; kept apart because it is far
+        # shorter than a whole generate() call and would skew the hedge delay
+        self.first_chunk_latencies: deque = deque(maxlen=200)
+        self.counters: Dict[str, int] = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "short_circuits": 0,
+        }
+
+    def _check_breaker(self) -> bool:
+        """
+        Admit a call or raise CircuitOpenError.
+
+        Returns:
+            True if the call is the half-open breaker's probe
+        """
+        if not self.breaker.allow():
+            self.counters["short_circuits"] += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+        return self.breaker.state == CircuitBreaker.HALF_OPEN
+
+    def _p95(self, samples: Optional[deque] = None) -> Optional[float]:
+        """p95 of recent successful call latencies (or the given samples) in seconds."""
+        samples = self.latencies if samples is None else samples
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+
+    def _record_failure(self, error: Exception):
+        self.counters["failures"] += 1
+        if isinstance(error, asyncio.TimeoutError):
+            self.counters["timeouts"] += 1
+        # Client errors are our fault, not a sign of provider trouble, and
+        # say nothing about its health either way
+        if is_retryable(error):
+            self.breaker.record_failure()
+
+    async def _hedged(self, call: Callable[[], Awaitable[LLMResponse]]) -> LLMResponse:
+        """Run a call, sending a second copy if the first exceeds p95 latency."""
+        p95 = self._p95() if self.hedge else None
+        if p95 is None:
+            return await call()
+
+        primary = asyncio.create_task(call())
+        hedge: Optional[asyncio.Task] = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=max(p95, LLM_HEDGE_MIN_DELAY))
+            if done:
+                return primary.result()
+
+            self.counters["hedges"] += 1
+            hedge = asyncio.create_task(call())
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def generate(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_output_tokens: int = 2048,
+        tools: Optional[List[Callable]] = None
+    ) -> LLMResponse:
+        self.counters["calls"] += 1
+        probe = self._check_breaker()
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = time.monotonic()
+                try:
+                    response = await asyncio.wait_for(
+                        self._hedged(lambda: self.inner.generate(
+                            messages, system_instruction, temperature, max_output_tokens, tools
+                        )),
+                        timeout=self.timeout
+                    )
+                except Exception as e:
+                    self._record_failure(e)
+                    if (
+                        not is_retryable(e)
+                        or attempt == self.max_retries
+                        or self.breaker.state == CircuitBreaker.OPEN
+                    ):
+                        raise
+                    self.counters["retries"] += 1
+                    logger.warning(f"LLM call failed ({e!r}), retry {attempt + 1}/{self.max_retries}")
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+
+                self.latencies.append(time.monotonic() - started)
+                self.counters["successes"] += 1
+                self.breaker.record_success()
+                return response
+        finally:
+            # A cancelled probe (client disconnect) records no outcome; free
+            # the slot so the breaker can probe again
+            if probe:
+                self.breaker.release_probe()
+
+    async def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_output_tokens: int = 2048,
+        tools: Optional[List[Callable]] = None
+    ) -> AsyncIterator[LLMChunk]:
+        self.counters["calls"] += 1
+        probe = self._check_breaker()
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                iterator = self.inner.stream(
+                    messages, system_instruction, temperature, max_output_tokens, tools
+                ).__aiter__()
+
+                # Retries are only safe before anything has been sent to the caller
+                started = time.monotonic()
+                try:
+                    first = await asyncio.wait_for(iterator.__anext__(), timeout=self.timeout)
+                except StopAsyncIteration:
+                    self.counters["successes"] += 1
+                    self.breaker.record_success()
+                    return
+                except Exception as e:
+                    self._record_failure(e)
+                    if (
+                        not is_retryable(e)
+                        or attempt == self.max_retries
+                        or self.breaker.state == CircuitBreaker.OPEN
+                    ):
+                        raise
+                    self.counters["retries"] += 1
+                    logger.warning(f"LLM stream failed ({e!r}), retry {attempt + 1}/{self.max_retries}")
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+
+                self.first_chunk_latencies.append(time.monotonic() - started)
+                yield first
+
+                # Each subsequent chunk gets its own idle deadline
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), timeout=self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        yield chunk
+                except Exception as e:
+                    self._record_failure(e)
+                    raise
+
+                self.counters["successes"] += 1
+                self.breaker.record_success()
+                return
+        finally:
+            # A cancelled probe (client disconnect) records no outcome; free
+            # the slot so the breaker can probe again
+            if probe:
+                self.breaker.release_probe()
+
+    async def count_tokens(
+        self,
+        messages: List[Dict[str, Any]],
+        system_instruction: Optional[str] = None
+    ) -> int:
+        return await asyncio.wait_for(
+            self.inner.count_tokens(messages, system_instruction),
+            timeout=self.timeout
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        """Breaker state, retry counts and latency for health reporting."""
+        p95 = self._p95()
+        first_chunk_p95 = self._p95(self.first_chunk_latencies)
+        return {
+            "provider": self.name,
+            "breaker_state": self.breaker.state,
+            "breaker_consecutive_failures": self.breaker.consecutive_failures,
+            "breaker_times_opened": self.breaker.times_opened,
+            "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "p95_first_chunk_ms": round(first_chunk_p95 * 1000, 1) if first_chunk_p95 is not None else None,
+            **self.counters,
+        }
+
+
+# Global fallback cache instance
+_fallback_cache: Optional[FallbackAnswerCache] = None
+
+
+def get_fallback_cache() -> FallbackAnswerCache:
+    """Get or create the fallback answer cache."""
+    global _fallback_cache
+    if _fallback_cache is None:
+        _fallback_cache = FallbackAnswerCache()
+    return _fallback_cache
+
+
+def get_llm_metrics() -> Dict[str, Any]:
+    """Get resilience metrics for the active LLM provider."""
+    from services.llm import get_llm_provider
+
+    provider = get_llm_provider()
+    if isinstance(provider, ResilientLLMProvider):
+        return provider.metrics()
+    return {"provider": provider.name, "breaker_state": "disabled"}
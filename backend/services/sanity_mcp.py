@@ -5,11 +5,33 @@ Phase 12: MCP Server Development
 
 import os
 import asyncio
-import json
-from typing import Dict, Any, Optional, List
+import random
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from datetime import datetime
 import httpx
 
+from services.catalog import CatalogReplica, CATALOG_REPLICA_ENABLED, encode_cursor, decode_cursor
+from services.groq_cache import GroqResultCache, GROQ_CACHE_ENABLED
+from services.batch_loader import BatchLoader
+from services.tool_encoding import encode_tool_result
+from services.search_engine import FacetedSearchIndex
+from services.http_cache import CachePolicy, aiohttp_cache_middleware
+from utils.json_codec import dumpb, dumps, loads
+
+# Optional transport extras: HTTP/2 needs h2, brotli decoding needs brotli
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import brotli  # noqa: F401
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
 # Configuration
 SANITY_PROJECT_ID = os.getenv("NEXT_PUBLIC_SANITY_PROJECT_ID", "")
 SANITY_DATASET = os.getenv("NEXT_PUBLIC_SANITY_DATASET", "production")
@@ -18,35 +40,237 @@ SANITY_API_VERSION = "2024-01-01"
 
 SANITY_BASE_URL = f"https://{SANITY_PROJECT_ID}.api.sanity.io/v{ SANITY_API_VERSION}"
 
+# HTTP client settings
+SANITY_MAX_CONNECTIONS = int(os.getenv("SANITY_MAX_CONNECTIONS", 20))
+SANITY_MAX_KEEPALIVE = int(os.getenv("SANITY_MAX_KEEPALIVE", 10))
+SANITY_KEEPALIVE_EXPIRY = float(os.getenv("SANITY_KEEPALIVE_EXPIRY", 60))
+SANITY_MAX_CONCURRENCY = int(os.getenv("SANITY_MAX_CONCURRENCY", 10))
+SANITY_MAX_RETRIES = int(os.getenv("SANITY_MAX_RETRIES", 3))
+SANITY_RETRY_BASE_DELAY = float(os.getenv("SANITY_RETRY_BASE_DELAY", 0.2))
+SANITY_RETRY_MAX_DELAY = float(os.getenv("SANITY_RETRY_MAX_DELAY", 5.0))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Cache-Control for catalog reads on the standalone HTTP server
+CATALOG_HTTP_MAX_AGE = int(os.getenv("CATALOG_HTTP_MAX_AGE", 60))
+CATALOG_HTTP_STALE = int(os.getenv("CATALOG_HTTP_STALE", 300))
+
+# Filters accepted by POST /search/filter (see FacetedSearchIndex.match)
+LISTING_FILTERS = frozenset({
+    "query", "category", "min_price", "max_price", "materials", "colors",
+    "in_stock_only", "featured_only",
+})
+
+# Batched product lookups
+SANITY_BATCH_MAX_KEYS = int(os.getenv("SANITY_BATCH_MAX_KEYS", 100))
+
+# Full product details, as returned by get_product_by_id / get_product_by_slug
+PRODUCT_DETAIL_PROJECTION = """{
+    _id,
+    _type,
+    name,
+    "slug": slug.current,
+    description,
+    shortDescription,
+    price,
+    compareAtPrice,
+    "category": category->{
+        _id,
+        name,
+        "slug": slug.current
+    },
+    mainImage{
+        asset->{
+            _id,
+            url
+        },
+        alt
+    },
+    images[]{
+        asset->{
+            _id,
+            url
+        },
+        alt
+    },
+    dimensions,
+    materials,
+    colors,
+    stockStatus,
+    sku,
+    weight,
+    warranty,
+    careInstructions,
+    featured
+}"""
+
+# Product list shape, as returned by the listing queries
+PRODUCT_LIST_FIELDS = (
+    "_id",
+    "name",
+    '"slug": slug.current',
+    "shortDescription",
+    "price",
+    "compareAtPrice",
+    '"category": category->name',
+    '"imageUrl": mainImage.asset->url',
+    "stockStatus",
+    "featured",
+)
+
+# Memoizing product loaders for the current request (see start_lookup_scope)
+_lookup_scope: ContextVar[Optional[Dict[tuple, BatchLoader]]] = ContextVar("sanity_lookup_scope", default=None)
+
+
+def start_lookup_scope():
+    """
+    Start memoizing product lookups for the current request.
+
+    Lookups made afterwards in this context (including tasks it spawns) share
+    one set of loaders, so a product is fetched at most once per request.
+    """
+    _lookup_scope.set({})
+
 
 class SanityMCPServer:
     """MCP Server for Sanity CMS product queries."""
 
-    def __init__(self):
-        self.base_url = SANITY_BASE_URL
+    def __init__(self, base_url: Optional[str] = None, dataset: str = SANITY_DATASET):
+        self.base_url = base_url or SANITY_BASE_URL
+        self.dataset = dataset
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {SANITY_API_TOKEN}"
         } if SANITY_API_TOKEN else {}
+        if BROTLI_AVAILABLE:
+            self.headers["Accept-Encoding"] = "br, gzip"
+        else:
+            self.headers["Accept-Encoding"] = "gzip"
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(SANITY_MAX_CONCURRENCY)
+        # Local catalog copy answering queries without the network
+        self.catalog = CatalogReplica(
+            lambda query, params=None: self._query(query, params, raise_errors=True)
+        )
+        # Results of queries still sent to Sanity, invalidated by catalog changes
+        self.cache = GroqResultCache()
+        self.catalog.add_listener(self.cache.invalidate_documents)
+        # Batching without memoization, for lookups outside a request scope
+        self._shared_loaders = self._new_loaders(memoize=False)
+
+    @property
+    def _use_catalog(self) -> bool:
+        return CATALOG_REPLICA_ENABLED and self.catalog.ready
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the long-lived pooled HTTP client, creating it on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=SANITY_MAX_CONNECTIONS,
+                    max_keepalive_connections=SANITY_MAX_KEEPALIVE,
+                    keepalive_expiry=SANITY_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(30.0, connect=5.0)
+            )
+        return self._client
+
+    async def close(self):
+        """Stop catalog sync and close the HTTP client and its pooled connections."""
+        await self.catalog.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _new_loaders(self, memoize: bool) -> Dict[str, BatchLoader]:
+        return {
+            "id": BatchLoader(self._fetch_products_by_ids, SANITY_BATCH_MAX_KEYS, memoize),
+            "slug": BatchLoader(self._fetch_products_by_slugs, SANITY_BATCH_MAX_KEYS, memoize),
+        }
+
+    def _loaders(self) -> Dict[str, BatchLoader]:
+        """Product loaders for the current request scope, if any."""
+        scope = _lookup_scope.get()
+        if scope is None:
+            return self._shared_loaders
+        key = (id(self),)
+        if key not in scope:
+            scope[key] = self._new_loaders(memoize=True)
+        return scope[key]
+
+    async def _fetch_products_by_ids(self, product_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Batch function: full product details for several IDs in one query."""
+        query = f'*[_type == "product" && _id in $ids] {PRODUCT_DETAIL_PROJECTION}'
+        result = await self._fetch(query, {"ids": sorted(product_ids)})
+        return {doc["_id"]: doc for doc in result or []}
+
+    async def _fetch_products_by_slugs(self, slugs: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Batch function: full product details for several slugs in one query."""
+        query = f'*[_type == "product" && slug.current in $slugs] {PRODUCT_DETAIL_PROJECTION}'
+        result = await self._fetch(query, {"slugs": sorted(slugs)})
+        return {doc["slug"]: doc for doc in result or [] if doc.get("slug")}
+
+    @staticmethod
+    def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Delay before a retry: Retry-After if given, else full-jitter backoff."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), SANITY_RETRY_MAX_DELAY)
+        return random.uniform(0, min(SANITY_RETRY_MAX_DELAY, SANITY_RETRY_BASE_DELAY * (2 ** attempt)))
 
     async def _fetch(self, query: str, params: Dict = None) -> Any:
-        """Execute GROQ query against Sanity API."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/data/query/{SANITY_DATASET}",
-                headers=self.headers,
-                json={
-                    "query": query,
-                    "params": params or {}
-                },
-                timeout=30.0
+        """Execute GROQ query, served from the result cache when possible."""
+        if not GROQ_CACHE_ENABLED:
+            return await self._query(query, params)
+        try:
+            return await self.cache.get(
+                query,
+                params,
+                lambda: self._query(query, params, raise_errors=True)
             )
+        except RuntimeError:
+            # API error, already logged by _query; not cached
+            return []
+
+    async def _query(self, query: str, params: Dict = None, raise_errors: bool = False) -> Any:
+        """
+        Execute GROQ query against Sanity API.
+
+        API errors are logged and return an empty result, or raise
+        RuntimeError when `raise_errors` is set.
+        """
+        client = self._get_client()
+        url = f"{self.base_url}/data/query/{self.dataset}"
+        body = {
+            "query": query,
+            "params": params or {}
+        }
+
+        for attempt in range(SANITY_MAX_RETRIES + 1):
+            try:
+                async with self._semaphore:
+                    response = await client.post(url, json=body)
+            except httpx.TransportError:
+                if attempt == SANITY_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+
             if response.status_code == 200:
                 data = response.json()
                 return data.get("result", [])
-            else:
-                print(f"Sanity API error: {response.status_code} - {response.text}")
-                return []
+
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < SANITY_MAX_RETRIES:
+                await asyncio.sleep(self._retry_delay(attempt, response))
+                continue
+
+            print(f"Sanity API error: {response.status_code} - {response.text}")
+            if raise_errors:
+                raise RuntimeError(f"Sanity API error: {response.status_code}")
+            return []
 
     async def search_products_by_name(
         self,
@@ -63,6 +287,9 @@ class SanityMCPServer:
         Returns:
             List of matching products
         """
+        if self._use_catalog:
+            return self.catalog.search_products_by_name(name, limit)
+
         query = """
         *[_type == "product" && name match $name] | order(_score desc) [0...$limit] {
             _id,
@@ -79,6 +306,29 @@ class SanityMCPServer:
         """
         return await self._fetch(query, {"name": f"{name}*", "limit": limit})
 
+    async def suggest(self, query: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """
+        Autocomplete product and category names.
+
+        Served from the replica's typo-tolerant index; until it is ready,
+        falls back to a name prefix search (products only, no typo tolerance).
+
+        Args:
+            query: Text typed so far
+            limit: Maximum number of suggestions
+
+        Returns:
+            List of suggestions (type, id, name, slug, distance)
+        """
+        if self._use_catalog:
+            return self.catalog.suggest(query, limit)
+
+        products = await self.search_products_by_name(query, limit)
+        return [
+            {"type": "product", "id": p.get("_id"), "name": p.get("name"), "slug": p.get("slug"), "distance": 0}
+            for p in products
+        ]
+
     async def get_product_by_id(self, product_id: str) -> Optional[Dict[str, Any]]:
         """
         Get full product details by ID.
@@ -89,48 +339,12 @@ class SanityMCPServer:
         Returns:
             Product details or None
         """
-        query = """
-        *[_type == "product" && _id == $id][0] {
-            _id,
-            _type,
-            name,
-            "slug": slug.current,
-            description,
-            shortDescription,
-            price,
-            compareAtPrice,
-            "category": category->{
-                _id,
-                name,
-                "slug": slug.current
-            },
-            mainImage{
-                asset->{
-                    _id,
-                    url
-                },
-                alt
-            },
-            images[]{
-                asset->{
-                    _id,
-                    url
-                },
-                alt
-            },
-            dimensions,
-            materials,
-            colors,
-            stockStatus,
-            sku,
-            weight,
-            warranty,
-            careInstructions,
-            featured
-        }
-        """
-        result = await self._fetch(query, {"id": product_id})
-        return result[0] if result else None
+        if self._use_catalog:
+            product = self.catalog.get_product_by_id(product_id)
+            if product is not None:
+                return product
+
+        return await self._loaders()["id"].load(product_id)
 
     async def get_product_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
         """
@@ -142,53 +356,18 @@ class SanityMCPServer:
         Returns:
             Product details or None
         """
-        query = """
-        *[_type == "product" && slug.current == $slug][0] {
-            _id,
-            _type,
-            name,
-            "slug": slug.current,
-            description,
-            shortDescription,
-            price,
-            compareAtPrice,
-            "category": category->{
-                _id,
-                name,
-                "slug": slug.current
-            },
-            mainImage{
-                asset->{
-                    _id,
-                    url
-                },
-                alt
-            },
-            images[]{
-                asset->{
-                    _id,
-                    url
-                },
-                alt
-            },
-            dimensions,
-            materials,
-            colors,
-            stockStatus,
-            sku,
-            weight,
-            warranty,
-            careInstructions,
-            featured
-        }
-        """
-        result = await self._fetch(query, {"slug": slug})
-        return result[0] if result else None
+        if self._use_catalog:
+            product = self.catalog.get_product_by_slug(slug)
+            if product is not None:
+                return product
+
+        return await self._loaders()["slug"].load(slug)
 
     async def get_products_by_category(
         self,
         category_name: str,
-        limit: int = 20
+        limit: int = 20,
+        cursor: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         Get products by category name.
@@ -196,25 +375,13 @@ class SanityMCPServer:
         Args:
             category_name: Category name to filter by
             limit: Maximum number of results
+            cursor: Continue after a previous page (see products_page)
 
         Returns:
             List of products in category
         """
-        query = """
-        *[_type == "product" && category->name == $category] | order(_createdAt desc) [0...$limit] {
-            _id,
-            name,
-            "slug": slug.current,
-            shortDescription,
-            price,
-            compareAtPrice,
-            "category": category->name,
-            "imageUrl": mainImage.asset->url,
-            stockStatus,
-            featured
-        }
-        """
-        return await self._fetch(query, {"category": category_name, "limit": limit})
+        page = await self.products_page(category=category_name, limit=limit, cursor=cursor)
+        return page["products"]
 
     async def search_products_by_filter(
         self,
@@ -224,7 +391,10 @@ class SanityMCPServer:
         materials: Optional[List[str]] = None,
         in_stock_only: bool = False,
         featured_only: bool = False,
-        limit: int = 20
+        limit: int = 20,
+        query: Optional[str] = None,
+        colors: Optional[List[str]] = None,
+        cursor: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         Advanced product search with filters.
@@ -233,25 +403,95 @@ class SanityMCPServer:
             category: Category name filter
             min_price: Minimum price filter
             max_price: Maximum price filter
-            materials: List of materials to filter
+            materials: Materials to filter by (any of)
             in_stock_only: Only show in-stock items
             featured_only: Only show featured items
             limit: Maximum number of results
+            query: Text matched against name and descriptions
+            colors: Color names to filter by (any of)
+            cursor: Continue after a previous page (see products_page)
 
         Returns:
             List of matching products
         """
+        page = await self.products_page(
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            materials=materials,
+            in_stock_only=in_stock_only,
+            featured_only=featured_only,
+            limit=limit,
+            query=query,
+            colors=colors,
+            cursor=cursor,
+            extra_fields=("materials", "dimensions")
+        )
+        return page["products"]
+
+    async def products_page(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        materials: Optional[List[str]] = None,
+        in_stock_only: bool = False,
+        featured_only: bool = False,
+        limit: int = 20,
+        query: Optional[str] = None,
+        colors: Optional[List[str]] = None,
+        cursor: Optional[str] = None,
+        extra_fields: Tuple[str, ...] = ()
+    ) -> Dict[str, Any]:
+        """
+        One page of a filtered product listing, keyset-paginated.
+
+        Products are ordered by (_createdAt, _id) descending. Each page carries
+        an opaque cursor for the page after it, so later pages cost the same as
+        the first instead of growing with an offset.
+
+        Args:
+            category .. colors: Filters, as for search_products_by_filter
+            limit: Page size
+            cursor: next_cursor of the previous page
+            extra_fields: Fields added to the product list shape
+
+        Returns:
+            Dict with products and next_cursor (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        filters = dict(
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            materials=materials,
+            colors=colors,
+            in_stock_only=in_stock_only,
+            featured_only=featured_only,
+            query=query
+        )
+        if self._use_catalog:
+            return self.catalog.products_page(
+                limit=limit, cursor=cursor, extra_fields=extra_fields, **filters
+            )
+
         # Build filter conditions
         conditions = ['_type == "product"']
+        params: Dict[str, Any] = {"limit": limit + 1}
 
         if category:
             conditions.append('category->name == $category')
+            params["category"] = category
 
         if min_price is not None:
             conditions.append('price >= $minPrice')
+            params["minPrice"] = min_price
 
         if max_price is not None:
             conditions.append('price <= $maxPrice')
+            params["maxPrice"] = max_price
 
         if in_stock_only:
             conditions.append('stockStatus == "in-stock"')
@@ -259,37 +499,124 @@ class SanityMCPServer:
         if featured_only:
             conditions.append('featured == true')
 
+        if materials:
+            conditions.append('count(materials[@ in $materials]) > 0')
+            params["materials"] = materials
+
+        if colors:
+            conditions.append('count(colors[name in $colors]) > 0')
+            params["colors"] = colors
+
+        if query:
+            conditions.append('[name, shortDescription, pt::text(description)] match $query')
+            params["query"] = [f"{term}*" for term in query.split()]
+
+        if cursor:
+            params["cursorCreatedAt"], params["cursorId"] = decode_cursor(cursor)
+            conditions.append(
+                '(_createdAt < $cursorCreatedAt || (_createdAt == $cursorCreatedAt && _id < $cursorId))'
+            )
+
         filter_query = " && ".join(conditions)
+        projection = ",\n            ".join(("_createdAt",) + PRODUCT_LIST_FIELDS + extra_fields)
 
-        query = f"""
-        *[{filter_query}] | order(_createdAt desc) [0...$limit] {{
-            _id,
-            name,
-            "slug": slug.current,
-            shortDescription,
-            price,
-            compareAtPrice,
-            "category": category->name,
-            "imageUrl": mainImage.asset->url,
-            stockStatus,
-            featured,
-            materials,
-            dimensions
+        # One extra product tells whether another page follows
+        groq = f"""
+        *[{filter_query}] | order(_createdAt desc, _id desc) [0...$limit] {{
+            {projection}
         }}
         """
+        products = await self._fetch(groq, params)
 
-        params = {"limit": limit}
-        if category:
-            params["category"] = category
-        if min_price is not None:
-            params["minPrice"] = min_price
-        if max_price is not None:
-            params["maxPrice"] = max_price
+        next_cursor = encode_cursor(products[limit - 1]) if len(products) > limit and limit > 0 else None
+        # Copies: the fetched list may be shared with the result cache
+        products = [
+            {key: value for key, value in product.items() if key != "_createdAt"}
+            for product in products[:limit]
+        ]
+        return {"products": products, "next_cursor": next_cursor}
+
+    async def iter_products(
+        self,
+        page_size: int = 100,
+        cursor: Optional[str] = None,
+        **filters
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Iterate over every product of a filtered listing, one page at a time.
 
-        return await self._fetch(query, params)
+        Only one page is held in memory, so large categories can be streamed.
+
+        Args:
+            page_size: Products fetched per page
+            cursor: Start after this cursor instead of at the newest product
+            **filters: Filters and extra_fields, as for products_page
+
+        Yields:
+            Products, newest first
+        """
+        while True:
+            page = await self.products_page(limit=page_size, cursor=cursor, **filters)
+            for product in page["products"]:
+                yield product
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    async def search_products_faceted(
+        self,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        materials: Optional[List[str]] = None,
+        colors: Optional[List[str]] = None,
+        in_stock_only: bool = False,
+        featured_only: bool = False,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """
+        Filtered product search with facet counts.
+
+        Takes the same filters as search_products_by_filter. Served by the
+        catalog replica's search engine; until the replica is ready, the total
+        and facet counts cover only the products returned by the API.
+
+        Returns:
+            Dict with products, total match count and per-facet value counts
+        """
+        if self._use_catalog:
+            return self.catalog.search_products_faceted(
+                query=query,
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                materials=materials,
+                colors=colors,
+                in_stock_only=in_stock_only,
+                featured_only=featured_only,
+                limit=limit
+            )
+
+        products = await self.search_products_by_filter(
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            materials=materials,
+            in_stock_only=in_stock_only,
+            featured_only=featured_only,
+            limit=limit,
+            query=query,
+            colors=colors
+        )
+        index = FacetedSearchIndex(products)
+        return {"products": products, "total": len(products), "facets": index.facet_counts(index.all)}
 
     async def get_all_categories(self) -> List[Dict[str, Any]]:
         """Get all product categories."""
+        if self._use_catalog:
+            return self.catalog.get_all_categories()
+
         query = """
         *[_type == "category"] | order(name asc) {
             _id,
@@ -303,6 +630,9 @@ class SanityMCPServer:
 
     async def get_featured_products(self, limit: int = 6) -> List[Dict[str, Any]]:
         """Get featured products."""
+        if self._use_catalog:
+            return self.catalog.get_featured_products(limit)
+
         query = """
         *[_type == "product" && featured == true] | order(_createdAt desc) [0...$limit] {
             _id,
@@ -319,6 +649,34 @@ class SanityMCPServer:
         """
         return await self._fetch(query, {"limit": limit})
 
+    async def get_all_product_slugs(self) -> List[str]:
+        """Get the slug of every product in the catalog."""
+        if self._use_catalog:
+            return self.catalog.get_all_product_slugs()
+
+        query = """
+        *[_type == "product" && defined(slug.current)] | order(_createdAt desc).slug.current
+        """
+        return await self._fetch(query)
+
+    async def get_catalog_version(self) -> Optional[str]:
+        """
+        Get a version stamp for the product catalog.
+
+        The stamp is the most recent `_updatedAt` across products and
+        categories, so it changes whenever any catalog document is edited.
+
+        Returns:
+            ISO timestamp string or None if the catalog is empty
+        """
+        if self._use_catalog:
+            return self.catalog.version
+
+        query = """
+        *[_type in ["product", "category"]] | order(_updatedAt desc)[0]._updatedAt
+        """
+        return await self._fetch(query) or None
+
 
 # Global server instance
 _sanity_server: Optional[SanityMCPServer] = None
@@ -332,18 +690,28 @@ async def get_sanity_server() -> SanityMCPServer:
     return _sanity_server
 
 
+async def close_sanity_server():
+    """Close the Sanity MCP server's HTTP client."""
+    global _sanity_server
+    if _sanity_server is not None:
+        await _sanity_server.close()
+        _sanity_server = None
+
+
 # Tool functions that can be called by the agent
+# Results are encoded compactly for the model (see services/tool_encoding.py)
 
 async def search_products(query: str, category: Optional[str] = None) -> str:
     """
     Tool: Search products by name or description.
+    Names are matched as you type and tolerate misspellings.
 
     Args:
         query: Product name or search term
         category: Optional category to filter by
 
     Returns:
-        JSON string of matching products
+        Compact text listing of matching products
     """
     server = await get_sanity_server()
 
@@ -352,7 +720,7 @@ async def search_products(query: str, category: Optional[str] = None) -> str:
     else:
         products = await server.search_products_by_name(query, limit=10)
 
-    return json.dumps(products, indent=2)
+    return encode_tool_result("search_products", products)
 
 
 async def get_product_details(product_id: str) -> str:
@@ -363,15 +731,15 @@ async def get_product_details(product_id: str) -> str:
         product_id: Sanity product document ID
 
     Returns:
-        JSON string of product details
+        Compact text listing of product details
     """
     server = await get_sanity_server()
     product = await server.get_product_by_id(product_id)
 
     if not product:
-        return json.dumps({"error": "Product not found"})
+        return encode_tool_result("get_product_details", {"error": "Product not found"})
 
-    return json.dumps(product, indent=2)
+    return encode_tool_result("get_product_details", product)
 
 
 async def get_product_by_slug_tool(slug: str) -> str:
@@ -382,15 +750,15 @@ async def get_product_by_slug_tool(slug: str) -> str:
         slug: Product URL slug
 
     Returns:
-        JSON string of product details
+        Compact text listing of product details
     """
     server = await get_sanity_server()
     product = await server.get_product_by_slug(slug)
 
     if not product:
-        return json.dumps({"error": "Product not found"})
+        return encode_tool_result("get_product_by_slug_tool", {"error": "Product not found"})
 
-    return json.dumps(product, indent=2)
+    return encode_tool_result("get_product_by_slug_tool", product)
 
 
 async def get_products_by_category_tool(category: str, limit: int = 20) -> str:
@@ -402,12 +770,12 @@ async def get_products_by_category_tool(category: str, limit: int = 20) -> str:
         limit: Maximum results
 
     Returns:
-        JSON string of products
+        Compact text listing of products
     """
     server = await get_sanity_server()
     products = await server.get_products_by_category(category, limit=limit)
 
-    return json.dumps(products, indent=2)
+    return encode_tool_result("get_products_by_category_tool", products)
 
 
 async def search_products_filtered(
@@ -415,6 +783,8 @@ async def search_products_filtered(
     category: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
+    materials: Optional[List[str]] = None,
+    colors: Optional[List[str]] = None,
     in_stock_only: bool = False,
     featured_only: bool = False,
     limit: int = 20
@@ -423,28 +793,33 @@ async def search_products_filtered(
     Tool: Search products with advanced filters.
 
     Args:
-        query: Search term (optional)
+        query: Search term matched against names and descriptions (optional)
         category: Category filter
         min_price: Minimum price
         max_price: Maximum price
+        materials: Materials, any of (e.g. ["leather", "oak"])
+        colors: Color names, any of
         in_stock_only: Filter in-stock only
         featured_only: Filter featured only
         limit: Maximum results
 
     Returns:
-        JSON string of matching products
+        Compact text listing of matching products with facet counts
     """
     server = await get_sanity_server()
-    products = await server.search_products_by_filter(
+    result = await server.search_products_faceted(
+        query=query,
         category=category,
         min_price=min_price,
         max_price=max_price,
+        materials=materials,
+        colors=colors,
         in_stock_only=in_stock_only,
         featured_only=featured_only,
         limit=limit
     )
 
-    return json.dumps(products, indent=2)
+    return encode_tool_result("search_products_filtered", result)
 
 
 async def get_categories() -> str:
@@ -452,12 +827,12 @@ async def get_categories() -> str:
     Tool: Get all product categories.
 
     Returns:
-        JSON string of categories
+        Compact text listing of categories
     """
     server = await get_sanity_server()
     categories = await server.get_all_categories()
 
-    return json.dumps(categories, indent=2)
+    return encode_tool_result("get_categories", categories)
 
 
 async def get_featured(limit: int = 6) -> str:
@@ -468,57 +843,145 @@ async def get_featured(limit: int = 6) -> str:
         limit: Maximum number of results
 
     Returns:
-        JSON string of featured products
+        Compact text listing of featured products
     """
     server = await get_sanity_server()
     products = await server.get_featured_products(limit=limit)
 
-    return json.dumps(products, indent=2)
+    return encode_tool_result("get_featured", products)
 
 
 # MCP Server runner for standalone execution
 
 async def run_sanity_mcp_server(port: int = 3001):
     """Run the Sanity MCP server as HTTP server."""
+    from functools import partial
     from aiohttp import web
 
+    json_response = partial(web.json_response, dumps=dumps)
+
+    # Handlers serve the full JSON shapes straight from the server methods
     async def handle_search_products(request):
+        server = await get_sanity_server()
         query = request.query.get("q", "")
         category = request.query.get("category")
-        result = await search_products(query, category)
-        return web.json_response(json.loads(result))
+        if category:
+            products = await server.get_products_by_category(category, limit=10)
+        else:
+            products = await server.search_products_by_name(query, limit=10)
+        return json_response(products)
 
     async def handle_get_product(request):
-        product_id = request.match_info["product_id"]
-        result = await get_product_details(product_id)
-        return web.json_response(json.loads(result))
+        server = await get_sanity_server()
+        product = await server.get_product_by_id(request.match_info["product_id"])
+        return json_response(product or {"error": "Product not found"})
 
     async def handle_get_by_slug(request):
-        slug = request.match_info["slug"]
-        result = await get_product_by_slug_tool(slug)
-        return web.json_response(json.loads(result))
+        server = await get_sanity_server()
+        product = await server.get_product_by_slug(request.match_info["slug"])
+        return json_response(product or {"error": "Product not found"})
+
+    def wants_ndjson(request) -> bool:
+        return (
+            request.query.get("format") == "ndjson"
+            or "application/x-ndjson" in request.headers.get("Accept", "")
+        )
+
+    async def stream_ndjson(request, server, filters: Dict[str, Any], cursor: Optional[str]):
+        # One product per line, written as each page arrives
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        async for product in server.iter_products(cursor=cursor, **filters):
+            await response.write(dumpb(product) + b"\n")
+        await response.write_eof()
+        return response
+
+    def bad_request(message: str):
+        return json_response({"error": message}, status=400)
+
+    def parse_limit(value: Any, default: int):
+        # Returns the limit, or None if it is not a positive integer
+        if value is None:
+            return default
+        if isinstance(value, bool):
+            return None
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            return None
+        return limit if limit > 0 else None
+
+    async def listing_response(request, server, filters: Dict[str, Any], limit: int, cursor: Optional[str]):
+        # Reject a bad cursor before a stream's headers go out
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError as e:
+                return bad_request(str(e))
+        if wants_ndjson(request):
+            return await stream_ndjson(request, server, filters, cursor)
+        try:
+            page = await server.products_page(limit=limit, cursor=cursor, **filters)
+        except ValueError as e:
+            return bad_request(str(e))
+        headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else None
+        return json_response(page["products"], headers=headers)
 
     async def handle_get_category(request):
-        category = request.match_info["category"]
-        limit = int(request.query.get("limit", 20))
-        result = await get_products_by_category_tool(category, limit)
-        return web.json_response(json.loads(result))
+        server = await get_sanity_server()
+        filters = {"category": request.match_info["category"]}
+        limit = parse_limit(request.query.get("limit"), 20)
+        if limit is None:
+            return bad_request("limit must be a positive integer")
+        return await listing_response(request, server, filters, limit, request.query.get("cursor"))
 
     async def handle_search_filtered(request):
-        data = await request.json()
-        result = await search_products_filtered(**data)
-        return web.json_response(json.loads(result))
+        server = await get_sanity_server()
+        try:
+            body = await request.json(loads=loads)
+        except ValueError:
+            return bad_request("Request body must be JSON")
+        if not isinstance(body, dict):
+            return bad_request("Request body must be a JSON object")
+        limit = parse_limit(body.pop("limit", None), 20)
+        if limit is None:
+            return bad_request("limit must be a positive integer")
+        cursor = body.pop("cursor", None) or request.query.get("cursor")
+        if cursor is not None and not isinstance(cursor, str):
+            return bad_request("cursor must be a string")
+        unknown = sorted(set(body) - LISTING_FILTERS)
+        if unknown:
+            return bad_request(f"Unknown filters: {', '.join(unknown)}")
+        filters = {**body, "extra_fields": ("materials", "dimensions")}
+        return await listing_response(request, server, filters, limit, cursor)
 
     async def handle_categories(request):
-        result = await get_categories()
-        return web.json_response(json.loads(result))
+        server = await get_sanity_server()
+        return json_response(await server.get_all_categories())
 
     async def handle_featured(request):
-        limit = int(request.query.get("limit", 6))
-        result = await get_featured(limit)
-        return web.json_response(json.loads(result))
+        server = await get_sanity_server()
+        limit = parse_limit(request.query.get("limit"), 6)
+        if limit is None:
+            return bad_request("limit must be a positive integer")
+        return json_response(await server.get_featured_products(limit=limit))
 
-    app = web.Application()
+    # Catalog reads are validated by the replica's version stamp
+    server = await get_sanity_server()
+
+    def catalog_version(params, query):
+        return server.catalog.version if server._use_catalog else None
+
+    catalog_policy = CachePolicy(
+        f"public, max-age={CATALOG_HTTP_MAX_AGE}, stale-while-revalidate={CATALOG_HTTP_STALE}",
+        version=catalog_version
+    )
+    app = web.Application(middlewares=[aiohttp_cache_middleware({
+        "/categories": catalog_policy,
+        "/featured": catalog_policy,
+        "/product/{product_id}": catalog_policy,
+        "/product/slug/{slug}": catalog_policy,
+    })])
     app.router.add_get("/search", handle_search_products)
     app.router.add_get("/product/{product_id}", handle_get_product)
     app.router.add_get("/product/slug/{slug}", handle_get_by_slug)
@@ -537,10 +1000,11 @@ async def run_sanity_mcp_server(port: int = 3001):
     print(f"  GET  /search?q=<query>&category=<category>")
     print(f"  GET  /product/<product_id>")
     print(f"  GET  /product/slug/<slug>")
-    print(f"  GET  /category/<category>")
+    print(f"  GET  /category/<category>?limit=<n>&cursor=<cursor>")
     print(f"  POST /search/filter")
     print(f"  GET  /categories")
     print(f"  GET  /featured")
+    print(f"Listings send X-Next-Cursor; ?format=ndjson streams every product")
 
     # Keep running
     await asyncio.Event().wait()
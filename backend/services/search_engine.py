@@ -0,0 +1,275 @@
+"""
+Faceted Search Engine - In-process product search over the catalog replica.
+
+Products are numbered by position in newest-first order, and every index maps a
+value to a bitset (a Python int, bit i set for product i):
+- category, materials, colors, stock status and featured
+- text tokens from name, short description, description, category and materials
+Price ranges use the price-sorted order plus prefix bitsets, so a range becomes
+one AND-NOT of two precomputed ints.
+
+Filters are ANDed across facets and ORed within one (any of the requested
+materials or colors). Facet counts are popcounts of the result bitset against
+each facet value. Because bit order is (_createdAt, _id) descending, a keyset
+cursor is a single mask of the positions after it.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Facets reported with every search, mapped to their index attribute
+FACETS = ("category", "materials", "colors", "stock", "featured")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens of a text."""
+    return _TOKEN.findall(text.lower())
+
+
+def _key(value: Any) -> Optional[str]:
+    """Normalized index key for a facet value."""
+    if isinstance(value, dict):
+        value = value.get("name")
+    if value is None or value == "":
+        return None
+    return str(value).strip().lower()
+
+
+def _portable_text(blocks: Any) -> str:
+    if not isinstance(blocks, list):
+        return blocks if isinstance(blocks, str) else ""
+    return " ".join(
+        child.get("text", "")
+        for block in blocks if isinstance(block, dict)
+        for child in block.get("children", []) if isinstance(child, dict)
+    )
+
+
+def iter_bits(bits: int) -> Iterable[int]:
+    """Positions of set bits, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def sort_key(doc: Dict[str, Any]) -> Tuple[str, str]:
+    """Keyset pagination key; documents are ordered by it descending."""
+    return (doc.get("_createdAt") or "", doc.get("_id") or "")
+
+
+@dataclass
+class SearchResult:
+    """Matching documents (one page) plus total and facet counts."""
+    docs: List[Dict[str, Any]]
+    total: int
+    facets: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    has_more: bool = False
+
+
+class FacetedSearchIndex:
+    """Bitset inverted indexes over one catalog snapshot."""
+
+    def __init__(self, docs: List[Dict[str, Any]]):
+        """
+        Args:
+            docs: Full product documents, ordered by sort_key descending
+        """
+        self.docs = docs
+        self.keys = [sort_key(doc) for doc in docs]
+        self.all = (1 << len(docs)) - 1
+        self.category: Dict[str, int] = {}
+        self.materials: Dict[str, int] = {}
+        self.colors: Dict[str, int] = {}
+        self.stock: Dict[str, int] = {}
+        self.featured: Dict[str, int] = {}
+        self.tokens: Dict[str, int] = {}
+        self.name_tokens: List[set] = []
+        # Display labels for facet keys (original casing)
+        self.labels: Dict[str, Dict[str, str]] = {facet: {} for facet in FACETS}
+
+        priced = []
+        for pos, doc in enumerate(docs):
+            bit = 1 << pos
+            self._add("category", doc.get("category"), bit)
+            for material in doc.get("materials") or []:
+                self._add("materials", material, bit)
+            for color in doc.get("colors") or []:
+                self._add("colors", color, bit)
+            self._add("stock", doc.get("stockStatus"), bit)
+            self._add("featured", "yes" if doc.get("featured") is True else "no", bit)
+
+            name_tokens = set(tokenize(doc.get("name") or ""))
+            self.name_tokens.append(name_tokens)
+            text = " ".join((
+                doc.get("shortDescription") or "",
+                _portable_text(doc.get("description")),
+                _key(doc.get("category")) or "",
+                " ".join(str(m) for m in doc.get("materials") or []),
+            ))
+            for token in name_tokens | set(tokenize(text)):
+                self.tokens[token] = self.tokens.get(token, 0) | bit
+
+            price = doc.get("price")
+            if isinstance(price, (int, float)) and not isinstance(price, bool):
+                priced.append((price, pos))
+
+        priced.sort()
+        self.prices = [price for price, _ in priced]
+        # prefix[k] has the bits of the k cheapest products
+        self.price_prefix = [0]
+        for _, pos in priced:
+            self.price_prefix.append(self.price_prefix[-1] | (1 << pos))
+        self.vocabulary = sorted(self.tokens)
+
+    def _add(self, facet: str, value: Any, bit: int):
+        key = _key(value)
+        if key is None:
+            return
+        index = getattr(self, facet)
+        index[key] = index.get(key, 0) | bit
+        label = value.get("name") if isinstance(value, dict) else value
+        self.labels[facet].setdefault(key, str(label))
+
+    # Bitset builders
+
+    def _any_of(self, facet: str, values: Iterable[Any]) -> int:
+        index = getattr(self, facet)
+        bits = 0
+        for value in values:
+            bits |= index.get(_key(value) or "", 0)
+        return bits
+
+    def price_bits(self, min_price: Optional[float], max_price: Optional[float]) -> int:
+        lo = bisect_left(self.prices, min_price) if min_price is not None else 0
+        hi = bisect_right(self.prices, max_price) if max_price is not None else len(self.prices)
+        if hi <= lo:
+            return 0
+        return self.price_prefix[hi] & ~self.price_prefix[lo]
+
+    def text_bits(self, query: str) -> int:
+        """Products matching every query term as a token prefix."""
+        bits = self.all
+        for term in tokenize(query):
+            term_bits = 0
+            start = bisect_left(self.vocabulary, term)
+            for token in self.vocabulary[start:]:
+                if not token.startswith(term):
+                    break
+                term_bits |= self.tokens[token]
+            bits &= term_bits
+            if not bits:
+                break
+        return bits
+
+    def position_after(self, after: Tuple[str, str]) -> int:
+        """Index of the first document strictly after a keyset cursor."""
+        lo, hi = 0, len(self.keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.keys[mid] >= after:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # Search
+
+    def match(
+        self,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        materials: Optional[List[str]] = None,
+        colors: Optional[List[str]] = None,
+        in_stock_only: bool = False,
+        featured_only: bool = False
+    ) -> int:
+        """Bitset of products matching every given filter."""
+        bits = self.all
+        if category:
+            bits &= self.category.get(_key(category), 0)
+        if materials:
+            bits &= self._any_of("materials", materials)
+        if colors:
+            bits &= self._any_of("colors", colors)
+        if in_stock_only:
+            bits &= self.stock.get("in-stock", 0)
+        if featured_only:
+            bits &= self.featured.get("yes", 0)
+        if min_price is not None or max_price is not None:
+            bits &= self.price_bits(min_price, max_price)
+        if query and query.strip():
+            bits &= self.text_bits(query)
+        return bits
+
+    def facet_counts(self, bits: int) -> Dict[str, Dict[str, int]]:
+        """Count of matching products per facet value."""
+        facets = {}
+        for facet in FACETS:
+            counts = {}
+            for key, value_bits in getattr(self, facet).items():
+                count = (bits & value_bits).bit_count()
+                if count:
+                    counts[self.labels[facet][key]] = count
+            facets[facet] = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+        return facets
+
+    def search(
+        self,
+        limit: int = 20,
+        offset: int = 0,
+        facets: bool = True,
+        after: Optional[Tuple[str, str]] = None,
+        relevance: bool = True,
+        **filters
+    ) -> SearchResult:
+        """
+        Run a faceted search.
+
+        Args:
+            limit: Maximum documents to return
+            offset: Documents to skip
+            facets: Compute facet counts
+            after: Keyset cursor (_createdAt, _id); only documents after it
+                are returned
+            relevance: With a text query, put products whose name matches more
+                query terms first; paginated listings turn this off to keep
+                keyset order
+            **filters: See `match`
+
+        Returns:
+            SearchResult with documents in keyset (newest first) or relevance order
+        """
+        matched = self.match(**filters)
+        bits = matched
+        if after is not None:
+            bits &= ~((1 << self.position_after(after)) - 1)
+        positions = iter_bits(bits)
+
+        query_terms = tokenize(filters.get("query") or "")
+        if query_terms and relevance and after is None:
+            def name_score(pos: int) -> int:
+                names = self.name_tokens[pos]
+                return sum(any(n.startswith(t) for n in names) for t in query_terms)
+            positions = sorted(positions, key=lambda pos: -name_score(pos))
+
+        docs = []
+        for i, pos in enumerate(positions):
+            if i < offset:
+                continue
+            if len(docs) >= limit:
+                break
+            docs.append(self.docs[pos])
+
+        return SearchResult(
+            docs=docs,
+            total=matched.bit_count(),
+            facets=self.facet_counts(matched) if facets else {},
+            has_more=bits.bit_count() > offset + len(docs)
+        )
@@ -0,0 +1,298 @@
+"""
+Compact, memory-bounded cache of chat sessions.
+
+The local tier of the session store. Sessions and messages are `__slots__`
+objects instead of dicts: timestamps are integer microseconds, message IDs
+128-bit integers and roles interned strings. Each session keeps at most
+SESSION_MAX_MESSAGES messages in a ring buffer; older ones stay in the
+database.
+
+The cache evicts least recently used sessions beyond SESSION_CACHE_MAX_ENTRIES
+or SESSION_CACHE_MAX_BYTES (estimated), and a sweeper drops sessions idle for
+SESSION_IDLE_TTL seconds.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from database.queries import encode_message_cursor
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", 100))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", 10000))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", 1800))  # seconds
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", 60))  # seconds
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ROLES = {role: sys.intern(role) for role in ("user", "assistant", "system")}
+
+
+def to_micros(value: datetime) -> int:
+    """Microseconds since the epoch of a datetime (naive means UTC)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_micros(micros: int) -> datetime:
+    return datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc).replace(microsecond=micros % 1_000_000)
+
+
+def now_micros() -> int:
+    return time.time_ns() // 1000
+
+
+class CachedMessage:
+    """One message of a cached session."""
+
+    __slots__ = ("message_id", "role", "content", "created_at", "token_usage")
+
+    def __init__(self, message_id: int, role: str, content: str, created_at: int, token_usage: Optional[int] = None):
+        self.message_id = message_id
+        self.role = _ROLES.get(role, role)
+        self.content = content
+        self.created_at = created_at
+        self.token_usage = token_usage
+
+    @classmethod
+    def from_record(cls, record) -> "CachedMessage":
+        """Build from a database MessageRecord."""
+        return cls(record.message_id.int, record.role, record.content,
+                   to_micros(record.created_at), record.token_usage)
+
+    @property
+    def key(self):
+        """Position in (created_at, message_id) order."""
+        return self.created_at, self.message_id
+
+    @property
+    def uuid(self) -> str:
+        return str(UUID(int=self.message_id))
+
+    @property
+    def timestamp(self) -> datetime:
+        return from_micros(self.created_at)
+
+    @property
+    def cursor(self) -> str:
+        return encode_message_cursor(self.timestamp, self.uuid)
+
+    @property
+    def nbytes(self) -> int:
+        return _MESSAGE_BYTES + sys.getsizeof(self.content)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message_id": self.uuid,
+            "role": self.role,
+            "content": self.content,
+            "created_at": self.timestamp,
+            "token_usage": self.token_usage,
+            "cursor": self.cursor
+        }
+
+
+class Session:
+    """
+    Cached chat session.
+
+    `messages` holds the newest messages only. `message_offset` counts the
+    ones before them (dropped from the ring or never loaded), and
+    `summarized_count` is relative to `messages`.
+    """
+
+    __slots__ = ("created_at", "current_page", "messages", "summary", "summarized_count",
+                 "message_offset", "last_access", "nbytes")
+
+    def __init__(self, current_page: Optional[str] = None, created_at: Optional[int] = None,
+                 max_messages: int = SESSION_MAX_MESSAGES):
+        self.created_at = created_at if created_at is not None else now_micros()
+        self.current_page = current_page or "/"
+        self.messages: deque = deque(maxlen=max_messages)
+        self.summary: Optional[str] = None
+        self.summarized_count = 0
+        self.message_offset = 0
+        self.last_access = time.monotonic()
+        self.nbytes = _SESSION_BYTES + sys.getsizeof(self.current_page)
+
+    @property
+    def total_messages(self) -> int:
+        """Messages in the conversation, including ones no longer held."""
+        return self.message_offset + len(self.messages)
+
+    def append(self, message: CachedMessage):
+        """Add a message, dropping the oldest when the ring is full."""
+        if len(self.messages) == self.messages.maxlen:
+            dropped = self.messages[0]
+            self.nbytes -= dropped.nbytes
+            self.message_offset += 1
+            self.summarized_count = max(0, self.summarized_count - 1)
+        self.messages.append(message)
+        self.nbytes += message.nbytes
+
+    def set_page(self, page: str):
+        self.nbytes += sys.getsizeof(page) - sys.getsizeof(self.current_page)
+        self.current_page = page
+
+    def set_summary(self, summary: str, summarized_count: int):
+        self.nbytes += sys.getsizeof(summary) - (sys.getsizeof(self.summary) if self.summary else 0)
+        self.summary = summary
+        self.summarized_count = summarized_count
+
+    def since(self, start: int) -> List[CachedMessage]:
+        """Messages from position `start` of the ring on."""
+        return list(islice(self.messages, start, None))
+
+
+_MESSAGE_BYTES = (
+    sys.getsizeof(CachedMessage(2 ** 127, "user", "", 0))
+    + sys.getsizeof(2 ** 127) + sys.getsizeof(2 ** 60)
+    + 8  # deque slot
+)
+_SESSION_BYTES = sys.getsizeof(Session.__new__(Session)) + sys.getsizeof(deque(maxlen=SESSION_MAX_MESSAGES))
+
+
+class SessionCache:
+    """LRU of sessions bounded by entry count, estimated bytes and idle time."""
+
+    def __init__(
+        self,
+        max_entries: int = SESSION_CACHE_MAX_ENTRIES,
+        max_bytes: int = SESSION_CACHE_MAX_BYTES,
+        idle_ttl: int = SESSION_IDLE_TTL,
+        sweep_interval: int = SESSION_SWEEP_INTERVAL
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._entries: "OrderedDict[str, Session]" = OrderedDict()
+        # Bytes each entry was last accounted at
+        self._sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self._task: Optional[asyncio.Task] = None
+        self._evictions = {"entries": 0, "memory": 0, "idle": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def peek(self, session_id: str) -> Optional[Session]:
+        """Get a session without touching LRU order or idle time."""
+        return self._entries.get(session_id)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        session = self._entries.get(session_id)
+        if session is not None:
+            self.touch(session_id, session)
+        return session
+
+    def put(self, session_id: str, session: Session):
+        self.pop(session_id)
+        self._entries[session_id] = session
+        self.touch(session_id, session)
+
+    def touch(self, session_id: str, session: Session):
+        """Mark a session used and re-account its size (it may have grown)."""
+        session.last_access = time.monotonic()
+        self._entries.move_to_end(session_id)
+        self.total_bytes += session.nbytes - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = session.nbytes
+        self._enforce_limits(keep=session_id)
+
+    def pop(self, session_id: str) -> Optional[Session]:
+        session = self._entries.pop(session_id, None)
+        if session is not None:
+            self.total_bytes -= self._sizes.pop(session_id, 0)
+        return session
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.total_bytes = 0
+
+    def _enforce_limits(self, keep: Optional[str] = None):
+        while len(self._entries) > self.max_entries:
+            self._evict_oldest("entries", keep)
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._evict_oldest("memory", keep)
+
+    def _evict_oldest(self, reason: str, keep: Optional[str] = None):
+        session_id = next(iter(self._entries))
+        if session_id == keep:
+            # The session in use is never the one evicted
+            self._entries.move_to_end(session_id)
+            session_id = next(iter(self._entries))
+        self.pop(session_id)
+        self._evictions[reason] += 1
+
+    def sweep(self) -> int:
+        """
+        Drop sessions idle for longer than the TTL.
+
+        Entries are in access order, so only expired ones are visited.
+
+        Returns:
+            Number of sessions dropped
+        """
+        cutoff = time.monotonic() - self.idle_ttl
+        expired = 0
+        while self._entries:
+            session_id, session = next(iter(self._entries.items()))
+            if session.last_access > cutoff:
+                break
+            self.pop(session_id)
+            expired += 1
+        self._evictions["idle"] += expired
+        return expired
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            expired = self.sweep()
+            if expired:
+                logger.info(f"Swept {expired} idle chat sessions")
+
+    def start(self):
+        """Start the idle sweeper."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the idle sweeper."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Entries, estimated bytes and evictions by reason."""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "messages": sum(len(s.messages) for s in self._entries.values()),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "idle_ttl": self.idle_ttl,
+            "evictions": dict(self._evictions)
+        }
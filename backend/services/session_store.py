@@ -0,0 +1,376 @@
+"""
+Session store shared by every API worker.
+
+Chat sessions live in two tiers:
+- a per-process, memory-bounded cache of compact sessions (see
+  services/session_cache.py), read and written on the request path
+- Postgres (chat_sessions / chat_messages), the shared tier every worker and
+  node reads from on a local miss
+
+Writes go through the local copy and reach Postgres through the transcript
+writer. Each flush sends a NOTIFY in the same transaction, so other workers
+evict their copy only once the new messages are committed; their next request
+for the session reloads it. A worker that loses its LISTEN connection clears
+its cache, as it may have missed notifications.
+
+Without DATABASE_URL the store is the local tier only, as before.
+"""
+
+import os
+import socket
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Optional
+from uuid import UUID, uuid4
+
+import asyncpg
+
+from services.session_cache import (
+    CachedMessage, Session, SessionCache, SESSION_MAX_MESSAGES, from_micros, now_micros, to_micros
+)
+from services.transcript_writer import get_transcript_writer
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Newest messages loaded into a session on a local miss (at most SESSION_MAX_MESSAGES)
+SESSION_LOAD_MESSAGES = int(os.getenv("SESSION_LOAD_MESSAGES", 100))
+SESSION_NOTIFY_CHANNEL = os.getenv("SESSION_NOTIFY_CHANNEL", "chat_session_changed")
+SESSION_LISTEN_RETRY = float(os.getenv("SESSION_LISTEN_RETRY", 5))  # seconds
+
+
+class SessionStore:
+    """Write-through cache of chat sessions in front of Postgres."""
+
+    def __init__(self, cache: Optional[SessionCache] = None, load_messages: int = SESSION_LOAD_MESSAGES):
+        self.load_messages = min(load_messages, SESSION_MAX_MESSAGES)
+        self.shared = bool(os.getenv("DATABASE_URL"))
+        # Notifications from this process are ignored
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._sessions = cache or SessionCache()
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Bumped by every invalidation; a load that overlapped one is not cached
+        self._epoch = 0
+        self._listener: Optional[asyncio.Task] = None
+        self._counters = {"hits": 0, "misses": 0, "loads": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def peek(self, session_id: Optional[str]) -> Optional[Session]:
+        """Local copy of a session, without loading or touching LRU order."""
+        return self._sessions.peek(session_id) if session_id else None
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        """
+        Get a session, loading it from the shared tier on a local miss.
+
+        Args:
+            session_id: Session ID
+
+        Returns:
+            Session, or None if the session does not exist
+        """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._counters["hits"] += 1
+            return session
+
+        self._counters["misses"] += 1
+        if not self.shared:
+            return None
+
+        # Concurrent misses for one session share a load
+        epoch = self._epoch
+        pending = self._loading.get(session_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(session_id))
+            self._loading[session_id] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(session_id, None))
+        session = await asyncio.shield(pending)
+        if (
+            session is not None and session_id not in self._sessions and epoch == self._epoch
+            # Spilled messages of ours are neither in Postgres nor in memory
+            # yet: serve the session, but reload it next time
+            and not get_transcript_writer().has_spilled(session_id)
+        ):
+            self._put(session_id, session)
+        return self._sessions.peek(session_id) or session
+
+    async def get_or_create(self, session_id: str, current_page: Optional[str] = None) -> Session:
+        """
+        Get a session, starting an empty one if it does not exist yet.
+
+        If the shared tier cannot be read the conversation continues without
+        its earlier context, and that empty copy is not cached.
+        """
+        try:
+            session = await self.get(session_id)
+        except Exception as e:
+            logger.warning(f"Failed to load session {session_id}: {e}")
+            return Session(current_page)
+        if session is None:
+            # Stored by the transcript writer's session upsert with the first messages
+            session = Session(current_page)
+            self._put(session_id, session)
+        return session
+
+    async def create(
+        self,
+        session_id: str,
+        current_page: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Session:
+        """
+        Create a session locally and in the shared tier.
+
+        Args:
+            session_id: New session ID
+            current_page: Initial page URL
+            user_agent: User's browser info
+            metadata: Additional session metadata
+
+        Returns:
+            Session
+        """
+        session = Session(current_page)
+        self._put(session_id, session)
+        if self.shared:
+            try:
+                from database import get_database_pool
+                pool = await get_database_pool()
+                await pool.execute(
+                    """
+                    INSERT INTO chat_sessions (session_id, created_at, user_agent, current_page, metadata)
+                    VALUES ($1, $2, $3, $4, $5)
+                    ON CONFLICT (session_id) DO NOTHING
+                    """,
+                    UUID(session_id), from_micros(session.created_at), user_agent, current_page,
+                    metadata or {}
+                )
+            except Exception as e:
+                logger.warning(f"Failed to create session in database: {e}")
+        return session
+
+    async def append(
+        self,
+        session_id: str,
+        session: Session,
+        role: str,
+        content: str,
+        page_context: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        token_usage: Optional[int] = None
+    ) -> CachedMessage:
+        """
+        Add a message to a session and queue it for the shared tier.
+
+        Args:
+            session_id: Session ID
+            session: Session from get/get_or_create
+            role: Message role (user or assistant)
+            content: Message content
+            page_context: Page the message was sent from
+            usage: Optional model usage from the agent
+            token_usage: Tokens used, shown in history
+
+        Returns:
+            The cached message
+        """
+        message = CachedMessage(uuid4().int, role, content, now_micros(), token_usage)
+        session.append(message)
+        if page_context:
+            session.set_page(page_context)
+        if session_id in self._sessions:
+            # Account for the new message against the memory cap
+            self._sessions.touch(session_id, session)
+
+        transcript_writer = get_transcript_writer()
+        if transcript_writer.enabled:
+            transcript_writer.enqueue(
+                session_id, role, content,
+                page_context=page_context, usage=usage,
+                message_id=message.uuid,
+                created_at=message.timestamp
+            )
+            return message
+
+        # Writer turned off: save now (if a database is available)
+        try:
+            from services.database_mcp import get_db_server
+            db_server = await get_db_server()
+            await db_server.save_chat_message(
+                session_id=session_id,
+                role=role,
+                content=content,
+                page_context=page_context,
+                usage=usage
+            )
+            if self.shared:
+                await self._notify([session_id])
+        except Exception as e:
+            logger.warning(f"Failed to save to database: {e}")
+        return message
+
+    async def _notify(self, session_ids: Iterable[str], conn: Optional[asyncpg.Connection] = None):
+        """Tell other workers to drop their copies of these sessions."""
+        payload = f"{self.origin}|{','.join(session_ids)}"
+        if conn is not None:
+            await conn.execute("SELECT pg_notify($1, $2)", SESSION_NOTIFY_CHANNEL, payload)
+            return
+        from database import get_database_pool
+        pool = await get_database_pool()
+        await pool.execute("SELECT pg_notify($1, $2)", SESSION_NOTIFY_CHANNEL, payload)
+
+    async def delete(self, session_id: str) -> bool:
+        """
+        Delete a session from every worker and the shared tier.
+
+        Returns:
+            True if the session existed
+        """
+        existed = self._sessions.pop(session_id) is not None
+        if not self.shared:
+            return existed
+        try:
+            session_uuid = UUID(session_id)
+        except ValueError:
+            return existed
+
+        get_transcript_writer().discard(session_id)
+        from database import get_database_pool
+        pool = await get_database_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                status = await conn.execute("DELETE FROM chat_sessions WHERE session_id = $1", session_uuid)
+                await self._notify([session_id], conn)
+        return existed or status != "DELETE 0"
+
+    def invalidate(self, session_ids: Iterable[str]):
+        """Drop local copies; the next request reloads them."""
+        self._epoch += 1
+        for session_id in session_ids:
+            if self._sessions.pop(session_id) is not None:
+                self._counters["invalidations"] += 1
+
+    def _put(self, session_id: str, session: Session):
+        self._sessions.put(session_id, session)
+
+    async def _load(self, session_id: str) -> Optional[Session]:
+        """
+        Build a session from chat_sessions and its newest messages.
+
+        Messages this worker has queued but not flushed are added on top:
+        other workers' notifications can trigger a reload before they are
+        written, and the notification of our own flush is ignored.
+        """
+        from database import get_database_pool, fetch_chat_session, fetch_latest_messages, count_chat_messages
+
+        try:
+            UUID(session_id)
+        except ValueError:
+            return None
+
+        # Taken before reading: a row committed after the read is still
+        # queued or in flight here
+        unflushed = get_transcript_writer().unflushed(session_id)
+
+        pool = await get_database_pool()
+        async with pool.acquire() as conn:
+            record = await fetch_chat_session(session_id, conn=conn)
+            if record is None:
+                return None
+            messages = await fetch_latest_messages(session_id, self.load_messages, conn=conn)
+            total = await count_chat_messages(session_id, conn=conn) if len(messages) == self.load_messages else len(messages)
+        self._counters["loads"] += 1
+
+        metadata = record.metadata or {}
+
+        session = Session(record.current_page, to_micros(record.created_at))
+        for m in messages:
+            session.append(CachedMessage.from_record(m))
+        # Older messages are not loaded; positions below are relative to the
+        # loaded tail and message_offset maps them back
+        offset = total - len(messages)
+        session.message_offset = offset
+        if metadata.get("summary"):
+            session.set_summary(metadata["summary"], max(0, int(metadata.get("summarized_count", 0)) - offset))
+
+        loaded = {m.message_id.int for m in messages}
+        for row in sorted(unflushed, key=lambda r: (r[4], r[0].int)):
+            if row[0].int in loaded:
+                continue
+            session.append(CachedMessage(row[0].int, row[2], row[3], to_micros(row[4]), row[5]))
+            if row[6]:
+                session.set_page(row[6])
+        return session
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        origin, _, session_ids = payload.partition("|")
+        if origin != self.origin:
+            self.invalidate(session_ids.split(","))
+
+    async def _listen(self):
+        """Keep a LISTEN connection open, reconnecting after failures."""
+        while True:
+            closed = asyncio.Event()
+            conn = None
+            try:
+                conn = await asyncpg.connect(os.getenv("DATABASE_URL"))
+                conn.add_termination_listener(lambda _: closed.set())
+                await conn.add_listener(SESSION_NOTIFY_CHANNEL, self._on_notify)
+                logger.info(f"Listening for session changes on {SESSION_NOTIFY_CHANNEL}")
+                await closed.wait()
+                logger.warning("Session change listener disconnected")
+            except asyncio.CancelledError:
+                if conn is not None:
+                    await conn.close()
+                raise
+            except Exception as e:
+                logger.warning(f"Session change listener failed: {e}")
+            # Notifications may have been missed while disconnected
+            self.invalidate(self._sessions)
+            await asyncio.sleep(SESSION_LISTEN_RETRY)
+
+    def start(self):
+        """Start the idle sweeper and listen for changes made by other workers."""
+        self._sessions.start()
+        if not self.shared:
+            return
+        get_transcript_writer().notify_channel = SESSION_NOTIFY_CHANNEL
+        get_transcript_writer().origin = self.origin
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """Stop the idle sweeper and the change listener."""
+        await self._sessions.stop()
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Local tier counters, with the cache's size and evictions under "cache"."""
+        return {
+            "shared": self.shared,
+            "listening": self._listener is not None and not self._listener.done(),
+            **self._counters,
+            "cache": self._sessions.stats()
+        }
+
+
+# Global store instance
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Get or create the session store instance."""
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore()
+    return _session_store
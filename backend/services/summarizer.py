@@ -0,0 +1,140 @@
+"""
+Session Summarizer - Rolling conversation summaries to keep prompts bounded.
+
+After a response has been sent, older turns of a session are condensed into a
+compact summary in batches. The agent is then given the summary plus only the
+turns that have not been summarized yet, so prompt size stays roughly constant
+however long the session grows. Summaries are kept on the in-memory session and
+persisted to `chat_sessions.metadata`.
+"""
+
+import os
+import logging
+from typing import Dict, Any, Optional, List, Tuple
+
+from services.llm import get_llm_provider
+from services.session_cache import Session
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+# Most recent messages always kept verbatim
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", 4))
+# Older unsummarized messages needed before a summary pass runs
+SUMMARY_BATCH_MESSAGES = int(os.getenv("SUMMARY_BATCH_MESSAGES", 4))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", 256))
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a customer and Sony Interior's furniture consultant.
+Update the summary with the new turns. Keep it under 120 words and keep only what matters for future answers:
+the customer's needs, rooms, budget, style and material preferences, products and prices discussed, and open questions.
+Reply with the summary text only."""
+
+
+def summary_window(session: Session) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Get the summary and the unsummarized messages to send to the model.
+
+    Args:
+        session: In-memory session
+
+    Returns:
+        Tuple of (summary or None, role/content dicts of the messages after
+        the summarized prefix)
+    """
+    start = session.summarized_count if session.summary else 0
+    return session.summary, [{"role": m.role, "content": m.content} for m in session.since(start)]
+
+
+class SessionSummarizer:
+    """Condenses older session turns into a summary off the request path."""
+
+    def __init__(self):
+        self._in_progress: set = set()
+
+    @staticmethod
+    def needs_summary(session: Session) -> bool:
+        """Check whether enough old turns have accumulated to summarize."""
+        pending = len(session.messages) - SUMMARY_KEEP_MESSAGES - session.summarized_count
+        return pending >= SUMMARY_BATCH_MESSAGES
+
+    async def maybe_summarize(self, session_id: str, session: Session):
+        """
+        Run a summary pass if one is due and none is running for the session.
+
+        Meant to run as a background task after the response has been sent.
+        """
+        if not SUMMARY_ENABLED or not self.needs_summary(session) or session_id in self._in_progress:
+            return
+        self._in_progress.add(session_id)
+        try:
+            await self.summarize(session_id, session)
+        finally:
+            self._in_progress.discard(session_id)
+
+    async def summarize(self, session_id: str, session: Session) -> Optional[str]:
+        """
+        Fold older unsummarized turns into the session summary.
+
+        Args:
+            session_id: Session ID
+            session: In-memory session, updated in place
+
+        Returns:
+            The new summary, or None if nothing was summarized
+        """
+        start = session.summarized_count
+        end = len(session.messages) - SUMMARY_KEEP_MESSAGES
+        if end - start < SUMMARY_BATCH_MESSAGES:
+            return None
+        offset = session.message_offset
+
+        turns = "\n".join(
+            f"{'Customer' if m.role == 'user' else 'Consultant'}: {m.content}"
+            for m in session.since(start)[:end - start]
+        )
+        previous = session.summary or "(none)"
+
+        try:
+            response = await get_llm_provider().generate(
+                [{"role": "user", "content": f"Current summary:\n{previous}\n\nNew turns:\n{turns}"}],
+                system_instruction=SUMMARY_PROMPT,
+                temperature=0.2,
+                max_output_tokens=SUMMARY_MAX_TOKENS
+            )
+        except Exception as e:
+            logger.warning(f"Failed to summarize session {session_id}: {e}")
+            return None
+
+        summary = response.text.strip()
+        if not summary:
+            return None
+
+        # Messages may have left the ring buffer while the model was running
+        session.set_summary(summary, max(0, end - (session.message_offset - offset)))
+
+        # Persist to the database (if available)
+        try:
+            from services.database_mcp import get_db_server
+            db_server = await get_db_server()
+            # Sessions loaded from the database hold only their newest messages
+            await db_server.update_session_metadata(
+                session_id,
+                {"summary": summary, "summarized_count": offset + end}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to persist summary for session {session_id}: {e}")
+
+        return summary
+
+
+# Global summarizer instance
+_summarizer: Optional[SessionSummarizer] = None
+
+
+def get_summarizer() -> SessionSummarizer:
+    """Get or create the session summarizer instance."""
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = SessionSummarizer()
+    return _summarizer
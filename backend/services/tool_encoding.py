@@ -0,0 +1,218 @@
+"""
+Tool Result Encoding - Compact, token-efficient tool output for the model.
+
+Tool results are fed back into the prompt, so every byte costs prompt tokens and
+latency. Instead of indented JSON, agent-facing tools return:
+- product and category lists as a pipe-separated table with a single header row
+  (keys are not repeated per item, empty columns are dropped), followed by
+  facet counts for filtered searches
+- single documents as `field: value` lines
+Each tool has its own field projection, so image URLs and internal ids (asset,
+category, `_type`) are left out. Long values are capped per field. Product `_id`
+is kept, since `get_product_details` and `check_inventory` take it.
+
+The HTTP MCP endpoints keep serving the full JSON shapes.
+"""
+
+import os
+import json
+from typing import Dict, Any, List, Tuple
+
+# Configuration
+TOOL_RESULT_FORMAT = os.getenv("TOOL_RESULT_FORMAT", "compact")  # compact or json
+TOOL_FIELD_MAX_CHARS = int(os.getenv("TOOL_FIELD_MAX_CHARS", 160))
+TOOL_DESCRIPTION_MAX_CHARS = int(os.getenv("TOOL_DESCRIPTION_MAX_CHARS", 600))
+TOOL_FACET_MAX_VALUES = int(os.getenv("TOOL_FACET_MAX_VALUES", 8))
+
+# (source field, output label) pairs per result kind
+PRODUCT_LIST_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("_id", "id"),
+    ("name", "name"),
+    ("slug", "slug"),
+    ("price", "price"),
+    ("compareAtPrice", "was"),
+    ("category", "category"),
+    ("stockStatus", "stock"),
+    ("featured", "featured"),
+    ("shortDescription", "summary"),
+)
+
+FILTERED_PRODUCT_COLUMNS = PRODUCT_LIST_COLUMNS + (
+    ("materials", "materials"),
+    ("dimensions", "dimensions"),
+)
+
+PRODUCT_DETAIL_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("_id", "id"),
+    ("name", "name"),
+    ("slug", "slug"),
+    ("sku", "sku"),
+    ("price", "price"),
+    ("compareAtPrice", "was"),
+    ("category", "category"),
+    ("stockStatus", "stock"),
+    ("featured", "featured"),
+    ("shortDescription", "summary"),
+    ("description", "description"),
+    ("dimensions", "dimensions"),
+    ("materials", "materials"),
+    ("colors", "colors"),
+    ("weight", "weight"),
+    ("warranty", "warranty"),
+    ("careInstructions", "care"),
+)
+
+CATEGORY_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("name", "name"),
+    ("slug", "slug"),
+    ("description", "description"),
+)
+
+INVENTORY_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("product_id", "id"),
+    ("stock_status", "stock"),
+    ("quantity", "quantity"),
+    ("available", "available"),
+    ("updated_at", "updated"),
+)
+
+# Tool name -> (layout, label, fields)
+TOOL_FORMATS: Dict[str, Tuple[str, str, Tuple[Tuple[str, str], ...]]] = {
+    "search_products": ("table", "products", PRODUCT_LIST_COLUMNS),
+    "get_products_by_category_tool": ("table", "products", PRODUCT_LIST_COLUMNS),
+    "get_featured": ("table", "featured products", PRODUCT_LIST_COLUMNS),
+    "search_products_filtered": ("faceted", "products", FILTERED_PRODUCT_COLUMNS),
+    "get_categories": ("table", "categories", CATEGORY_COLUMNS),
+    "get_product_details": ("record", "product", PRODUCT_DETAIL_FIELDS),
+    "get_product_by_slug_tool": ("record", "product", PRODUCT_DETAIL_FIELDS),
+    "check_inventory": ("record", "inventory", INVENTORY_FIELDS),
+}
+
+# Fields allowed the longer description cap
+_LONG_FIELDS = {"description", "summary", "care"}
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - 1].rstrip() + "…"
+
+
+def _portable_text(blocks: List[Any]) -> str:
+    """Plain text of Portable Text blocks."""
+    paragraphs = []
+    for block in blocks:
+        if isinstance(block, dict) and block.get("_type") == "block":
+            paragraphs.append("".join(
+                child.get("text", "") for child in block.get("children", []) if isinstance(child, dict)
+            ))
+    return " ".join(p for p in paragraphs if p)
+
+
+def format_value(value: Any) -> str:
+    """Render one field value as short plain text."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, list):
+        if value and isinstance(value[0], dict) and value[0].get("_type") == "block":
+            return _portable_text(value)
+        return ", ".join(filter(None, (format_value(v) for v in value)))
+    if isinstance(value, dict):
+        if {"width", "height", "depth"} & value.keys():
+            sizes = " x ".join(
+                f"{key[0].upper()}{format_value(value[key])}"
+                for key in ("width", "depth", "height") if value.get(key) is not None
+            )
+            return f"{sizes} {value.get('unit') or ''}".strip()
+        if "name" in value:
+            # Referenced documents (category, color): the name is enough
+            return format_value(value["name"])
+        return "; ".join(
+            f"{key}={format_value(v)}" for key, v in value.items()
+            if not key.startswith("_") and v is not None
+        )
+    return str(value)
+
+
+def _field(doc: Dict[str, Any], source: str, label: str) -> str:
+    max_chars = TOOL_DESCRIPTION_MAX_CHARS if label in _LONG_FIELDS else TOOL_FIELD_MAX_CHARS
+    return _truncate(format_value(doc.get(source)), max_chars)
+
+
+def encode_table(label: str, rows: List[Dict[str, Any]], columns: Tuple[Tuple[str, str], ...]) -> str:
+    """
+    Encode a list of documents as a pipe-separated table.
+
+    Columns empty in every row are dropped.
+    """
+    if not rows:
+        return f"{label}: none found"
+
+    cells = [
+        [_field(row, source, name).replace("|", "/") for source, name in columns]
+        for row in rows
+    ]
+    keep = [i for i in range(len(columns)) if any(row[i] for row in cells)]
+
+    lines = [f"{label} ({len(rows)})", "|".join(columns[i][1] for i in keep)]
+    lines.extend("|".join(row[i] for i in keep) for row in cells)
+    return "\n".join(lines)
+
+
+def encode_facets(facets: Dict[str, Dict[str, int]]) -> str:
+    """Encode facet counts as one `facet: value count, ...` line per facet."""
+    lines = ["facets:"]
+    for facet, counts in facets.items():
+        if counts:
+            values = list(counts.items())[:TOOL_FACET_MAX_VALUES]
+            lines.append(f"{facet}: " + ", ".join(f"{value} {count}" for value, count in values))
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+
+def encode_record(label: str, doc: Dict[str, Any], fields: Tuple[Tuple[str, str], ...]) -> str:
+    """Encode one document as `field: value` lines, skipping empty fields."""
+    lines = [f"{label}:"]
+    for source, name in fields:
+        value = _field(doc, source, name)
+        if value:
+            lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+def encode_tool_result(tool_name: str, data: Any) -> str:
+    """
+    Encode a tool's result for the model.
+
+    Args:
+        tool_name: Name of the tool function
+        data: Result data (list or dict, as returned by the MCP server methods)
+
+    Returns:
+        Compact text, or JSON when TOOL_RESULT_FORMAT is "json" or the tool
+        has no compact format
+    """
+    spec = TOOL_FORMATS.get(tool_name)
+    if TOOL_RESULT_FORMAT != "compact" or spec is None:
+        return json.dumps(data, indent=2)
+
+    if isinstance(data, dict) and set(data) == {"error"}:
+        return f"error: {data['error']}"
+
+    layout, label, fields = spec
+    if layout == "faceted" and isinstance(data, dict) and "products" in data:
+        products = data["products"]
+        table = encode_table(label, products, fields)
+        if products and data.get("total", len(products)) > len(products):
+            table = table.replace(f"{label} ({len(products)})", f"{label} ({len(products)} of {data['total']})", 1)
+        facets = encode_facets(data.get("facets") or {})
+        return f"{table}\n{facets}" if facets else table
+    if layout == "table" and isinstance(data, list):
+        return encode_table(label, data, fields)
+    if layout == "record" and isinstance(data, dict):
+        return encode_record(label, data, fields)
+    return json.dumps(data, separators=(",", ":"))
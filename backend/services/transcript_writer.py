@@ -0,0 +1,596 @@
+"""
+Write-behind transcript writer for chat messages.
+
+The chat endpoint enqueues messages instead of awaiting an insert per
+message. A background task flushes the buffer when it reaches
+TRANSCRIPT_BATCH_SIZE or every TRANSCRIPT_FLUSH_INTERVAL seconds: one COPY
+into a staging table, one insert into chat_messages and one upsert touching
+each session in the batch, all in a single transaction.
+
+Messages that do not fit the buffer, or whose flush fails (e.g. Postgres is
+unreachable), are appended to a local JSONL spill file and replayed by the
+next successful flush. Replays are idempotent: message IDs are generated here
+and duplicates are skipped on insert.
+
+Every worker on a host shares the spill file: appends and the hand-over to
+a replay are serialized with a lock file, and one worker replays at a time.
+
+A batch rejected for its data (e.g. a NUL byte in the content, or a
+created_at with no chat_messages partition) is retried row by row; rows that
+still fail go to a dead-letter file instead of blocking the spill file. Any
+other error (connection limits, shutdowns, cancelled queries, a missing
+column during a migration) keeps the batch for a retry. Once the cause is
+fixed (e.g. the partition is created), dead-lettered rows are written back
+with:
+    python -m services.transcript_writer --replay-dead-letters
+"""
+
+import os
+import uuid
+import random
+import asyncio
+import logging
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import asyncpg
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+from utils.json_codec import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRANSCRIPT_WRITER_ENABLED = os.getenv("TRANSCRIPT_WRITER_ENABLED", "true").lower() == "true"
+TRANSCRIPT_BATCH_SIZE = int(os.getenv("TRANSCRIPT_BATCH_SIZE", 200))
+TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", 0.5))  # seconds
+TRANSCRIPT_BUFFER_MAX = int(os.getenv("TRANSCRIPT_BUFFER_MAX", 5000))
+TRANSCRIPT_RETRY_INTERVAL = float(os.getenv("TRANSCRIPT_RETRY_INTERVAL", 5))  # seconds after a failed flush
+TRANSCRIPT_SPILL_PATH = os.getenv("TRANSCRIPT_SPILL_PATH", "logs/transcript_spill.jsonl")
+TRANSCRIPT_DEAD_LETTER_PATH = os.getenv("TRANSCRIPT_DEAD_LETTER_PATH", "logs/transcript_dead_letter.jsonl")
+TRANSCRIPT_DEADLOCK_RETRIES = int(os.getenv("TRANSCRIPT_DEADLOCK_RETRIES", 3))
+
+# chat_messages columns in record order
+COLUMNS = (
+    "message_id", "session_id", "role", "content", "created_at", "token_usage",
+    "page_context", "metadata", "prompt_tokens", "completion_tokens",
+    "cached_tokens", "model_latency_ms", "model", "model_calls"
+)
+
+_INSERT_MESSAGES = f"""
+    INSERT INTO chat_messages ({", ".join(COLUMNS)})
+    SELECT {", ".join(COLUMNS)} FROM transcript_staging
+    ON CONFLICT DO NOTHING
+"""
+
+# One statement per batch: creates sessions the chat endpoint generated
+# client-side and touches updated_at (and the latest page) of existing ones.
+# created_at is kept at or before the session's first message, which history
+# queries rely on to prune chat_messages partitions. Sessions are passed in
+# ID order so concurrent batches lock their rows in the same order.
+_TOUCH_SESSIONS = """
+    INSERT INTO chat_sessions (session_id, current_page, created_at)
+    SELECT * FROM unnest($1::uuid[], $2::text[], $3::timestamptz[])
+    ON CONFLICT (session_id) DO UPDATE SET
+        current_page = COALESCE(EXCLUDED.current_page, chat_sessions.current_page),
+        created_at = LEAST(chat_sessions.created_at, EXCLUDED.created_at),
+        updated_at = NOW()
+"""
+
+# Session UUIDs (36 chars plus a comma) per NOTIFY payload
+NOTIFY_SESSIONS_PER_PAYLOAD = 150
+
+Row = Tuple[Any, ...]
+
+# Errors about the rows themselves: bad values (class 22, including NUL bytes
+# and characters the encoding lacks) and constraint violations (class 23,
+# including a created_at with no chat_messages partition, which is a check
+# violation). Client-side encoding failures raise TypeError/ValueError. Any
+# other error says nothing about the rows, and the batch is kept for a retry.
+_REJECTED_ROW_ERRORS = (
+    asyncpg.DataError,
+    asyncpg.IntegrityConstraintViolationError,
+    TypeError,
+    ValueError,
+)
+
+
+def _is_rejected_row(error: Exception) -> bool:
+    """Whether the database refused the rows, as opposed to failing to take them."""
+    return isinstance(error, _REJECTED_ROW_ERRORS)
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    """
+    Hold an exclusive lock on `path` (created if needed) across processes.
+
+    Yields:
+        False if `blocking` is off and another process holds the lock
+    """
+    if not FCNTL_AVAILABLE:
+        # Single-process fallback: callers are already serialized in-process
+        yield True
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            acquired = False
+        else:
+            acquired = True
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _to_json(row: Row) -> str:
+    values = list(row)
+    values[0], values[1] = str(values[0]), str(values[1])
+    values[4] = values[4].isoformat()
+    return dumps(values)
+
+
+def _from_json(line: str) -> Row:
+    return _from_values(loads(line))
+
+
+def _from_values(values: List[Any]) -> Row:
+    values = list(values)
+    values[0], values[1] = uuid.UUID(values[0]), uuid.UUID(values[1])
+    values[4] = datetime.fromisoformat(values[4])
+    # Spilled before later columns existed
+    values.extend([None] * (len(COLUMNS) - len(values)))
+    if isinstance(values[7], str):
+        # Spilled before metadata was bound as an object
+        values[7] = loads(values[7])
+    return tuple(values)
+
+
+class TranscriptWriter:
+    """Bounded buffer of chat messages flushed to Postgres in batches."""
+
+    def __init__(
+        self,
+        batch_size: int = TRANSCRIPT_BATCH_SIZE,
+        flush_interval: float = TRANSCRIPT_FLUSH_INTERVAL,
+        max_buffer: int = TRANSCRIPT_BUFFER_MAX,
+        spill_path: str = TRANSCRIPT_SPILL_PATH,
+        dead_letter_path: str = TRANSCRIPT_DEAD_LETTER_PATH
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        # Without a database the chat endpoint keeps its in-memory sessions only
+        self.enabled = TRANSCRIPT_WRITER_ENABLED and bool(os.getenv("DATABASE_URL"))
+        # Set by the session store: each flush announces the sessions it
+        # changed on this channel, tagged with origin
+        self.notify_channel: Optional[str] = None
+        self.origin = ""
+        self._failed = False
+        self._buffer: List[Row] = []
+        # Batch being written, and sessions with rows this process spilled
+        # that may not be replayed yet
+        self._inflight: List[Row] = []
+        self._spilled_sessions: Set[uuid.UUID] = set()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {"enqueued": 0, "written": 0, "spilled": 0, "replayed": 0,
+                          "flushes": 0, "failures": 0, "dropped": 0, "dead_lettered": 0}
+        self._last_error: Optional[str] = None
+
+    def enqueue(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        page_context: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        message_id: Optional[str] = None,
+        created_at: Optional[datetime] = None
+    ) -> Optional[str]:
+        """
+        Queue a chat message for the next flush. Never waits on the database.
+
+        Args:
+            session_id: Chat session ID (UUID)
+            role: Message role (user/assistant)
+            content: Message content
+            page_context: Optional page context
+            usage: Optional model usage (prompt_tokens, completion_tokens,
+                cached_tokens, model_latency_ms, model, model_calls) from the
+                agent
+            metadata: Optional message metadata
+            message_id: Optional message ID (UUID), generated if not given
+            created_at: Optional timezone-aware timestamp, now if not given
+
+        Returns:
+            Message ID, or None if the message was dropped
+        """
+        try:
+            session_uuid = uuid.UUID(str(session_id))
+            message_uuid = uuid.UUID(str(message_id)) if message_id else uuid.uuid4()
+        except ValueError:
+            self._counters["dropped"] += 1
+            logger.warning(f"Transcript message dropped: invalid ID in session {session_id!r}")
+            return None
+
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        completion_tokens = usage.get("completion_tokens", 0) or 0
+        row = (
+            message_uuid, session_uuid, role, content,
+            # Stamped here so batched messages keep their order in history
+            created_at or datetime.now(timezone.utc),
+            prompt_tokens + completion_tokens, page_context,
+            metadata or {},
+            prompt_tokens, completion_tokens, usage.get("cached_tokens", 0) or 0,
+            usage.get("model_latency_ms"), usage.get("model"), usage.get("model_calls")
+        )
+        self._counters["enqueued"] += 1
+
+        if len(self._buffer) >= self.max_buffer:
+            self._spill([row])
+        else:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+        return str(message_uuid)
+
+    def discard(self, session_id: str):
+        """Drop buffered messages of a deleted session."""
+        try:
+            session_uuid = uuid.UUID(str(session_id))
+        except ValueError:
+            return
+        self._buffer[:] = [row for row in self._buffer if row[1] != session_uuid]
+
+    def unflushed(self, session_id: str) -> List[Row]:
+        """
+        Messages of a session queued here and not known to be committed yet.
+
+        Rows in the batch being written may already be committed; callers
+        dedupe by message ID.
+        """
+        try:
+            session_uuid = uuid.UUID(str(session_id))
+        except ValueError:
+            return []
+        return [row for row in self._inflight + self._buffer if row[1] == session_uuid]
+
+    def has_spilled(self, session_id: str) -> bool:
+        """Whether this process spilled messages of a session that may not be written yet."""
+        try:
+            return uuid.UUID(str(session_id)) in self._spilled_sessions
+        except ValueError:
+            return False
+
+    async def flush(self) -> int:
+        """
+        Write buffered messages, replaying the spill file first.
+
+        A write that fails because the database is unavailable moves the
+        batch (and the rest of the buffer) to the spill file.
+
+        Returns:
+            Number of messages written
+        """
+        async with self._flush_lock:
+            self._failed = False
+            written = 0
+            try:
+                written += await self._replay()
+            except Exception as e:
+                self._record_failure(e)
+            if not os.path.exists(self.spill_path) and not os.path.exists(self.spill_path + ".replay"):
+                # Every spilled row is in (this worker's or another's replay)
+                self._spilled_sessions.clear()
+
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:self.batch_size]
+                try:
+                    written += await self._write_batch(batch)
+                except Exception as e:
+                    self._record_failure(e)
+                    # Keep the rest in order behind this batch
+                    self._spill(batch + self._buffer)
+                    self._buffer.clear()
+                    break
+            return written
+
+    async def _write_batch(self, rows: List[Row]) -> int:
+        """
+        Write a batch, isolating rows the database rejects.
+
+        Rows the database refuses go to the dead-letter file; any other error
+        is raised so the caller keeps the whole batch for a retry.
+
+        Returns:
+            Number of messages written
+        """
+        self._inflight = rows
+        try:
+            try:
+                await self._write_retrying(rows)
+                return len(rows)
+            except Exception as e:
+                if not _is_rejected_row(e):
+                    raise
+                if len(rows) == 1:
+                    self._dead_letter(rows, e)
+                    return 0
+                logger.warning(f"Transcript batch of {len(rows)} rejected ({e}), retrying row by row")
+
+            written = 0
+            for row in rows:
+                try:
+                    await self._write_retrying([row])
+                    written += 1
+                except Exception as e:
+                    if not _is_rejected_row(e):
+                        raise
+                    self._dead_letter([row], e)
+            return written
+        finally:
+            self._inflight = []
+
+    async def _write_retrying(self, rows: List[Row]):
+        """Write rows, retrying a transaction rolled back by a deadlock or serialization failure."""
+        for attempt in range(TRANSCRIPT_DEADLOCK_RETRIES + 1):
+            try:
+                return await self._write(rows)
+            except asyncpg.TransactionRollbackError as e:
+                if attempt == TRANSCRIPT_DEADLOCK_RETRIES:
+                    raise
+                logger.info(f"Transcript write rolled back ({e}), retry {attempt + 1}/{TRANSCRIPT_DEADLOCK_RETRIES}")
+                await asyncio.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+
+    async def _write(self, rows: List[Row]):
+        from database import get_database_pool
+
+        # Latest page and first message time per session, in message order
+        pages: Dict[uuid.UUID, Optional[str]] = {}
+        first_seen: Dict[uuid.UUID, datetime] = {}
+        for row in rows:
+            if row[6] is not None or row[1] not in pages:
+                pages[row[1]] = row[6]
+            if row[1] not in first_seen or row[4] < first_seen[row[1]]:
+                first_seen[row[1]] = row[4]
+
+        sessions = sorted(pages)
+
+        pool = await get_database_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    _TOUCH_SESSIONS, sessions, [pages[s] for s in sessions], [first_seen[s] for s in sessions]
+                )
+                await conn.execute(
+                    "CREATE TEMP TABLE transcript_staging "
+                    "(LIKE chat_messages INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                await conn.copy_records_to_table("transcript_staging", records=rows, columns=COLUMNS)
+                await conn.execute(_INSERT_MESSAGES)
+                if self.notify_channel:
+                    # Delivered on commit; payloads are capped at 8000 bytes
+                    session_ids = [str(s) for s in sessions]
+                    for start in range(0, len(session_ids), NOTIFY_SESSIONS_PER_PAYLOAD):
+                        chunk = ",".join(session_ids[start:start + NOTIFY_SESSIONS_PER_PAYLOAD])
+                        await conn.execute("SELECT pg_notify($1, $2)", self.notify_channel, f"{self.origin}|{chunk}")
+
+        self._counters["flushes"] += 1
+        self._counters["written"] += len(rows)
+
+    @staticmethod
+    def _append(path: str, lines: List[str]):
+        """Append lines to a file shared with the other workers."""
+        with _file_lock(path + ".lock"):
+            with open(path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+
+    def _spill(self, rows: List[Row]):
+        """Append messages to the spill file."""
+        self._spilled_sessions.update(row[1] for row in rows)
+        try:
+            self._append(self.spill_path, [_to_json(row) + "\n" for row in rows])
+            self._counters["spilled"] += len(rows)
+        except OSError as e:
+            self._counters["dropped"] += len(rows)
+            logger.error(f"Transcript spill failed, {len(rows)} messages lost: {e}")
+
+    def _dead_letter(self, rows: List[Row], error: Exception):
+        """Set aside messages the database rejected, with the reason."""
+        reason = f"{type(error).__name__}: {error}"[:500]
+        logger.error(f"Transcript message {rows[0][0]} rejected, moved to {self.dead_letter_path}: {reason}")
+        try:
+            self._append(
+                self.dead_letter_path,
+                [dumps({"error": reason, "row": loads(_to_json(row))}) + "\n" for row in rows]
+            )
+            self._counters["dead_lettered"] += len(rows)
+        except (OSError, TypeError, ValueError) as e:
+            self._counters["dropped"] += len(rows)
+            logger.error(f"Transcript dead letter failed, {len(rows)} messages lost: {e}")
+
+    async def _replay(self) -> int:
+        """
+        Write spilled messages back; each file is removed once it is in.
+
+        Rejected rows are dead-lettered, so a file only stays behind while
+        the database is unavailable (its rows are rewritten idempotently).
+        Only one worker replays at a time; the others skip the replay.
+        """
+        with _file_lock(self.spill_path + ".replay.lock", blocking=False) as owner:
+            if not owner:
+                return 0
+            return await self._replay_files()
+
+    async def _replay_files(self) -> int:
+        replay_path = self.spill_path + ".replay"
+        replayed = 0
+        while True:
+            if not os.path.exists(replay_path):
+                # Taken under the append lock: no worker is mid-append, and
+                # new spills go to a fresh file while this one is replayed
+                with _file_lock(self.spill_path + ".lock"):
+                    if not os.path.exists(self.spill_path):
+                        return replayed
+                    os.replace(self.spill_path, replay_path)
+
+            rows = []
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        rows.append(_from_json(line))
+                    except ValueError:
+                        # A line cut short by a crash mid-append
+                        logger.warning(f"Skipping unreadable spilled transcript line: {line[:80]!r}")
+            written = 0
+            for start in range(0, len(rows), self.batch_size):
+                written += await self._write_batch(rows[start:start + self.batch_size])
+
+            os.remove(replay_path)
+            replayed += written
+            self._counters["replayed"] += written
+            logger.info(f"Replayed {written} of {len(rows)} spilled transcript messages")
+
+    async def replay_dead_letters(self) -> Dict[str, int]:
+        """
+        Write dead-lettered messages back, e.g. once a missing partition exists.
+
+        Rows the database still refuses are dead-lettered again, into a fresh
+        file. If the database is unavailable the file is kept and the next
+        call resumes it.
+
+        Returns:
+            Dict with the number of messages read and written
+        """
+        replay_path = self.dead_letter_path + ".replay"
+        with _file_lock(self.dead_letter_path + ".replay.lock"):
+            if not os.path.exists(replay_path):
+                with _file_lock(self.dead_letter_path + ".lock"):
+                    if not os.path.exists(self.dead_letter_path):
+                        return {"read": 0, "written": 0}
+                    os.replace(self.dead_letter_path, replay_path)
+
+            rows = []
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        rows.append(_from_values(loads(line)["row"]))
+                    except (ValueError, TypeError, KeyError):
+                        logger.warning(f"Skipping unreadable dead-lettered transcript line: {line[:80]!r}")
+            written = 0
+            for start in range(0, len(rows), self.batch_size):
+                written += await self._write_batch(rows[start:start + self.batch_size])
+
+            os.remove(replay_path)
+            logger.info(f"Replayed {written} of {len(rows)} dead-lettered transcript messages")
+            return {"read": len(rows), "written": written}
+
+    def _record_failure(self, error: Exception):
+        self._failed = True
+        self._counters["failures"] += 1
+        self._last_error = str(error)[:200]
+        logger.warning(f"Transcript flush failed, spilling to {self.spill_path}: {error}")
+
+    async def _run(self):
+        while True:
+            if self._failed:
+                # Database down: let the buffer fill (and spill) between retries
+                await asyncio.sleep(TRANSCRIPT_RETRY_INTERVAL)
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            if self._buffer or os.path.exists(self.spill_path) or os.path.exists(self.spill_path + ".replay"):
+                # Shielded so stop() never cancels a batch halfway; it waits on the lock instead
+                await asyncio.shield(self.flush())
+
+    def start(self):
+        """Start the background flusher."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flusher and drain the buffer."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Buffer and flush counters."""
+        spill_bytes = sum(
+            os.path.getsize(path)
+            for path in (self.spill_path, self.spill_path + ".replay")
+            if os.path.exists(path)
+        )
+        return {
+            "enabled": self.enabled,
+            "buffered": len(self._buffer),
+            "spill_bytes": spill_bytes,
+            "last_error": self._last_error,
+            **self._counters
+        }
+
+
+# Global writer instance
+_transcript_writer: Optional[TranscriptWriter] = None
+
+
+def get_transcript_writer() -> TranscriptWriter:
+    """Get or create the transcript writer instance."""
+    global _transcript_writer
+    if _transcript_writer is None:
+        _transcript_writer = TranscriptWriter()
+    return _transcript_writer
+
+
+async def _main(args: argparse.Namespace):
+    from database import close_database_pool
+    try:
+        result = await get_transcript_writer().replay_dead_letters()
+    finally:
+        await close_database_pool()
+    print(f"Dead-lettered messages replayed: {result['written']} of {result['read']}")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Maintain the chat transcript spill and dead-letter files")
+    parser.add_argument(
+        "--replay-dead-letters", action="store_true", required=True,
+        help=f"Write the rows in {TRANSCRIPT_DEAD_LETTER_PATH} back to chat_messages"
+    )
+    asyncio.run(_main(parser.parse_args()))
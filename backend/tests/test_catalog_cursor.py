@@ -0,0 +1,36 @@
+"""Tests for catalog listing cursors."""
+
+import base64
+
+import pytest
+
+from services.catalog import decode_cursor, encode_cursor
+
+
+def b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def test_round_trip():
+    doc = {"_createdAt": "2024-05-01T10:00:00Z", "_id": "product-1"}
+    assert decode_cursor(encode_cursor(doc)) == ("2024-05-01T10:00:00Z", "product-1")
+
+
+def test_missing_fields_encode_as_empty_strings():
+    assert decode_cursor(encode_cursor({})) == ("", "")
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64!",
+    b64(b"not json"),
+    b64(b'{"a": 1}'),
+    b64(b'["only one"]'),
+    b64(b'["a", "b", "c"]'),
+    b64(b'[1, "product-1"]'),
+    b64(b'["2024-05-01", null]'),
+    b64(b"\xff\xfe"),
+])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
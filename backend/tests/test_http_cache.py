@@ -0,0 +1,64 @@
+"""Tests for ETag validation and content coding negotiation."""
+
+import pytest
+
+from services import http_cache
+from services.http_cache import _encoded_etag, choose_encoding, etag_matches, strong_etag
+
+ETAG = strong_etag("v1")
+
+
+@pytest.mark.parametrize("header", [
+    ETAG,
+    f"W/{ETAG}",
+    "*",
+    f'"other", {ETAG}',
+    f"  {ETAG}  ",
+    _encoded_etag(ETAG, "gzip"),
+    _encoded_etag(ETAG, "br"),
+    f"W/{_encoded_etag(ETAG, 'gzip')}",
+])
+def test_etag_matches(header):
+    assert etag_matches(header, ETAG)
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    '"other"',
+    strong_etag("v2"),
+    ETAG[:-1],
+    f'"other", {strong_etag("v2")}',
+])
+def test_etag_does_not_match(header):
+    assert not etag_matches(header, ETAG)
+
+
+@pytest.fixture
+def brotli(monkeypatch):
+    monkeypatch.setattr(http_cache, "BROTLI_AVAILABLE", True)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("BR", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("gzip;q=0.5", "gzip"),
+    ("gzip;q=bogus", None),
+    ("*", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("br;q=0, *", "gzip"),
+])
+def test_choose_encoding(brotli, header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_choose_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(http_cache, "BROTLI_AVAILABLE", False)
+    assert choose_encoding("br, gzip") == "gzip"
+    assert choose_encoding("br") is None
@@ -0,0 +1,201 @@
+"""Tests for the transcript writer's error handling."""
+
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+
+import asyncpg
+import pytest
+
+import database
+from services import transcript_writer
+from services.transcript_writer import TranscriptWriter, _is_rejected_row
+
+
+@pytest.mark.parametrize("error", [
+    asyncpg.DataError("bad value"),
+    asyncpg.CharacterNotInRepertoireError("invalid byte sequence for encoding \"UTF8\": 0x00"),
+    asyncpg.IntegrityConstraintViolationError("constraint"),
+    asyncpg.ForeignKeyViolationError("fk"),
+    asyncpg.CheckViolationError('no partition of relation "chat_messages" found for row'),
+    TypeError("client-side encoding"),
+])
+def test_rejected_row_errors(error):
+    assert _is_rejected_row(error)
+
+
+@pytest.mark.parametrize("error", [
+    OSError("connection refused"),
+    asyncio.TimeoutError(),
+    asyncpg.InterfaceError("pool is closing"),
+    asyncpg.CannotConnectNowError("starting up"),
+    asyncpg.TooManyConnectionsError("too many clients"),
+    asyncpg.AdminShutdownError("terminating"),
+    asyncpg.QueryCanceledError("statement timeout"),
+    asyncpg.DeadlockDetectedError("deadlock"),
+    asyncpg.UndefinedColumnError("column does not exist"),
+    asyncpg.UndefinedTableError("relation does not exist"),
+])
+def test_retryable_errors(error):
+    assert not _is_rejected_row(error)
+
+
+class FakeWrite:
+    """Stands in for TranscriptWriter._write, failing as configured."""
+
+    def __init__(self):
+        self.written = []
+        self.error = None
+        self.reject = None
+        self.failures_left = 0
+
+    async def __call__(self, rows):
+        if self.failures_left:
+            self.failures_left -= 1
+            raise self.error
+        if self.reject and any(self.reject in row[3] for row in rows):
+            raise asyncpg.CheckViolationError("no partition of relation found for row")
+        self.written.extend(row[3] for row in rows)
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcript_writer, "TRANSCRIPT_DEADLOCK_RETRIES", 2)
+    writer = TranscriptWriter(
+        batch_size=10,
+        spill_path=str(tmp_path / "spill.jsonl"),
+        dead_letter_path=str(tmp_path / "dead.jsonl")
+    )
+    writer._write = FakeWrite()
+    return writer
+
+
+def lines(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+@pytest.mark.parametrize("error", [
+    asyncpg.TooManyConnectionsError("too many clients"),
+    asyncpg.UndefinedColumnError("column does not exist"),
+    OSError("connection refused"),
+])
+def test_unavailable_database_spills_batch(writer, error):
+    writer._write.error, writer._write.failures_left = error, 1
+    session_id = str(uuid.uuid4())
+    writer.enqueue(session_id, "user", "one")
+    writer.enqueue(session_id, "assistant", "two")
+
+    assert asyncio.run(writer.flush()) == 0
+    assert [row[3] for row in lines(writer.spill_path)] == ["one", "two"]
+    assert lines(writer.dead_letter_path) == []
+    assert writer.has_spilled(session_id)
+
+    # The next flush replays the spill file
+    assert asyncio.run(writer.flush()) == 2
+    assert writer._write.written == ["one", "two"]
+    assert not writer.has_spilled(session_id)
+
+
+def test_rejected_rows_are_dead_lettered(writer):
+    writer._write.reject = "BAD"
+    session_id = str(uuid.uuid4())
+    for content in ("one", "BAD", "three"):
+        writer.enqueue(session_id, "user", content)
+
+    assert asyncio.run(writer.flush()) == 2
+    assert writer._write.written == ["one", "three"]
+    dead = lines(writer.dead_letter_path)
+    assert [entry["row"][3] for entry in dead] == ["BAD"]
+    assert dead[0]["error"].startswith("CheckViolationError")
+    assert lines(writer.spill_path) == []
+
+
+def test_deadlock_is_retried(writer):
+    writer._write.error, writer._write.failures_left = asyncpg.DeadlockDetectedError("deadlock"), 2
+    writer.enqueue(str(uuid.uuid4()), "user", "one")
+
+    assert asyncio.run(writer.flush()) == 1
+    assert lines(writer.spill_path) == []
+
+
+def test_persistent_deadlock_spills(writer):
+    writer._write.error, writer._write.failures_left = asyncpg.DeadlockDetectedError("deadlock"), 3
+    writer.enqueue(str(uuid.uuid4()), "user", "one")
+
+    assert asyncio.run(writer.flush()) == 0
+    assert [row[3] for row in lines(writer.spill_path)] == ["one"]
+    assert lines(writer.dead_letter_path) == []
+
+
+def test_replay_dead_letters(writer):
+    writer._write.reject = "BAD"
+    session_id = str(uuid.uuid4())
+    writer.enqueue(session_id, "user", "BAD")
+    writer.enqueue(session_id, "user", "BAD again")
+    asyncio.run(writer.flush())
+    assert len(lines(writer.dead_letter_path)) == 2
+
+    # Still unavailable: the file is kept for the next replay
+    writer._write.reject = None
+    writer._write.error, writer._write.failures_left = OSError("connection refused"), 1
+    with pytest.raises(OSError):
+        asyncio.run(writer.replay_dead_letters())
+
+    # Fixed for one row only: the other is dead-lettered again
+    writer._write.reject = "again"
+    assert asyncio.run(writer.replay_dead_letters()) == {"read": 2, "written": 1}
+    assert writer._write.written == ["BAD"]
+    assert [entry["row"][3] for entry in lines(writer.dead_letter_path)] == ["BAD again"]
+
+    writer._write.reject = None
+    assert asyncio.run(writer.replay_dead_letters()) == {"read": 1, "written": 1}
+    assert asyncio.run(writer.replay_dead_letters()) == {"read": 0, "written": 0}
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query, *args):
+        self.executed.append((query, args))
+
+    async def copy_records_to_table(self, table, records, columns):
+        pass
+
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def test_sessions_are_touched_in_id_order(tmp_path, monkeypatch):
+    pool = FakePool()
+
+    async def get_pool():
+        return pool
+
+    monkeypatch.setattr(database, "get_database_pool", get_pool)
+    writer = TranscriptWriter(spill_path=str(tmp_path / "spill.jsonl"))
+    sessions = [str(uuid.uuid4()) for _ in range(20)]
+    for session_id in sessions:
+        writer.enqueue(session_id, "user", "hello", page_context=f"/{session_id}")
+
+    assert asyncio.run(writer.flush()) == 20
+    query, (ids, pages, first_seen) = pool.conn.executed[0]
+    assert query == transcript_writer._TOUCH_SESSIONS
+    assert ids == sorted(uuid.UUID(s) for s in sessions)
+    assert pages == [f"/{s}" for s in ids]
+    assert len(first_seen) == 20
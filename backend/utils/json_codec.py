@@ -0,0 +1,57 @@
+"""
+JSON encoding shared by the database codecs, the MCP servers and the API.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Both encoders accept datetimes, dates and UUIDs, so values read
+from Postgres can be serialized as they are.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Union
+from uuid import UUID
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumpb(value: Any, indent: bool = False) -> bytes:
+    """Encode a value as UTF-8 JSON bytes."""
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(value, default=_default, option=option)
+    return dumps(value, indent).encode()
+
+
+def dumps(value: Any, indent: bool = False) -> str:
+    """Encode a value as a JSON string."""
+    if ORJSON_AVAILABLE:
+        return dumpb(value, indent).decode()
+    if indent:
+        return json.dumps(value, default=_default, indent=2, ensure_ascii=False)
+    return json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """Decode JSON text or bytes."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)